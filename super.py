@@ -1,11 +1,9 @@
 # Imports
-import superpy.args as args
-import superpy.config as config
-import superpy.inventory as inventory
-import superpy.report as report
-import superpy.current_date as current_date
-import superpy.validate as validate
-import superpy.convert as convert
+import sys
+
+# The superpy modules are imported by the functions that use them, so a
+# command that is forwarded to a running server (see main) loads only
+# superpy.server.
 
 
 # Do not change these lines.
@@ -20,6 +18,8 @@ CONFIG_FILE = "config.json"
 
 
 def date(args):
+    import superpy.current_date as current_date
+    import superpy.validate as validate
     if args.get_date:
         print(f'The current super.py date is "{current_date.get()}"')
     elif args.set_date:
@@ -33,6 +33,7 @@ def date(args):
 
 
 def buy(args):
+    import superpy.inventory as inventory
     if inventory.buy(product_name=args.product_name,
                      price=args.price,
                      quantity=args.quantity,
@@ -43,6 +44,7 @@ def buy(args):
 
 
 def sell(args):
+    import superpy.inventory as inventory
     if inventory.sell(product_name=args.product_name,
                       price=args.price,
                       quantity=args.quantity):
@@ -51,11 +53,54 @@ def sell(args):
         print('NOK')
 
 
+def create_range_report(args, product_name):
+    import superpy.inventory as inventory
+    import superpy.report as report
+    import superpy.validate as validate
+    import superpy.convert as convert
+    start_date = ''
+    end_date = ''
+    if args.from_date != None:
+        start_date = args.from_date[0]
+    if args.to_date != None:
+        end_date = args.to_date[0]
+    for report_date in [start_date, end_date]:
+        if report_date != '' and not validate.date_format(report_date):
+            return
+    start_text = convert.date_str_to_text(start_date) if start_date != '' else 'the beginning'
+    end_text = convert.date_str_to_text(end_date) if end_date != '' else 'the end'
+    report_type = args.report_type[0]
+    if report_type == 'sold':
+        products, quantity = inventory.get_sold_products_in_range(product_name=product_name,
+                                                                  start_date=start_date,
+                                                                  end_date=end_date)
+        report.product_table(products)
+        if args.export_report != None and len(products) > 0:
+            inventory.export_products_to_file(file=args.export_report[0],
+                                              products=products)
+    elif report_type in ['revenue', 'profit', 'cost']:
+        totals = inventory.get_product_totals(product_name=product_name,
+                                              start_date=start_date,
+                                              end_date=end_date)
+        report_message = {'revenue': 'Revenue', 'profit': 'Profit', 'cost': 'Costs'}[report_type]
+        print(f'{report_message} from {start_text} until {end_text}: {totals[report_type]}')
+    else:
+        print(f'ERROR: The "{report_type}" report does not support a date range.')
+
+
 def create_report(args):
+    import superpy.inventory as inventory
+    import superpy.report as report
+    import superpy.current_date as current_date
+    import superpy.validate as validate
+    import superpy.convert as convert
     report_date = ''
     product_name = ''
     if args.product_name != None:
         product_name = args.product_name[0]
+    if args.from_date != None or args.to_date != None:
+        create_range_report(args, product_name)
+        return
     if args.today:
         report_date = current_date.today()
         revenue_message = "Today's revenue so far: "
@@ -67,6 +112,7 @@ def create_report(args):
         profit_message = "Today's profit so far: "
         cost_message = "Today's costs so far: "
     elif args.yesterday:
+        started_memory_clock = current_date.start_memory_clock()
         report_date = current_date.advance(days=-1)
         revenue_message = "Yesterday's revenue: "
         profit_message = "Yesterday's profit: "
@@ -110,9 +156,13 @@ def create_report(args):
                                                   products=products)
     if args.yesterday:
         report_date = current_date.advance(days=1)
+        if started_memory_clock:
+            current_date.commit()
 
 
 def create_chart(args):
+    import superpy.inventory as inventory
+    import superpy.report as report
     chart_date = ''
     product_name = ''
     chart_types = []
@@ -144,22 +194,58 @@ def create_chart(args):
 
 
 def inventory_import(file):
+    import superpy.inventory as inventory
     if not inventory.import_products_from_file(file):
         print('ERROR: Import failed.')
 
 
 def inventory_export(file):
+    import superpy.inventory as inventory
     if inventory.export_products_to_file(file):
         print('OK')
     print('ERROR: Export failed.')
 
 
+def inventory_rebuild(args):
+    import superpy.inventory as inventory
+    if args.rebuild:
+        if inventory.rebuild():
+            print('OK')
+        else:
+            print('ERROR: Rebuild failed.')
+
+
+def run_batch(args):
+    import superpy.batch as batch
+    batch.run(batch_file=args.batch_file[0],
+              flush_every=args.flush_every)
+
+
+def manage_server(args):
+    import superpy.server as server
+    if args.start:
+        server.serve()
+    elif args.stop:
+        server.stop()
+
+
 def main():
+    import superpy.server as server
+    socket_file = server.read_socket_file(CONFIG_FILE)
+    output = None if socket_file is None else server.forward(sys.argv[1:], socket_file)
+    if output is not None:
+        print(output, end='')
+        return
+    import superpy.config as config
+    if not config.init_config(CONFIG_FILE):
+        print("ERROR: No valid config found.")
+        return
+    import superpy.args as args
     args.parse()
 
 
 if __name__ == "__main__":
-    if (config.init_config(CONFIG_FILE)):
-        main()
-    else:
-        print("ERROR: No valid config found.")
+    # args.py imports the command functions from this file, without this
+    # line the file would be executed a second time as the 'super' module.
+    sys.modules.setdefault('super', sys.modules['__main__'])
+    main()
@@ -1,10 +1,17 @@
 import sys
 import argparse
+from functools import lru_cache
 
-from super import date, buy, sell, create_report, inventory_import, inventory_export, create_chart
+from super import date, buy, sell, create_report, inventory_import, inventory_export, inventory_rebuild, create_chart, run_batch, manage_server
 
 
-def parse():
+@lru_cache(maxsize=1)
+def get_parser():
+    '''
+    Functie voor het opbouwen van de parser voor de commandline argumenten.
+    De parser wordt eenmalig opgebouwd, zodat een batch of de server deze
+    voor ieder commando opnieuw kan gebruiken.
+    '''
     parent_parser = argparse.ArgumentParser(description="SuperPy Inventory Manager", add_help=True)
     
     subparsers = parent_parser.add_subparsers(title="SuperPy Inventory Manager")
@@ -114,6 +121,16 @@ def parse():
                               nargs=1,
                               type=str,
                               help='create a report of all products on a specific date, input: "YYYY-MM-dd", "YYYY-MM" or "YYYY"')
+    report_parser.add_argument('--from',
+                               dest='from_date',
+                               nargs=1,
+                               type=str,
+                               help='create a report from a specific date (inclusive), input: "YYYY-MM-dd", "YYYY-MM" or "YYYY". Supported for profit, revenue, cost and sold reports.')
+    report_parser.add_argument('--to',
+                               dest='to_date',
+                               nargs=1,
+                               type=str,
+                               help='create a report until a specific date (inclusive), input: "YYYY-MM-dd", "YYYY-MM" or "YYYY". Supported for profit, revenue, cost and sold reports.')
     report_parser.set_defaults(func=create_report)
     
     chart_parser = subparsers.add_parser("chart", help="Create a chart.")
@@ -152,8 +169,44 @@ def parse():
                                type=inventory_export,
                                dest='file',
                                help='Specify a file to export bought products to [csv, json, xml]')
+    inventory_group.add_argument('--rebuild',
+                               action='store_true',
+                               help='Rebuild the indexes, the inventory snapshot and the daily totals from the bought and sold files.')
+    inventory_parser.set_defaults(func=inventory_rebuild)
     
-    parent_args = parent_parser.parse_args()
+    batch_parser = subparsers.add_parser("batch", help="Run many commands from a file in one process.")
+    batch_parser.add_argument(dest='batch_file',
+                              help='The file with one command per line (e.g. "buy -pn apple -p 0.5 -ed 2024-04-01") or one json list of arguments per line. Use "-" to read from stdin.',
+                              nargs=1,
+                              type=str)
+    batch_parser.add_argument('-n',
+                              '--flush-every',
+                              dest='flush_every',
+                              help='Write the current date, indexes, inventory snapshot and daily totals after this number of commands, by default only at the end of the batch.',
+                              type=int,
+                              default=0)
+    batch_parser.set_defaults(func=run_batch)
+    
+    server_parser = subparsers.add_parser("server", help="Run SuperPy as a background server.")
+    server_group = server_parser.add_mutually_exclusive_group(required=True)
+    server_group.add_argument('--start',
+                              action='store_true',
+                              help='Start the server, other super.py commands are forwarded to the server while it is running.')
+    server_group.add_argument('--stop',
+                              action='store_true',
+                              help='Stop the running server.')
+    server_parser.set_defaults(func=manage_server)
+    
+    return parent_parser
+
+
+def parse(argv: list=None):
+    '''
+    Functie voor het uitlezen en uitvoeren van de commandline argumenten.
+        argv = de argumenten, indien None worden de argumenten van de commandline (sys.argv) gebruikt.
+    '''
+    parent_parser = get_parser()
+    parent_args = parent_parser.parse_args(argv)
     
     if len(vars(parent_args)) > 0:
         if 'func' in vars(parent_args): 
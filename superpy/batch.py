@@ -0,0 +1,144 @@
+import sys
+import json
+import shlex
+from itertools import islice
+
+import superpy.io as io
+import superpy.storage as storage
+import superpy.current_date as current_date
+
+
+# Commando's die niet vanuit een batch uitgevoerd kunnen worden.
+EXCLUDED_COMMANDS = ['batch', 'server']
+
+# Het maximale aantal commando's dat in een enkele transactie wordt uitgevoerd.
+# Bij de csv opslag houdt een transactie het slot van de kassa's vast (zie
+# CsvStorage.transaction), andere kassa's wachten dus hooguit zolang.
+BATCH_TRANSACTION_SIZE = 100
+
+
+def parse_line(line: str):
+    '''
+    Functie voor het omzetten van een regel naar de argumenten van een commando.
+    Een regel bevat een commando zoals op de commandline, bijvoorbeeld
+    'buy -pn apple -p 0.5 -ed 2024-04-01', of een json list met de argumenten,
+    bijvoorbeeld '["sell", "-pn", "apple", "-p", "1.0"]'.
+        line = de regel
+    Geeft een list met argumenten terug, of een lege list bij een lege regel of
+    een regel die met '#' begint. Geeft een ValueError bij een ongeldige regel.
+    '''
+    line = line.strip()
+    if line == '' or line.startswith('#'):
+        return []
+    if line.startswith('['):
+        return [str(arg) for arg in json.loads(line)]
+    return shlex.split(line)
+
+
+def run_line(line_number: int, line: str):
+    '''
+    Functie voor het uitvoeren van het commando op een regel.
+        line_number = het regelnummer, voor de foutmeldingen
+        line = de regel, zie parse_line
+    Geeft None terug bij een lege regel, True indien het commando is uitgevoerd
+    en False bij een ongeldig commando.
+    '''
+    import superpy.args as args
+    try:
+        argv = parse_line(line)
+    except ValueError as e:
+        print(f'ERROR: Line {line_number}: {e}')
+        return False
+    if len(argv) == 0:
+        return None
+    if argv[0] in EXCLUDED_COMMANDS:
+        print(f'ERROR: Line {line_number}: The "{argv[0]}" command is not supported in a batch.')
+        return False
+    try:
+        args.parse(argv)
+    except SystemExit:
+        print(f'ERROR: Line {line_number}: Invalid command.')
+        return False
+    return True
+
+
+def flush(stop: bool=False):
+    '''
+    Functie voor het wegschrijven van de huidige datum en de uitgestelde
+    json bestanden (zie io.defer_json_writes).
+        stop = indien True wordt hierna weer direct weggeschreven.
+    '''
+    current_date.commit()
+    result = io.flush_json_writes(stop=stop)
+    if not stop:
+        current_date.start_memory_clock()
+    return result
+
+
+def run_lines(lines, flush_every: int=0):
+    '''
+    Functie voor het in een enkel proces uitvoeren van de commando's uit een
+    iterable met regels. De gekochte en verkochte producten worden direct aan
+    de csv bestanden toegevoegd, de huidige datum en de indexen, voorraadstand
+    en dagtotalen worden in het geheugen bijgehouden en pas weggeschreven na
+    flush_every commando's en aan het einde van de batch.
+    De commando's worden per BATCH_TRANSACTION_SIZE (of per flush_every indien
+    dat kleiner is) in een transactie uitgevoerd. Bij de csv opslag wordt het
+    slot tussen de transacties vrijgegeven, zodat andere kassa's niet op de
+    gehele batch wachten, en wordt het logbestand per transactie naar schijf
+    geschreven. Bij de sqlite opslag is iedere transactie een enkele database transactie.
+        lines = de regels, zie parse_line
+        flush_every = het aantal commando's waarna de wijzigingen worden
+            weggeschreven, indien 0 alleen aan het einde van de batch.
+    Geeft True terug indien alle commando's zijn uitgevoerd.
+    '''
+    numbered_lines = enumerate(lines, start=1)
+    chunk_size = BATCH_TRANSACTION_SIZE
+    if flush_every > 0:
+        chunk_size = min(flush_every, BATCH_TRANSACTION_SIZE)
+    executed = 0
+    failed = 0
+    unflushed = 0
+    io.defer_json_writes()
+    current_date.start_memory_clock()
+    try:
+        while True:
+            # De regels worden voor de transactie gelezen, zodat het slot
+            # niet wordt vastgehouden terwijl er op stdin gewacht wordt.
+            chunk = list(islice(numbered_lines, chunk_size))
+            with storage.get().transaction():
+                for line_number, line in chunk:
+                    result = run_line(line_number, line)
+                    if result is True:
+                        executed += 1
+                    elif result is False:
+                        failed += 1
+            if len(chunk) < chunk_size:
+                break
+            unflushed += len(chunk)
+            if flush_every > 0 and unflushed >= flush_every:
+                flush()
+                unflushed = 0
+    finally:
+        flush(stop=True)
+    print(f'Batch finished: {executed} commands executed, {failed} failed.')
+    return failed == 0
+
+
+def run(batch_file: str, flush_every: int=0):
+    '''
+    Functie voor het uitvoeren van de commando's uit een bestand, zie run_lines.
+        batch_file = het bestand met een commando per regel, of '-' om de
+            commando's van stdin te lezen.
+        flush_every = het aantal commando's waarna de wijzigingen worden weggeschreven.
+    '''
+    if batch_file == '-':
+        return run_lines(sys.stdin, flush_every)
+    try:
+        lines = open(batch_file, 'r')
+    except OSError as e:
+        print(f"ERROR: Unable to read commands from '{batch_file}'.")
+        print(e)
+        return False
+    with lines:
+        return run_lines(lines, flush_every)
@@ -0,0 +1,240 @@
+import os
+import calendar
+
+import numpy as np
+
+import superpy.config as config
+import superpy.io as io
+import superpy.dates as dates
+
+
+TABLE_VERSION = 4
+
+# Per csv bestand de kolommen en het type waarin deze worden opgeslagen.
+# Een 'name' kolom wordt opgeslagen als id in de namenlijst van de tabel
+# en een 'date' kolom als dagnummer (zie datetime.toordinal).
+TABLE_COLUMNS = {
+    "bought": {"id": "int64",
+               "name": "name",
+               "buy_price": "float64",
+               "quantity": "int64",
+               "buy_date": "date",
+               "expiration_date": "date"},
+    "sold": {"id": "int64",
+             "name": "name",
+             "sell_price": "float64",
+             "quantity": "int64",
+             "sell_date": "date"}
+}
+
+# De kolommen worden als little-endian bytes opgeslagen, zodat de bestanden
+# op ieder platform op dezelfde manier gelezen worden.
+COLUMN_DTYPES = {"int64": np.dtype('<i8'), "float64": np.dtype('<f8'), "name": np.dtype('<i4'), "date": np.dtype('<i4')}
+
+
+def get_table_dir(ledger: str):
+    '''
+    Functie voor het bepalen van de map met de kolommen van een csv bestand.
+        ledger = 'bought' of 'sold'
+    '''
+    return f'{config.data["files"][ledger]}.columns'
+
+
+def get_column_file(table_dir: str, column: str):
+    '''
+    Functie voor het bepalen van het bestand van een kolom. Het bestand bevat
+    alleen de waardes achter elkaar, zonder header, zodat nieuwe regels
+    aan het einde toegevoegd kunnen worden.
+    '''
+    return os.path.join(table_dir, f'{column}.bin')
+
+
+def create_table():
+    '''
+    Functie voor het aanmaken van een lege tabel.
+        marker = het kenmerk van het csv bestand, zie io.get_csv_marker.
+        rows = het aantal regels in de kolommen.
+        names = de productnamen, de positie in de list is de id van de naam.
+    '''
+    return {"version": TABLE_VERSION,
+            "marker": {"size": 0, "check": ""},
+            "rows": 0,
+            "names": []}
+
+
+def encode_products(table: dict, ledger: str, products):
+    '''
+    Functie voor het omzetten van producten naar een numpy array per kolom.
+    Nieuwe productnamen worden aan de namenlijst van de tabel toegevoegd.
+        table = de tabel
+        ledger = 'bought' of 'sold'
+        products = een iterable met producten zoals deze uit het csv bestand gelezen worden
+    '''
+    columns = TABLE_COLUMNS[ledger]
+    values = {column: [] for column in columns}
+    name_ids = {name: name_id for name_id, name in enumerate(table["names"])}
+    for product in products:
+        for column, column_type in columns.items():
+            value = product[column]
+            if column_type == "name":
+                if value not in name_ids:
+                    name_ids[value] = len(table["names"])
+                    table["names"].append(value)
+                value = name_ids[value]
+            elif column_type == "date":
+                value = dates.get_ordinal(value)
+            elif column_type == "float64":
+                value = float(value)
+            else:
+                value = int(value)
+            values[column].append(value)
+    return {column: np.array(values[column], dtype=COLUMN_DTYPES[column_type])
+            for column, column_type in columns.items()}
+
+
+def update_table(ledger: str, table: dict):
+    '''
+    Functie voor het toevoegen van de regels die sinds de laatste update aan het
+    csv bestand zijn toegevoegd. De nieuwe waardes worden aan het einde van de
+    kolombestanden toegevoegd, de bestaande waardes worden niet opnieuw gelezen
+    of geschreven. Het tabelbestand met het aantal regels wordt als laatste
+    vervangen, zodat kolommen die na een onderbreking langer zijn dan de tabel
+    bij de volgende update eerst worden ingekort.
+        ledger = 'bought' of 'sold'
+        table = de tabel
+    '''
+    csv_file = config.data["files"][ledger]
+    table_dir = get_table_dir(ledger)
+    file_size = os.path.getsize(csv_file)
+    new_products = (product for offset, product in io.iter_csv_offsets(csv_file, table["marker"]["size"], file_size))
+    new_columns = encode_products(table, ledger, new_products)
+    if (not (os.path.exists(table_dir))):
+        os.makedirs(table_dir)
+    for column, values in new_columns.items():
+        column_file = get_column_file(table_dir, column)
+        with open(column_file, 'r+b' if os.path.exists(column_file) else 'wb') as columnfile:
+            columnfile.truncate(table["rows"] * values.dtype.itemsize)
+            columnfile.seek(0, os.SEEK_END)
+            columnfile.write(values.tobytes())
+        rows = table["rows"] + len(values)
+    table["rows"] = rows
+    table["marker"] = io.get_csv_marker(csv_file, file_size)
+    return io.replace_json(table, os.path.join(table_dir, 'table.json'))
+
+
+def load(ledger: str):
+    '''
+    Functie voor het ophalen van de kolommen van een csv bestand als memory-map,
+    zodat alleen de gebruikte delen van de kolommen van schijf gelezen worden.
+    Regels die sinds de laatste keer aan het csv bestand zijn toegevoegd worden
+    eerst omgezet, indien het csv bestand is overschreven wordt de tabel opnieuw opgebouwd.
+        ledger = 'bought' of 'sold'
+    Geeft een tuple terug met de tabel en een dict met een numpy array per kolom.
+    '''
+    csv_file = config.data["files"][ledger]
+    table_dir = get_table_dir(ledger)
+    table_file = os.path.join(table_dir, 'table.json')
+    table = None
+    if os.path.exists(table_file):
+        table = io.read_json(table_file)
+    if (not isinstance(table, dict)
+        or table.get("version") != TABLE_VERSION
+        or not io.is_csv_marker_valid(csv_file, table.get("marker"))):
+        table = create_table()
+    if os.path.exists(csv_file) and os.path.getsize(csv_file) != table["marker"]["size"]:
+        update_table(ledger, table)
+    columns = {}
+    for column, column_type in TABLE_COLUMNS[ledger].items():
+        if table["rows"] > 0:
+            columns[column] = np.memmap(get_column_file(table_dir, column),
+                                        dtype=COLUMN_DTYPES[column_type],
+                                        mode='r',
+                                        shape=(table["rows"],))
+        else:
+            columns[column] = np.zeros(0, dtype=COLUMN_DTYPES[column_type])
+    return table, columns
+
+
+def rebuild(ledger: str):
+    '''
+    Functie voor het volledig opnieuw omzetten van een csv bestand naar kolommen.
+        ledger = 'bought' of 'sold'
+    '''
+    if not os.path.exists(config.data["files"][ledger]):
+        return True
+    return update_table(ledger, create_table())
+
+
+def get_date_ordinal(product_date: str, last_day: bool=False):
+    '''
+    Functie voor het omzetten van een (gedeeltelijke) datum naar een dagnummer.
+        product_date = de (gedeeltelijke) datum, bijvoorbeeld '2024' of '2024-03'
+        last_day = indien True wordt bij een gedeeltelijke datum de laatste
+            dag van het jaar of de maand gebruikt, anders de eerste dag.
+    '''
+    date_value = dates.parse(product_date)
+    if last_day and len(product_date) == 4:
+        date_value = date_value.replace(month=12, day=31)
+    elif last_day and len(product_date) == 7:
+        date_value = date_value.replace(day=calendar.monthrange(date_value.year, date_value.month)[1])
+    return date_value.toordinal()
+
+
+def get_mask(table: dict,
+             columns: dict,
+             product_name: str='',
+             date_column: str='',
+             start_date: str='',
+             end_date: str=''):
+    '''
+    Functie voor het bepalen welke regels aan de productnaam en het datumbereik voldoen.
+        start_date = de (gedeeltelijke) begindatum, indien leeg is er geen ondergrens
+        end_date = de (gedeeltelijke) einddatum, zo telt '2024-03' tot en met
+            31 maart 2024. Indien leeg is er geen bovengrens.
+    Geeft een numpy array met een boolean per regel terug.
+    '''
+    mask = np.ones(table["rows"], dtype=bool)
+    if product_name != '':
+        if product_name not in table["names"]:
+            return np.zeros(table["rows"], dtype=bool)
+        mask &= columns['name'] == table["names"].index(product_name)
+    if start_date != '':
+        mask &= columns[date_column] >= get_date_ordinal(start_date)
+    if end_date != '':
+        mask &= columns[date_column] <= get_date_ordinal(end_date, last_day=True)
+    return mask
+
+
+def get_totals(product_name: str='',
+               start_date: str='',
+               end_date: str=''):
+    '''
+    Functie voor het bepalen van de aantallen, kosten en omzet binnen een
+    datumbereik door in een keer over de kolommen te rekenen.
+    Geeft een dict terug met het totaal per kolom uit rollup.ROLLUP_COLUMNS.
+    '''
+    totals = {}
+    for ledger, date_column, price_column, quantity_column, value_column in (
+            ("bought", "buy_date", "buy_price", "bought_quantity", "cost"),
+            ("sold", "sell_date", "sell_price", "sold_quantity", "revenue")):
+        table, columns = load(ledger)
+        mask = get_mask(table,
+                        columns,
+                        product_name=product_name,
+                        date_column=date_column,
+                        start_date=start_date,
+                        end_date=end_date)
+        quantities = columns['quantity'][mask]
+        totals[quantity_column] = int(quantities.sum())
+        totals[value_column] = float(np.dot(quantities, columns[price_column][mask]))
+    return totals
+
+
+def get_sold_quantity(product_name: str=''):
+    '''
+    Functie voor het bepalen van het totaal verkochte aantal.
+        product_name = de productnaam, indien leeg wordt het totaal van alle producten bepaald
+    '''
+    table, columns = load("sold")
+    mask = get_mask(table, columns, product_name=product_name)
+    return int(columns['quantity'][mask].sum())
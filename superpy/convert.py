@@ -1,6 +1,5 @@
-import datetime
-import superpy.config as config
 import superpy.validate as validate
+import superpy.dates as dates
 
 
 def string_to_number(value:str):
@@ -20,11 +19,7 @@ def date_str_to_text(date:str):
     Functie voor het omzetten van datum notatie naar text.
     '''
     if validate.date_format(date):
-        date_parts = len(date.split("-"))
-        date_format = config.data["date_format"]
-        date_format_parts = date_format.split("-")
-        date_format = "-".join(date_format_parts[0:date_parts])
-        dt = datetime.datetime.strptime(date, date_format)
+        dt = dates.parse(date)
         if len(date) == 7:
             date_format = "%B %Y"
         elif len(date) == 4:
@@ -40,9 +35,5 @@ def date_str_to_datetime(date:str):
     Functie voor het omzetten van datum notatie naar datetime object.
     '''
     if validate.date_format(date):
-        date_parts = len(date.split("-"))
-        date_format = config.data["date_format"]
-        date_format_parts = date_format.split("-")
-        date_format = "-".join(date_format_parts[0:date_parts])
-        return datetime.datetime.strptime(date, date_format)
+        return dates.parse(date)
     return date
\ No newline at end of file
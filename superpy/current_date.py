@@ -1,23 +1,61 @@
 from datetime import datetime
 from datetime import timedelta
 import superpy.config as config
-import superpy.io as io
+import superpy.storage as storage
+import superpy.dates as dates
 
 
 current_date_header = "current_date"
 
+# De huidige datum in het geheugen, zie start_memory_clock.
+memory_clock = {"config": None, "current_date": '', "stored_date": ''}
+
+
+def is_memory_clock():
+    '''
+    Functie voor het bepalen of de huidige datum in het geheugen wordt bijgehouden.
+    '''
+    return memory_clock["config"] is config.data
+
+
+def start_memory_clock():
+    '''
+    Functie voor het bijhouden van de huidige datum in het geheugen, bijvoorbeeld
+    voor simulaties. Een nieuwe datum wordt pas in de opslag bewaard bij commit.
+    Geeft True terug indien het bijhouden in het geheugen door deze aanroep is
+    gestart, of False indien de datum al in het geheugen werd bijgehouden.
+    '''
+    if is_memory_clock():
+        return False
+    current_date = get()
+    memory_clock.update(config=config.data,
+                        current_date=current_date,
+                        stored_date=current_date)
+    return True
+
+
+def commit():
+    '''
+    Functie voor het bewaren van de huidige datum uit het geheugen in de opslag
+    en het stoppen van het bijhouden van de datum in het geheugen.
+    De opslag wordt alleen beschreven indien de datum is gewijzigd.
+    '''
+    if is_memory_clock():
+        memory_clock["config"] = None
+        if memory_clock["current_date"] != memory_clock["stored_date"]:
+            set(memory_clock["current_date"])
+
 
 def get():
     '''
-    Functie voor het ophalen van de huidige datum uit het 'current_date' bestand.
+    Functie voor het ophalen van de huidige datum uit de opslag, zie storage.py.
     '''
-    current_date_file = config.data["files"]["current_date"]
-    current_date = io.read_csv(current_date_file)
-    if not current_date:
+    if is_memory_clock():
+        return memory_clock["current_date"]
+    current_date = storage.get().get_current_date()
+    if current_date == '':
         current_date = datetime.now().strftime(config.data["date_format"])
-        io.write_csv({current_date_header: current_date}, current_date_file)
-    else:
-        current_date = current_date[0]["current_date"]
+        storage.get().set_current_date(current_date)
     return current_date
 
 
@@ -26,9 +64,10 @@ def set(new_date: str):
     Functie voor het instellen van een nieuwe huidige datum.
         new_date = nieuwe datum om in te stellen
     '''
-    current_date_file = config.data["files"]["current_date"]
-    new_date_data = {current_date_header: new_date}
-    io.write_csv(new_date_data, current_date_file, append=False)
+    if is_memory_clock():
+        memory_clock["current_date"] = new_date
+        return
+    storage.get().set_current_date(new_date)
     
 
 def advance(days: int):
@@ -42,7 +81,7 @@ def advance(days: int):
         days = int(days)
         current_date = get()
         if (days != 0):
-            new_date = datetime.strptime(current_date, config.data["date_format"]) + timedelta(days=days)
+            new_date = dates.parse_date(current_date, config.data["date_format"]) + timedelta(days=days)
             formatted_new_date = new_date.strftime(config.data["date_format"])
             set(formatted_new_date)
             return formatted_new_date
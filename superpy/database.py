@@ -0,0 +1,226 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import superpy.config as config
+
+
+TABLE_COLUMNS = {
+    "bought": ['id', 'name', 'buy_price', 'quantity', 'buy_date', 'expiration_date'],
+    "sold": ['id', 'name', 'sell_price', 'quantity', 'sell_date']
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS bought (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    buy_price REAL NOT NULL,
+    quantity INTEGER NOT NULL,
+    buy_date TEXT NOT NULL,
+    expiration_date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sold (
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    sell_price REAL NOT NULL,
+    quantity INTEGER NOT NULL,
+    sell_date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "current_date" (
+    "current_date" TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bought_name ON bought (name, buy_date);
+CREATE INDEX IF NOT EXISTS bought_buy_date ON bought (buy_date);
+CREATE INDEX IF NOT EXISTS bought_expiration_date ON bought (expiration_date);
+CREATE INDEX IF NOT EXISTS sold_id ON sold (id);
+CREATE INDEX IF NOT EXISTS sold_name ON sold (name, sell_date);
+CREATE INDEX IF NOT EXISTS sold_sell_date ON sold (sell_date);
+'''
+
+# De geopende database verbinding per databasebestand.
+connections = {}
+
+
+def get_connection():
+    '''
+    Functie voor het ophalen van de verbinding met de database.
+    De database en tabellen worden aangemaakt indien deze nog niet bestaan.
+    '''
+    database_file = os.path.abspath(config.data["files"]["database"])
+    if database_file not in connections:
+        database_dir = os.path.dirname(database_file)
+        if (not (os.path.exists(database_dir))):
+            os.makedirs(database_dir)
+        connection = sqlite3.connect(database_file, isolation_level=None)
+        connection.executescript(SCHEMA)
+        connections[database_file] = connection
+    return connections[database_file]
+
+
+@contextmanager
+def transaction():
+    '''
+    Functie voor het uitvoeren van meerdere queries binnen een enkele transactie.
+    De database wordt direct voor schrijven vergrendeld, zodat bijvoorbeeld een
+    verkoop de voorraad controleert en wegschrijft zonder dat een ander proces
+    tussendoor dezelfde voorraad kan verkopen.
+    '''
+    connection = get_connection()
+    if connection.in_transaction:
+        yield connection
+        return
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield connection
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+def to_product(table: str, row: tuple):
+    '''
+    Functie voor het omzetten van een database regel naar een product
+    zoals deze ook uit de csv bestanden gelezen wordt.
+    '''
+    return dict(zip(TABLE_COLUMNS[table], (str(value) for value in row)))
+
+
+def get_date_conditions(date_column: str,
+                        start_date: str='',
+                        end_date: str=''):
+    '''
+    Functie voor het opbouwen van de voorwaarden voor een (gedeeltelijk) datumbereik.
+    Een einddatum '2024-03' omvat alle dagen van maart 2024.
+    '''
+    conditions = []
+    parameters = []
+    if start_date != '':
+        conditions.append(f'{date_column} >= ?')
+        parameters.append(start_date)
+    if end_date != '':
+        conditions.append(f'substr({date_column}, 1, ?) <= ?')
+        parameters += [len(end_date), end_date]
+    return conditions, parameters
+
+
+def iter_products(table: str,
+                  product_name: str='',
+                  date_column: str='',
+                  start_date: str='',
+                  end_date: str=''):
+    '''
+    Functie voor het ophalen van producten uit de database.
+        table = 'bought' of 'sold'
+        product_name = de productnaam, indien leeg worden alle producten opgehaald
+        date_column = de datum kolom voor het datumbereik
+        start_date = de (gedeeltelijke) begindatum, indien leeg is er geen ondergrens
+        end_date = de (gedeeltelijke) einddatum, indien leeg is er geen bovengrens
+    '''
+    conditions, parameters = get_date_conditions(date_column, start_date, end_date)
+    if product_name != '':
+        conditions.append('name = ?')
+        parameters.append(product_name)
+    query = f'SELECT {", ".join(TABLE_COLUMNS[table])} FROM {table}'
+    if len(conditions) > 0:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY rowid'
+    for row in get_connection().execute(query, parameters):
+        yield to_product(table, row)
+
+
+def append_products(table: str, products: list):
+    '''
+    Functie voor het in een enkele transactie toevoegen van producten.
+        table = 'bought' of 'sold'
+        products = een list met producten
+    '''
+    columns = TABLE_COLUMNS[table]
+    query = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+    try:
+        with transaction() as connection:
+            connection.executemany(query, ([product[column] for column in columns] for product in products))
+        return True
+    except sqlite3.Error as e:
+        print("ERROR: Unable to write data to the database.")
+        print(e)
+    return False
+
+
+def get_last_product_id():
+    '''
+    Functie voor het ophalen van de hoogste id van de gekochte producten.
+    '''
+    return get_connection().execute('SELECT COALESCE(MAX(id), 0) FROM bought').fetchone()[0]
+
+
+def iter_lots(product_name: str=''):
+    '''
+    Functie voor het ophalen van de gekochte producten met het verkochte aantal
+    per product, zie stock.iter_lots.
+        product_name = de productnaam, indien leeg worden alle producten opgehaald
+    '''
+    query = '''SELECT bought.id, bought.name, bought.buy_price, bought.quantity,
+                      bought.buy_date, bought.expiration_date,
+                      COALESCE((SELECT SUM(sold.quantity) FROM sold WHERE sold.id = bought.id), 0)
+               FROM bought'''
+    parameters = []
+    if product_name != '':
+        query += ' WHERE bought.name = ?'
+        parameters.append(product_name)
+    query += ' ORDER BY bought.id'
+    for row in get_connection().execute(query, parameters):
+        yield to_product("bought", row[:6]), row[6]
+
+
+def get_sold_quantity(product_name: str=''):
+    '''
+    Functie voor het ophalen van het totaal verkochte aantal.
+        product_name = de productnaam, indien leeg wordt het totaal van alle producten bepaald
+    '''
+    query = 'SELECT COALESCE(SUM(quantity), 0) FROM sold'
+    parameters = []
+    if product_name != '':
+        query += ' WHERE name = ?'
+        parameters.append(product_name)
+    return get_connection().execute(query, parameters).fetchone()[0]
+
+
+def get_totals(product_name: str='',
+               start_date: str='',
+               end_date: str=''):
+    '''
+    Functie voor het bepalen van de aantallen, kosten en omzet binnen een
+    datumbereik, zie rollup.get_range_totals.
+    '''
+    totals = {}
+    for table, date_column, columns in (("bought", "buy_date", ['bought_quantity', 'cost']),
+                                        ("sold", "sell_date", ['sold_quantity', 'revenue'])):
+        price_column = TABLE_COLUMNS[table][2]
+        conditions, parameters = get_date_conditions(date_column, start_date, end_date)
+        if product_name != '':
+            conditions.append('name = ?')
+            parameters.append(product_name)
+        query = f'SELECT COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity * {price_column}), 0.0) FROM {table}'
+        if len(conditions) > 0:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        totals.update(zip(columns, get_connection().execute(query, parameters).fetchone()))
+    return totals
+
+
+def get_current_date():
+    '''
+    Functie voor het ophalen van de huidige datum uit de database.
+    '''
+    row = get_connection().execute('SELECT "current_date" FROM "current_date"').fetchone()
+    return row[0] if row else ''
+
+
+def set_current_date(new_date: str):
+    '''
+    Functie voor het instellen van de huidige datum in de database.
+    '''
+    with transaction() as connection:
+        connection.execute('DELETE FROM "current_date"')
+        connection.execute('INSERT INTO "current_date" ("current_date") VALUES (?)', [new_date])
+    return True
@@ -0,0 +1,71 @@
+import datetime
+from functools import lru_cache
+
+import superpy.config as config
+
+
+ISO_DATE_FORMAT = "%Y-%m-%d"
+
+# Het maximale aantal verschillende datums dat per functie onthouden wordt.
+# Datums komen in de csv bestanden veelvuldig terug, waardoor bijna iedere
+# datum na de eerste keer direct uit het geheugen komt.
+DATE_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(date: str, date_format: str):
+    '''
+    Functie voor het omzetten van een datum naar een datetime object volgens
+    een vast datum format. Bij het ISO format wordt datetime.fromisoformat gebruikt,
+    wat vele malen sneller is dan datetime.strptime.
+        date = de datum
+        date_format = het datum format, bijvoorbeeld '%Y-%m-%d'
+    Geeft een ValueError indien de datum niet aan het format voldoet.
+    '''
+    if (date_format == ISO_DATE_FORMAT
+        and len(date) == 10
+        and date[4] == '-'
+        and date[7] == '-'):
+        return datetime.datetime.fromisoformat(date)
+    return datetime.datetime.strptime(date, date_format)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_partial_date(date: str, date_format: str):
+    '''
+    Functie voor het omzetten van een (gedeeltelijke) datum naar een datetime object,
+    waarbij alleen het deel van het format gebruikt wordt dat in de datum voorkomt.
+    Zo wordt '2024-03' met het format '%Y-%m-%d' omgezet naar 1 maart 2024.
+        date = de (gedeeltelijke) datum
+        date_format = het datum format, bijvoorbeeld '%Y-%m-%d'
+    '''
+    date_parts = len(date.split("-"))
+    return parse_date(date, "-".join(date_format.split("-")[0:date_parts]))
+
+
+def parse(date: str):
+    '''
+    Functie voor het omzetten van een (gedeeltelijke) datum volgens het datum
+    format uit de config naar een datetime object.
+        date = de (gedeeltelijke) datum
+    Geeft een ValueError indien de datum niet aan het format voldoet.
+    '''
+    return parse_partial_date(date, config.data["date_format"])
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def get_partial_date_ordinal(date: str, date_format: str):
+    '''
+    Functie voor het omzetten van een (gedeeltelijke) datum naar een dagnummer.
+    '''
+    return parse_partial_date(date, date_format).toordinal()
+
+
+def get_ordinal(date: str):
+    '''
+    Functie voor het omzetten van een (gedeeltelijke) datum volgens het datum
+    format uit de config naar een dagnummer (zie datetime.toordinal), waarmee
+    datums als getal vergeleken en van elkaar afgetrokken kunnen worden.
+        date = de (gedeeltelijke) datum
+    '''
+    return get_partial_date_ordinal(date, config.data["date_format"])
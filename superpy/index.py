@@ -0,0 +1,345 @@
+import os
+import sys
+import shutil
+import hashlib
+from array import array
+from bisect import bisect_left, bisect_right
+
+import superpy.io as io
+import superpy.locking as locking
+
+
+INDEX_VERSION = 4
+INDEX_COLUMNS = ['name', 'buy_date', 'sell_date', 'expiration_date']
+
+# Het maximale aantal tekens van de bestandsnaam van een waarde. Langere
+# waardes (zoals een zeer lange productnaam) worden onder een hash opgeslagen
+# en kunnen daardoor alleen exact worden opgezocht.
+MAX_KEY_LENGTH = 200
+
+
+def get_index_dir(csv_file: str):
+    '''
+    Functie voor het bepalen van de map met de index behorende bij een csv bestand.
+    De map bevat index.json met het kenmerk van het csv bestand en per kolom
+    uit INDEX_COLUMNS een map met per waarde een bestand met de posities van
+    de regels, zodat bij het opzoeken alleen de posities van die waarde gelezen worden.
+        csv_file = het csv bestand
+    '''
+    return f'{csv_file}.idx'
+
+
+def get_index_file(csv_file: str):
+    '''
+    Functie voor het bepalen van het bestand met het kenmerk van de index.
+        csv_file = het csv bestand
+    '''
+    return os.path.join(get_index_dir(csv_file), 'index.json')
+
+
+def get_posting_file(csv_file: str, column: str, value: str):
+    '''
+    Functie voor het bepalen van het bestand met de posities van de regels
+    met een waarde. De bestandsnaam is de waarde in hexadecimale notatie,
+    zodat iedere waarde een geldige bestandsnaam geeft.
+        csv_file = het csv bestand
+        column = de kolomnaam
+        value = de waarde
+    '''
+    key = value.encode('utf-8').hex()
+    if len(key) > MAX_KEY_LENGTH:
+        key = 'x' + hashlib.sha256(value.encode('utf-8')).hexdigest()
+    return os.path.join(get_index_dir(csv_file), column, f'{key}.bin')
+
+
+def create_index():
+    '''
+    Functie voor het aanmaken van een lege index.
+        marker = het kenmerk van het csv bestand tot waar de posities in de
+            bestanden van de index staan.
+        tail_marker = het kenmerk van het csv bestand tot waar de regels zijn gelezen.
+        tail = per kolom en per waarde de posities van de regels na marker,
+            deze worden in het geheugen bijgehouden totdat de index wordt
+            weggeschreven, zie write_index.
+    '''
+    return {"version": INDEX_VERSION,
+            "marker": {"size": 0, "check": ""},
+            "tail_marker": {"size": 0, "check": ""},
+            "tail": {}}
+
+
+def is_index_valid(csv_index, csv_file: str, marker_key: str="marker"):
+    '''
+    Functie voor het controleren of een index bij het csv bestand hoort.
+        csv_index = de index
+        csv_file = het csv bestand
+        marker_key = het kenmerk dat gecontroleerd wordt, zie create_index
+    '''
+    return (isinstance(csv_index, dict)
+            and csv_index.get("version") == INDEX_VERSION
+            and io.is_csv_marker_valid(csv_file, csv_index.get(marker_key)))
+
+
+def read_tail(csv_index: dict, csv_file: str):
+    '''
+    Functie voor het lezen van de regels die sinds de laatste update
+    aan het csv bestand zijn toegevoegd.
+        csv_index = de index van het csv bestand
+        csv_file = het csv bestand
+    Geeft het aantal verwerkte bytes terug, 0 indien er geen nieuwe regels zijn.
+    '''
+    if not os.path.exists(csv_file):
+        return 0
+    file_size = os.path.getsize(csv_file)
+    tail_size = file_size - csv_index["tail_marker"]["size"]
+    if tail_size == 0:
+        return 0
+    columns = csv_index["tail"]
+    for offset, row in io.iter_csv_offsets(csv_file, csv_index["tail_marker"]["size"], file_size):
+        for column in INDEX_COLUMNS:
+            if column in row:
+                columns.setdefault(column, {}).setdefault(row[column], []).append(offset)
+    csv_index["tail_marker"] = io.get_csv_marker(csv_file, file_size)
+    return tail_size
+
+
+def read_offsets(posting_file: str, size: int):
+    '''
+    Functie voor het lezen van de posities uit een bestand van de index.
+    De posities staan als little-endian 64 bits getallen achter elkaar.
+        posting_file = het bestand, zie get_posting_file
+        size = de grootte van het csv bestand volgens het kenmerk van de index,
+            posities vanaf deze grootte (van een onderbroken update) worden genegeerd.
+    '''
+    offsets = array('q')
+    try:
+        with open(posting_file, 'rb') as postingfile:
+            data = postingfile.read()
+    except OSError:
+        return []
+    offsets.frombytes(data[0:len(data) - len(data) % offsets.itemsize])
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    offsets = offsets.tolist()
+    return offsets[0:bisect_left(offsets, size)]
+
+
+def append_offsets(posting_file: str, offsets: list, size: int):
+    '''
+    Functie voor het toevoegen van posities aan een bestand van de index.
+    Posities vanaf size die na een onderbroken update in het bestand staan
+    worden eerst verwijderd.
+        posting_file = het bestand, zie get_posting_file
+        offsets = de nieuwe posities
+        size = de grootte van het csv bestand volgens het kenmerk van de index
+    '''
+    posting_dir = os.path.dirname(posting_file)
+    if (not (os.path.exists(posting_dir))):
+        os.makedirs(posting_dir)
+    new_offsets = array('q', offsets)
+    if sys.byteorder == 'big':
+        new_offsets.byteswap()
+    with open(posting_file, 'r+b' if os.path.exists(posting_file) else 'wb') as postingfile:
+        file_size = postingfile.seek(0, os.SEEK_END)
+        file_size -= file_size % new_offsets.itemsize
+        while file_size > 0:
+            postingfile.seek(file_size - new_offsets.itemsize)
+            if int.from_bytes(postingfile.read(new_offsets.itemsize), 'little', signed=True) < size:
+                break
+            file_size -= new_offsets.itemsize
+        postingfile.truncate(file_size)
+        postingfile.seek(file_size)
+        postingfile.write(new_offsets.tobytes())
+
+
+def remove_index(csv_file: str):
+    '''
+    Functie voor het verwijderen van de index van een csv bestand, ook een
+    index van een eerdere versie die nog in een enkel bestand stond.
+        csv_file = het csv bestand
+    '''
+    index_dir = get_index_dir(csv_file)
+    if os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+    elif os.path.exists(index_dir):
+        os.remove(index_dir)
+
+
+def write_index(csv_index: dict, csv_file: str):
+    '''
+    Functie voor het wegschrijven van de regels uit het geheugen naar de index.
+    Alleen aan de bestanden van de gelezen waardes worden posities toegevoegd,
+    index.json wordt als laatste vervangen. Is de index intussen door een ander
+    proces bijgewerkt dan wordt die index gebruikt, sluit de index niet meer
+    aan (bijvoorbeeld na het overschrijven van het csv bestand) dan wordt de
+    index opnieuw opgebouwd.
+        csv_index = de index van het csv bestand
+        csv_file = het csv bestand
+    '''
+    index_file = get_index_file(csv_file)
+    with locking.exclusive(f'{get_index_dir(csv_file)}.lock'):
+        stored_index = io.read_json(index_file) if os.path.isfile(index_file) else None
+        stored_valid = is_index_valid(stored_index, csv_file)
+        if stored_valid and stored_index["marker"]["size"] >= csv_index["tail_marker"]["size"]:
+            csv_index["marker"] = stored_index["marker"]
+            csv_index["tail_marker"] = stored_index["marker"]
+            csv_index["tail"] = {}
+            return True
+        try:
+            if (not stored_valid
+                or stored_index["marker"] != csv_index["marker"]
+                or csv_index["marker"]["size"] == 0):
+                if csv_index["marker"]["size"] != 0:
+                    csv_index.update(create_index())
+                    read_tail(csv_index, csv_file)
+                remove_index(csv_file)
+            for column, values in csv_index["tail"].items():
+                for value, offsets in values.items():
+                    append_offsets(get_posting_file(csv_file, column, value), offsets, csv_index["marker"]["size"])
+        except OSError as e:
+            print("ERROR: Unable to write data to '{}'".format(get_index_dir(csv_file)))
+            print(e)
+            return False
+        if not io.replace_json({"version": INDEX_VERSION, "marker": csv_index["tail_marker"]}, index_file):
+            return False
+    csv_index["marker"] = csv_index["tail_marker"]
+    csv_index["tail"] = {}
+    return True
+
+
+def load(csv_file: str):
+    '''
+    Functie voor het ophalen van de index van een csv bestand. Alleen
+    index.json wordt gelezen, de posities per waarde worden pas bij het
+    opzoeken gelezen. Indien het csv bestand is aangevuld worden alleen de
+    nieuwe regels gelezen, indien het bestand is overschreven wordt de index
+    opnieuw opgebouwd.
+        csv_file = het csv bestand
+    '''
+    index_file = get_index_file(csv_file)
+    csv_index, stats, cached = io.load_cached_json(index_file, [csv_file])
+    if cached:
+        return csv_index
+    if isinstance(csv_index, dict) and "tail" not in csv_index:
+        csv_index["tail_marker"] = csv_index.get("marker")
+        csv_index["tail"] = {}
+    changed = False
+    if not is_index_valid(csv_index, csv_file, "tail_marker"):
+        csv_index = create_index()
+        changed = os.path.exists(get_index_dir(csv_file))
+    tail_size = read_tail(csv_index, csv_file)
+    io.save_cached_json(index_file, stats, csv_index, changed,
+                        tail_size=tail_size,
+                        write=lambda: write_index(csv_index, csv_file))
+    return csv_index
+
+
+def update(csv_file: str):
+    '''
+    Functie voor het bijwerken van de index na het schrijven naar een csv bestand.
+        csv_file = het csv bestand
+    '''
+    load(csv_file)
+
+
+def rebuild(csv_file: str):
+    '''
+    Functie voor het volledig opnieuw opbouwen van de index van een csv bestand.
+        csv_file = het csv bestand
+    '''
+    stats = io.get_file_stats([csv_file])
+    csv_index = create_index()
+    read_tail(csv_index, csv_file)
+    return io.save_cached_json(get_index_file(csv_file), stats, csv_index, True,
+                               write=lambda: write_index(csv_index, csv_file))
+
+
+def get_column_values(csv_index: dict, csv_file: str, column: str):
+    '''
+    Functie voor het ophalen van de waardes van een kolom, zonder de posities
+    te lezen. Waardes die onder een hash zijn opgeslagen worden overgeslagen.
+        csv_index = de index van het csv bestand
+        csv_file = het csv bestand
+        column = de kolomnaam
+    '''
+    column_values = set(csv_index["tail"].get(column, {}).keys())
+    if csv_index["marker"]["size"] > 0:
+        try:
+            file_names = os.listdir(os.path.join(get_index_dir(csv_file), column))
+        except OSError:
+            file_names = []
+        for file_name in file_names:
+            key, extension = os.path.splitext(file_name)
+            if extension == '.bin' and not key.startswith('x'):
+                column_values.add(bytes.fromhex(key).decode('utf-8'))
+    return column_values
+
+
+def get_offsets(csv_index: dict, csv_file: str, column: str, value: str):
+    '''
+    Functie voor het ophalen van de gesorteerde posities van de regels met een waarde.
+        csv_index = de index van het csv bestand
+        csv_file = het csv bestand
+        column = de kolomnaam
+        value = de waarde
+    '''
+    offsets = []
+    if csv_index["marker"]["size"] > 0:
+        offsets = read_offsets(get_posting_file(csv_file, column, value), csv_index["marker"]["size"])
+    return offsets + csv_index["tail"].get(column, {}).get(value, [])
+
+
+def find_offsets(csv_file: str, criteria: dict):
+    '''
+    Functie voor het opzoeken van de posities van regels in een csv bestand.
+        csv_file = het csv bestand
+        criteria = een dict met kolomnamen en de te zoeken waarde. Bij datum
+            kolommen worden alle regels gevonden waarvan de datum met de waarde
+            begint, zo vindt '2024-03' alle regels uit maart 2024.
+            Lege waardes worden genegeerd.
+    Geeft een gesorteerde list met posities terug, of None indien er geen
+    criteria zijn opgegeven en dus het gehele bestand gelezen dient te worden.
+    '''
+    criteria = {column: value for column, value in criteria.items() if value != ''}
+    if len(criteria) == 0:
+        return None
+    csv_index = load(csv_file)
+    found_offsets = None
+    for column, value in criteria.items():
+        if '_date' in column:
+            offsets = set()
+            for column_value in get_column_values(csv_index, csv_file, column):
+                if column_value.startswith(value):
+                    offsets.update(get_offsets(csv_index, csv_file, column, column_value))
+        else:
+            offsets = set(get_offsets(csv_index, csv_file, column, value))
+        if found_offsets is None:
+            found_offsets = offsets
+        else:
+            found_offsets &= offsets
+    return sorted(found_offsets)
+
+
+def find_offsets_in_range(csv_file: str,
+                          column: str,
+                          start: str='',
+                          end: str=''):
+    '''
+    Functie voor het opzoeken van de posities van regels waarvan de waarde
+    van een kolom binnen een bereik valt, bijvoorbeeld alle producten met
+    een vervaldatum tot en met een bepaalde datum.
+        csv_file = het csv bestand
+        column = de kolomnaam
+        start = de kleinste waarde (inclusief), indien leeg is er geen ondergrens
+        end = de grootste waarde (inclusief), indien leeg is er geen bovengrens.
+            Waardes die met end beginnen vallen ook binnen het bereik, zo valt
+            '2024-03-15' binnen een bereik met end '2024-03'.
+    '''
+    csv_index = load(csv_file)
+    sorted_values = sorted(get_column_values(csv_index, csv_file, column))
+    first = bisect_left(sorted_values, start) if start != '' else 0
+    last = bisect_right(sorted_values, end + '\uffff') if end != '' else len(sorted_values)
+    offsets = []
+    for column_value in sorted_values[first:last]:
+        offsets.extend(get_offsets(csv_index, csv_file, column, column_value))
+    return sorted(offsets)
@@ -5,8 +5,11 @@ from datetime import date, datetime
 import superpy.config as config
 import superpy.validate as validate
 import superpy.io as io
+import superpy.storage as storage
 import superpy.current_date as current_date
 import superpy.convert as convert
+import superpy.dates as dates
+import superpy.records as records
 
 
 CSV_BOUGHT_HEADER = ['id','name','buy_price', 'quantity', 'buy_date','expiration_date']
@@ -17,22 +20,28 @@ def get_product_id():
     '''
     Functie voor het bepalen van de id voor nieuw gekocht product.
     '''
-    products = io.read_csv(config.data["files"]["bought"])
-    if products:
-        products.reverse()
-        new_product_id = int(products[0]['id']) + 1
-        return new_product_id
-    return 1
+    return storage.get().get_last_product_id() + 1
 
 
-def buy(product_name: str,
-        price: float,
-        expiration_date: str,
-        quantity: int=1,
-        buy_date:str='',
-        product_id:int=0):
+def append_products(ledger:str, products:list):
     '''
-    Functie voor het kopen van een product.
+    Functie voor het in een keer toevoegen van producten aan de
+    gekochte of verkochte producten.
+        ledger = 'bought' of 'sold'.
+        products = een list met producten om toe te voegen.
+    '''
+    return storage.get().append(ledger, products)
+
+
+def create_bought_product(product_name: str,
+                          price: float,
+                          expiration_date: str,
+                          quantity: int=1,
+                          buy_date:str='',
+                          product_id:int=0):
+    '''
+    Functie voor het valideren en aanmaken van een gekocht product,
+    zonder het product weg te schrijven.
         product_name = naam van het product
         price = prijs van het product
         expiration_date = vervaldatum van het product
@@ -53,17 +62,52 @@ def buy(product_name: str,
             "buy_date": buy_date,
             "expiration_date": expiration_date
         }
-        if io.write_csv(new_product, config.data["files"]["bought"]):
-            return product_id
+        return new_product
     return False
 
 
-def get_values_to_compare(product:dict,
-                          product_property:str,
-                          criteria:str,
-                          operator:str):
+def buy(product_name: str,
+        price: float,
+        expiration_date: str,
+        quantity: int=1,
+        buy_date:str='',
+        product_id:int=0):
     '''
-    Functie voor het bepalen van de correcte waardes om te kunnen vergelijken.
+    Functie voor het kopen van een product.
+        product_name = naam van het product
+        price = prijs van het product
+        expiration_date = vervaldatum van het product
+        quantity = product aantal
+    '''
+    with storage.get().transaction():
+        new_product = create_bought_product(product_name=product_name,
+                                            price=price,
+                                            expiration_date=expiration_date,
+                                            quantity=quantity,
+                                            buy_date=buy_date,
+                                            product_id=product_id)
+        if new_product and append_products("bought", [new_product]):
+            return new_product["id"]
+    return False
+
+
+FILTER_OPERATORS = ['==', '!=', '<=', '>=', '<<', '>>']
+
+COMPARE_FUNCTIONS = {
+    '<=': lambda product_value, criteria_value: product_value <= criteria_value,
+    '>=': lambda product_value, criteria_value: product_value >= criteria_value,
+    '<<': lambda product_value, criteria_value: product_value < criteria_value,
+    '>>': lambda product_value, criteria_value: product_value > criteria_value
+}
+
+
+def get_criteria_value(product_property:str,
+                       criteria:str,
+                       operator:str):
+    '''
+    Functie voor het bepalen van de waarde waarmee een producteigenschap vergeleken wordt.
+    Bij een datum van alleen een jaar of maand wordt, afhankelijk van de operator,
+    de eerste of de laatste dag van die periode gebruikt.
     '''
     if '_date' in product_property:
         criteria_value = convert.date_str_to_datetime(criteria)
@@ -88,13 +132,92 @@ def get_values_to_compare(product:dict,
                 criteria_value=datetime(year=criteria_value.year,
                                         month=criteria_value.month,
                                         day=1)
-        product_value = convert.date_str_to_datetime(product[product_property])
     else:
         criteria_value = convert.string_to_number(criteria)
+    return criteria_value
+
+
+def get_values_to_compare(product:dict,
+                          product_property:str,
+                          criteria:str,
+                          operator:str):
+    '''
+    Functie voor het bepalen van de correcte waardes om te kunnen vergelijken.
+    '''
+    criteria_value = get_criteria_value(product_property=product_property,
+                                        criteria=criteria,
+                                        operator=operator)
+    if '_date' in product_property:
+        product_value = convert.date_str_to_datetime(product[product_property])
+    else:
         product_value = convert.string_to_number(product[product_property])
     return product_value, criteria_value
 
 
+def compile_filter(filter:str=''):
+    '''
+    Functie voor het eenmalig omzetten van een filter naar een functie die
+    per product bepaalt of het product aan het filter voldoet.
+    De vergelijkingswaarde van het filter wordt hierbij vooraf berekend.
+        filter = een filter met de syntax '[csv_header_name][operator][value]',
+            zie filter_products.
+    Geeft None terug indien het filter op alle producten van toepassing is.
+    '''
+    operator = next((item for item in FILTER_OPERATORS if item in filter), '')
+    criteria = filter.split(operator) if operator != '' else []
+    if len(criteria) != 2 or criteria[1] == '':
+        return None
+    product_property, criteria = criteria
+    if operator == '==':
+        if '_date' in product_property:
+            return lambda product: product[product_property].startswith(criteria)
+        return lambda product: product[product_property] == criteria
+    if operator == '!=':
+        if '_date' in product_property:
+            return lambda product: not product[product_property].startswith(criteria)
+        return lambda product: product[product_property] != criteria
+    criteria_value = get_criteria_value(product_property=product_property,
+                                        criteria=criteria,
+                                        operator=operator)
+    compare = COMPARE_FUNCTIONS[operator]
+    if '_date' in product_property:
+        convert_value = convert.date_str_to_datetime
+    else:
+        convert_value = convert.string_to_number
+    return lambda product: compare(convert_value(product[product_property]), criteria_value)
+
+
+def compile_filters(filters:list=[]):
+    '''
+    Functie voor het samenvoegen van meerdere filters tot een enkele functie,
+    zodat alle filters in een enkele doorloop van de producten toegepast worden.
+        filters = een list met 1 of meerdere filters, zie filter_product_list.
+    Geeft None terug indien de filters op alle producten van toepassing zijn.
+    '''
+    predicates = [predicate for predicate in map(compile_filter, filters) if predicate is not None]
+    if len(predicates) == 0:
+        return None
+    if len(predicates) == 1:
+        return predicates[0]
+    def predicate(product):
+        for product_predicate in predicates:
+            if not product_predicate(product):
+                return False
+        return True
+    return predicate
+
+
+def iter_filter_products(products, filter:str=''):
+    '''
+    Functie voor het filteren van producten zonder tussentijdse lijsten op te bouwen.
+    Geeft de gevonden producten een voor een terug zodat ook een generator
+    (zoals io.iter_csv) als invoer gebruikt kan worden.
+        products = een iterable met producten.
+        filter =  een filter voor het zoeken van producten, zie filter_products.
+    '''
+    return iter_filter_product_list(products, [filter])
+
+
 def filter_products(products:list, filter:str=''):
     '''
     Functie voor het filteren van producten.
@@ -104,79 +227,20 @@ def filter_products(products:list, filter:str=''):
             en ondersteund de operators '==','!=','<=','>=','<<','>>'.
             Voorbeeld: 'product_name==mango'
     '''
-    found_products = []
-    if filter != '':
-        if '==' in filter:
-            criteria = filter.split('==')
-            if len(criteria) == 2 and criteria[1] != '':
-                if '_date' in criteria[0]:
-                    found_products = [product for product in products if product[criteria[0]].startswith(criteria[1])]
-                else:
-                    found_products = [product for product in products if product[criteria[0]] == criteria[1]]
-            else:
-                found_products = products
-        elif '!=' in filter:
-            criteria = filter.split('!=')
-            if len(criteria) == 2 and criteria[1] != '':
-                if '_date' in criteria[0]:
-                    found_products = [product for product in products if not product[criteria[0]].startswith(criteria[1])]
-                else:
-                    found_products = [product for product in products if product[criteria[0]] != criteria[1]]
-            else:
-                found_products = products
-        elif '<=' in filter:
-            criteria = filter.split('<=')
-            if len(criteria) == 2 and criteria[1] != '':
-                for product in products:
-                    product_value, criteria_value = get_values_to_compare(product=product,
-                                                                          product_property=criteria[0],
-                                                                          criteria=criteria[1],
-                                                                          operator='<=')
-                    if product_value <= criteria_value:
-                        found_products.append(product)
-            else:
-                found_products = products
-        elif '>=' in filter:
-            criteria = filter.split('>=')
-            if len(criteria) == 2 and criteria[1] != '':
-                for product in products:
-                    product_value, criteria_value = get_values_to_compare(product=product,
-                                                                          product_property=criteria[0],
-                                                                          criteria=criteria[1],
-                                                                          operator='>=')
-                    if product_value >= criteria_value:
-                        found_products.append(product)
-            else:
-                found_products = products
-        elif '<<' in filter:
-            criteria = filter.split('<<')
-            if len(criteria) == 2 and criteria[1] != '':
-                for product in products:
-                    product_value, criteria_value = get_values_to_compare(product=product,
-                                                                          product_property=criteria[0],
-                                                                          criteria=criteria[1],
-                                                                          operator='<<')
-                    if product_value < criteria_value:
-                        found_products.append(product)
-            else:
-                found_products = products
-        elif '>>' in filter:
-            criteria = filter.split('>>')
-            if len(criteria) == 2 and criteria[1] != '':
-                for product in products:
-                    product_value, criteria_value = get_values_to_compare(product=product,
-                                                                          product_property=criteria[0],
-                                                                          criteria=criteria[1],
-                                                                          operator='>>')
-                    if product_value > criteria_value:
-                        found_products.append(product)
-            else:
-                found_products = products
-        else:
-            found_products = products
-    else:
-        found_products = products
-    return found_products
+    return list(iter_filter_products(products, filter))
+
+
+def iter_filter_product_list(products, filters:list=[]):
+    '''
+    Functie voor het lazy toepassen van meerdere filters op een iterable met producten.
+    Alle filters worden in een enkele doorloop van de producten toegepast.
+        products = een iterable met producten.
+        filters =  een list met 1 of meerdere filters, zie filter_product_list.
+    '''
+    predicate = compile_filters(filters)
+    if predicate is None:
+        return iter(products)
+    return (product for product in products if predicate(product))
 
 
 def filter_product_list(products:list, filters:list=[]):
@@ -189,11 +253,54 @@ def filter_product_list(products:list, filters:list=[]):
             Voorbeeld: '[product_name==mango', 'buy_date<=2024-09-03']
     '''
     if len(filters) != 0:
-        for filter in filters:
-            products = filter_products(products, filter)
+        products = list(iter_filter_product_list(products, filters))
     return products
 
 
+def iter_indexed_products(ledger:str,
+                          product_name:str,
+                          date_column:str,
+                          product_date:str):
+    '''
+    Functie voor het ophalen van producten uit de opslag, zie storage.py.
+    Indien een productnaam en/of datum is opgegeven worden alleen de regels van
+    dat product en/of die datum gelezen, anders worden alle producten gelezen.
+        ledger = 'bought' of 'sold'
+        product_name = de productnaam, indien leeg worden alle producten opgehaald
+        date_column = de datum kolom waarop gezocht dient te worden
+        product_date = de (gedeeltelijke) datum, indien leeg worden alle data opgehaald
+    '''
+    return storage.get().scan(ledger,
+                              product_name=product_name,
+                              date_column=date_column,
+                              start_date=product_date,
+                              end_date=product_date)
+
+
+def iter_bought_products(product_name:str='',
+                         buy_date:str=''):
+    '''
+    Functie voor het regel voor regel ophalen van gekochte producten.
+    Zie get_bought_products voor de betekenis van de parameters.
+    '''
+    return iter_indexed_products(ledger="bought",
+                                 product_name=product_name,
+                                 date_column='buy_date',
+                                 product_date=buy_date)
+
+
+def iter_sold_products(product_name:str='',
+                       sell_date:str=''):
+    '''
+    Functie voor het regel voor regel ophalen van verkochte producten.
+    Zie get_sold_products voor de betekenis van de parameters.
+    '''
+    return iter_indexed_products(ledger="sold",
+                                 product_name=product_name,
+                                 date_column='sell_date',
+                                 product_date=sell_date)
+
+
 def get_bought_products(product_name:str='',
                         buy_date:str=''):
     '''
@@ -207,11 +314,10 @@ def get_bought_products(product_name:str='',
     '''
     found_products = []
     product_quantity = 0
-    products = io.read_csv(config.data["files"]["bought"])
-    if products:
-        product_filters = [f'name=={product_name}',f'buy_date=={buy_date}']
-        found_products = filter_product_list(products, product_filters)
-        product_quantity = sum([int(product['quantity']) for product in found_products])
+    for product in iter_bought_products(product_name=product_name,
+                                        buy_date=buy_date):
+        found_products.append(product)
+        product_quantity += int(product['quantity'])
     return found_products, product_quantity
 
 
@@ -224,14 +330,48 @@ def get_sold_products(product_name:str="",
     '''
     found_products = []
     product_quantity = 0
-    products = io.read_csv(config.data["files"]['sold'])
-    if products:
-        product_filters = [f'name=={product_name}',f'sell_date=={sell_date}']
-        found_products = filter_product_list(products, product_filters)
-        product_quantity = sum([int(product['quantity']) for product in found_products])
+    for product in iter_sold_products(product_name=product_name,
+                                      sell_date=sell_date):
+        found_products.append(product)
+        product_quantity += int(product['quantity'])
     return found_products, product_quantity
 
 
+def iter_available_lots(product_name:str='',
+                        product_date:str=''):
+    '''
+    Functie voor het een voor een ophalen van de beschikbare gekochte producten
+    als records (zie records.BoughtLot) met het resterende aantal als quantity.
+    Met een productnaam komen de producten in volgorde van vervaldatum,
+    producten die voor de datum vervallen zijn worden niet gelezen (zie stock.iter_lots).
+    Zie get_available_products voor de betekenis van de parameters.
+    '''
+    first_expiration_date = 0
+    if product_date != '':
+        last_buy_date = get_criteria_value('buy_date', product_date, '<=').toordinal()
+        first_expiration_date = get_criteria_value('expiration_date', product_date, '>=').toordinal()
+    for product, lot_sold_quantity in storage.get().iter_lots(product_name, first_expiration_date):
+        lot = records.BoughtLot.from_product(product)
+        if lot.quantity - lot_sold_quantity < 1:
+            continue
+        if product_date != '' and dates.get_ordinal(lot.buy_date) > last_buy_date:
+            continue
+        if lot_sold_quantity > 0:
+            lot = lot._replace(quantity=lot.quantity - lot_sold_quantity)
+        yield lot
+
+
+def get_available_lots(product_name:str='',
+                       product_date:str=''):
+    '''
+    Functie voor het ophalen van de beschikbare gekochte producten, zie iter_available_lots.
+    Geeft een tuple terug met een list met records en het resterende aantal.
+    '''
+    inventory_lots = list(iter_available_lots(product_name=product_name,
+                                              product_date=product_date))
+    return inventory_lots, sum(lot.quantity for lot in inventory_lots)
+
+
 def get_available_products(product_name:str='',
                            product_date:str=''):
     '''
@@ -242,28 +382,9 @@ def get_available_products(product_name:str='',
             opgevraagd dient te worden, indien geen datum is opgegeven
             zullen producten opgehaald worden met alle aankoopdata.
     '''
-    inventory_products = []
-    remaining_quantity = 0
-    bought_products, bought_quantity = get_bought_products(product_name=product_name)
-    bought_filter = [f'buy_date<={product_date}',f'expiration_date>={product_date}']
-    available_bought_products = filter_product_list(products=bought_products, filters=bought_filter)
-    available_bought_quantity = sum([int(product['quantity']) for product in available_bought_products])
-    sold_products, sold_quantity = get_sold_products(product_name=product_name)
-    remaining_quantity = available_bought_quantity - sold_quantity
-    if remaining_quantity > 0:
-        bought_dict = {product['id']:product for product in available_bought_products}
-        for sold_product in sold_products:
-            sold_product_id = sold_product['id']
-            if sold_product_id in bought_dict.keys():
-                sold_quantity = int(sold_product['quantity'])
-                bought_quantity = int(bought_dict[sold_product_id]['quantity'])
-                inventory_quantity = bought_quantity - sold_quantity
-                if inventory_quantity < 1:
-                    bought_dict.pop(sold_product_id)
-                else:
-                    bought_dict[sold_product_id]['quantity'] = str(inventory_quantity)
-        inventory_products = list(bought_dict.values())
-        remaining_quantity = sum(int(product['quantity']) for product in inventory_products)
+    inventory_lots, remaining_quantity = get_available_lots(product_name=product_name,
+                                                            product_date=product_date)
+    inventory_products = [lot.to_product() for lot in inventory_lots]
     if len(inventory_products) == 0:
         # Indien geen producten zijn gevonden
         # dan een leeg product toevoegen.
@@ -274,31 +395,42 @@ def get_available_products(product_name:str='',
     return inventory_products, remaining_quantity
 
 
+def get_sold_quantity_per_product(product_name:str='',
+                                  filters:list=[]):
+    '''
+    Functie voor het in een enkele doorloop bepalen van het verkochte aantal per product id.
+        product_name = de productnaam, indien geen naam wordt opgegeven
+            dan worden alle verkochte producten meegenomen.
+        filters = een list met filters voor de verkochte producten, zie filter_product_list.
+    Geeft een dict terug met per product id het verkochte aantal.
+    '''
+    sold_quantities = {}
+    sold_products = iter_filter_product_list(iter_sold_products(product_name=product_name), filters)
+    for product in sold_products:
+        product_id = product['id']
+        sold_quantities[product_id] = sold_quantities.get(product_id, 0) + int(product['quantity'])
+    return sold_quantities
+
+
 def get_expired_products(product_name:str='',
                          product_date:str=''):
     '''
     Functie voor het ophalen van producten die verlopen zijn.
     '''
     remaining_expired_products = []
-    bought_products, quantity = get_bought_products(product_name=product_name)
-    filter = [f'expiration_date=={product_date}', f'expiration_date<={product_date}']
-    expired_products = filter_product_list(bought_products, filter)
-    sold_products, sold_quantity = get_sold_products(product_name=product_name)
-    sold_filter = [f'sell_date<={product_date}']
-    sold_products = filter_product_list(sold_products, sold_filter)
-    if sold_quantity > 0:
-        for product in expired_products:
-            product_id = product['id']
-            id_filter = [f'id=={product_id}']
-            sold_expired = filter_product_list(sold_products, id_filter)
-            if len(sold_expired) > 0:
-                sold_expired_quantity = sum([int(product['quantity']) for product in sold_expired])
-                expired_quantity = int(product['quantity']) - sold_expired_quantity
-                if expired_quantity > 0:
-                    product['quantity'] = str(expired_quantity)
-                    remaining_expired_products.append(product)
-    else:
-        remaining_expired_products = expired_products
+    expired_products = storage.get().scan("bought",
+                                          product_name=product_name,
+                                          date_column='expiration_date',
+                                          start_date=product_date,
+                                          end_date=product_date,
+                                          predicate=compile_filters([f'expiration_date<={product_date}']))
+    sold_quantities = get_sold_quantity_per_product(product_name=product_name,
+                                                    filters=[f'sell_date<={product_date}'])
+    for product in expired_products:
+        expired_quantity = int(product['quantity']) - sold_quantities.get(product['id'], 0)
+        if expired_quantity > 0:
+            product['quantity'] = str(expired_quantity)
+            remaining_expired_products.append(product)
     if len(remaining_expired_products) == 0:
         # Indien geen producten zijn gevonden
         # dan een leeg product toevoegen.
@@ -309,30 +441,30 @@ def get_expired_products(product_name:str='',
     return remaining_expired_products
 
 
-def create_product_to_sell(available_product:dict,
+def create_product_to_sell(available_product:records.BoughtLot,
                            sell_price:float,
                            sell_quantity:int,
                            sell_date:str):
     '''
     Functie voor het omzetten van een product op voorraad naar een product voor verkoop.
     Hierbij wordt rekening gehouden met het aantal dat al verkocht is van het product.
-        available_product = een beschikbaar product geschikt voor verkoop.
+        available_product = een beschikbaar product geschikt voor verkoop, zie get_available_lots.
         sell_price = de prijs waarvoor het product verkocht gaat worden.
         sell_quantity = het aantal wat verkocht dient te worden.
         sell_date = de verkoopdatum.
     '''
-    available_quantity = int(available_product["quantity"])
+    available_quantity = available_product.quantity
     remaining_quantity = available_quantity - sell_quantity
     if remaining_quantity >= 0:
         product_to_sell = dict(zip(CSV_SOLD_HEADER,
-                                   [available_product["id"],
-                                    available_product["name"],
+                                   [available_product.id,
+                                    available_product.name,
                                     sell_price,
                                     sell_quantity,
                                     sell_date]))
     else:
-        product_to_sell = dict(zip(CSV_SOLD_HEADER, [available_product["id"],
-                                                     available_product["name"],
+        product_to_sell = dict(zip(CSV_SOLD_HEADER, [available_product.id,
+                                                     available_product.name,
                                                      sell_price,
                                                      available_quantity,
                                                      sell_date]))
@@ -344,15 +476,16 @@ def create_products_to_sell(available_products:list,
                             sell_quantity:int,
                             sell_date:str):
     '''
-    Functie voor het ophalen van de beschikbare producten voor verkoop.
-        available_products = een list met beschikbare producten voor verkoop.
+    Functie voor het ophalen van de beschikbare producten voor verkoop. De
+    producten worden in volgorde verkocht, de producten van get_available_lots
+    staan al in volgorde van vervaldatum.
+        available_products = een list met beschikbare producten voor verkoop, zie get_available_lots.
         sold_products = een list met verkochte producten met dezelfde productnaam
         sell_price = de prijs waarvoor het gekochte product verkocht dient te worden
         sell_quantity = het aantal wat verkocht dient te worden
         sell_date = de verkoopdatum
     '''
     products_to_sell = []
-    available_products = sorted(available_products, key=lambda d: d['expiration_date'])
     for product in available_products:
         product_to_sell = create_product_to_sell(available_product=product,
                                                  sell_price=sell_price,
@@ -376,22 +509,42 @@ def sell(product_name:str,
     '''
     if validate.price(price=price) and validate.quantity(quantity=quantity):
         sell_date = current_date.get()
-        available_products, remaining_quantity = get_available_products(product_name=product_name,
-                                                                        product_date=sell_date)
-        if remaining_quantity >= quantity:
-            products_to_sell = create_products_to_sell(available_products=available_products,
-                                                    sell_price=price,
-                                                    sell_quantity=quantity,
-                                                    sell_date=sell_date)
-            for product in products_to_sell:
-                io.write_csv(product, config.data["files"]["sold"])
-            return True
-        else:
-            print(f"Oeps... there doesn't seem to be enough '{product_name}' available to sell.")
-            print(f"Only {remaining_quantity} remaining...")
+        with storage.get().transaction():
+            # Alleen de producten die als eerste vervallen worden gelezen,
+            # totdat er genoeg zijn voor de verkoop.
+            available_lots = []
+            remaining_quantity = 0
+            for lot in iter_available_lots(product_name=product_name, product_date=sell_date):
+                available_lots.append(lot)
+                remaining_quantity += lot.quantity
+                if remaining_quantity >= quantity:
+                    break
+            if remaining_quantity >= quantity:
+                products_to_sell = create_products_to_sell(available_products=available_lots,
+                                                           sell_price=price,
+                                                           sell_quantity=quantity,
+                                                           sell_date=sell_date)
+                return append_products("sold", products_to_sell)
+            else:
+                print(f"Oeps... there doesn't seem to be enough '{product_name}' available to sell.")
+                print(f"Only {remaining_quantity} remaining...")
     return False
 
 
+def get_date_totals(product_name:str="",
+                    product_date:str=""):
+    '''
+    Functie voor het ophalen van de aantallen, kosten en omzet op een (gedeeltelijke) datum.
+        product_name = de productnaam, indien geen naam is opgegeven
+            worden de totalen van alle producten bepaald.
+        product_date = de (gedeeltelijke) datum, indien geen datum is
+            opgegeven worden de totalen van alle data bepaald.
+    '''
+    return storage.get().get_totals(product_name=product_name,
+                                    start_date=product_date,
+                                    end_date=product_date)
+
+
 def get_product_revenue(product_name:str="",
                         sell_date:str=""):
     '''
@@ -402,10 +555,10 @@ def get_product_revenue(product_name:str="",
         sell_date = de verkoopdatum, indien geen verkoopdatum is 
             opgegeven zullen alle producten van alle verkoopdata worden bepaald.
     '''
-    sold_products, sold_quantity = get_sold_products(sell_date=sell_date,
-                                                     product_name=product_name)
+    totals = get_date_totals(product_name=product_name,
+                             product_date=sell_date)
     revenue = 0.0
-    revenue += sum(int(product['quantity']) * float(product['sell_price']) for product in sold_products)
+    revenue += totals['revenue']
     return round(revenue, 2)
 
 
@@ -419,10 +572,10 @@ def get_product_cost(product_name:str="",
         buy_date = de aankoopdatum, indien geen aankoopdatum is 
             opgegeven zullen alle producten van alle aankoopdata worden bepaald.
     '''
-    bought_products, bought_quantity = get_bought_products(product_name=product_name,
-                                                           buy_date=buy_date)
+    totals = get_date_totals(product_name=product_name,
+                             product_date=buy_date)
     purchase_price = 0.0
-    purchase_price += sum(int(product['quantity']) * float(product['buy_price']) for product in bought_products)
+    purchase_price += totals['cost']
     return round(purchase_price, 2)
 
 
@@ -445,6 +598,104 @@ def get_product_profit(product_name:str="",
     return round(profit, 2)
     
 
+def validate_import_products(products:list, product_id:int=1):
+    '''
+    Functie voor het in een keer valideren van te importeren producten.
+    Foutmeldingen worden verzameld in plaats van per product getoond en
+    alleen goedgekeurde producten krijgen een oplopende id toegewezen.
+        products = een list met producten om te importeren.
+        product_id = de id voor het eerste goedgekeurde product.
+    Geeft een tuple terug met de goedgekeurde producten en een list met foutmeldingen.
+    '''
+    new_products = []
+    errors = []
+    date_format = config.data["date_format"]
+    default_buy_date = ''
+    for row_number, product in enumerate(products, start=1):
+        try:
+            product_name = product['name']
+            price = float(product['buy_price'])
+            quantity = int(product['quantity'])
+            buy_date = product.get('buy_date') or ''
+            if buy_date == '':
+                if default_buy_date == '':
+                    default_buy_date = current_date.get()
+                buy_date = default_buy_date
+            expiration_date = product['expiration_date']
+            parsed_buy_date = dates.parse_date(buy_date, date_format)
+            parsed_expiration_date = dates.parse_date(expiration_date, date_format)
+        except KeyError as e:
+            errors.append(f'Product {row_number}: missing value for {e}.')
+            continue
+        except (TypeError, ValueError) as e:
+            errors.append(f'Product {row_number}: {e}.')
+            continue
+        if price < 0:
+            errors.append(f'Product {row_number}: a negative price was given.')
+        elif quantity == 0:
+            errors.append(f'Product {row_number}: quantity cannot be "0".')
+        elif parsed_expiration_date < parsed_buy_date:
+            errors.append(f'Product {row_number}: expiration date cannot be earlier then the buy date.')
+        else:
+            new_products.append({
+                "id": product_id,
+                "name": product_name,
+                "buy_price": price,
+                "quantity": quantity,
+                "buy_date": buy_date,
+                "expiration_date": expiration_date
+            })
+            product_id += 1
+    return new_products, errors
+
+
+def get_product_totals(product_name:str="",
+                       start_date:str="",
+                       end_date:str=""):
+    '''
+    Functie voor het bepalen van de aantallen, kosten, omzet en winst binnen een datumbereik.
+        product_name = de productnaam, indien geen naam is opgegeven
+            worden de totalen van alle producten bepaald.
+        start_date = de (gedeeltelijke) begindatum, indien geen datum is
+            opgegeven wordt vanaf de eerste aan- of verkoop geteld.
+        end_date = de (gedeeltelijke) einddatum, indien geen datum is
+            opgegeven wordt tot en met de laatste aan- of verkoop geteld.
+    '''
+    totals = storage.get().get_totals(product_name=product_name,
+                                      start_date=start_date,
+                                      end_date=end_date)
+    revenue = round(totals['revenue'], 2)
+    cost = round(totals['cost'], 2)
+    return {"bought_quantity": totals['bought_quantity'],
+            "cost": cost,
+            "sold_quantity": totals['sold_quantity'],
+            "revenue": revenue,
+            "profit": round(revenue - cost, 2)}
+
+
+def get_sold_products_in_range(product_name:str="",
+                               start_date:str="",
+                               end_date:str=""):
+    '''
+    Functie voor het ophalen van de verkochte producten binnen een datumbereik.
+        product_name = de productnaam, indien geen naam wordt opgegeven
+            dan worden alle verkochte producten opgehaald.
+        start_date = de (gedeeltelijke) begindatum.
+        end_date = de (gedeeltelijke) einddatum.
+    '''
+    found_products = []
+    product_quantity = 0
+    sold_products = storage.get().scan("sold",
+                                       product_name=product_name,
+                                       date_column='sell_date',
+                                       start_date=start_date,
+                                       end_date=end_date)
+    for product in sold_products:
+        found_products.append(product)
+        product_quantity += int(product['quantity'])
+    return found_products, product_quantity
+
+
 def import_products_from_file(file:str):
     '''
     Functie voor het importeren van producten d.m.v. een bestand.
@@ -464,21 +715,29 @@ def import_products_from_file(file:str):
         print(f'ERROR: Filetype "{extension}" not supported for import.')
         return False
     if len(products) > 0:
-        product_id = get_product_id()
-        for product in products:
-            buy(product_name=product['name'],
-                price=float(product['buy_price']),
-                quantity=int(product['quantity']),
-                expiration_date=product['expiration_date'],
-                buy_date=product['buy_date'],
-                product_id=product_id)
-            product_id += 1
-        print(f'Succesfully imported "{len(products)}" products.')
+        with storage.get().transaction():
+            new_products, errors = validate_import_products(products=products,
+                                                            product_id=get_product_id())
+            if not append_products("bought", new_products):
+                return False
+        print(f'Succesfully imported "{len(new_products)}" products.')
+        if len(errors) > 0:
+            print(f'WARNING: Skipped "{len(errors)}" invalid products:')
+            print('\n'.join(errors))
     else:
         print('No products found to import...')
     return True
 
 
+def rebuild():
+    '''
+    Functie voor het opnieuw opbouwen van de indexen, de voorraadstand en
+    de dagtotalen vanuit de csv bestanden met gekochte en verkochte producten.
+    Bij andere opslag dan csv hoeft er niets opgebouwd te worden.
+    '''
+    return storage.get().rebuild()
+
+
 def export_products_to_file(file:str, products:list=[]):
     '''
     Functie voor het exporteren van producten naar een bestand.
@@ -491,11 +750,8 @@ def export_products_to_file(file:str, products:list=[]):
         extension = os.path.splitext(full_filename)[1]
         print(f'Exporting products to "{full_filename}"...')
         if extension == '.csv':
-            for product in products:
-                if not io.write_csv(content=product,
-                                    csv_file=full_filename):
-                    return False
-            return True
+            return io.write_csv_rows(rows=products,
+                                     csv_file=full_filename)
         elif extension == '.json':
             return io.write_json(product_list=products,
                                  json_file=full_filename)
@@ -1,26 +1,336 @@
 import os
 import csv
 import json
+import mmap
+import locale
 import xml.etree.ElementTree as ET
+from io import StringIO
+from contextlib import nullcontext
 
+import superpy.locking as locking
 
-def read_csv(csv_file: str):
+
+# Het aantal bytes van de csv bestanden dat verwerkt mag zijn voordat een
+# json bestand met afgeleide gegevens weer wordt weggeschreven, zie save_cached_json.
+JSON_CHECKPOINT_SIZE = 256 * 1024
+
+# Per json bestand de laatst geladen gegevens, zie load_cached_json.
+json_cache = {}
+
+# Of het wegschrijven van de json bestanden is uitgesteld, zie defer_json_writes.
+deferred_json = {"active": False}
+
+
+def iter_csv(csv_file: str):
     '''
-    Functie voor het uitlezen van een csv bestand.
+    Functie voor het regel voor regel uitlezen van een csv bestand.
+    Het bestand wordt niet in zijn geheel in het geheugen geladen,
+    iedere regel wordt als dict teruggegeven zodra deze gelezen is.
         csv_file = het csv bestand welke uitgelezen dient te worden
     '''
-    csv_data = []
     try:
         if (os.path.exists(csv_file)):
-            csv_data = []
             with open(csv_file) as csvfile:
                 reader = csv.DictReader(csvfile, delimiter=';')
                 for row in reader:
-                    csv_data.append(row)
+                    yield row
+    except Exception as e:
+        print("ERROR: Unable to read data from '{}'.".format(csv_file))
+        print(e)
+
+
+def parse_csv_line(line, header: list, encoding: str):
+    '''
+    Functie voor het omzetten van een enkele (binaire) csv regel naar een dict.
+        line = de regel zoals deze uit het bestand is gelezen (bytes of memoryview)
+        header = een list met de kolomnamen van het csv bestand
+        encoding = de encoding van het csv bestand
+    '''
+    values = next(csv.reader([str(line, encoding)], delimiter=';'), [])
+    return dict(zip(header, values))
+
+
+def find_csv_line_end(data: mmap.mmap, offset: int, end: int):
+    '''
+    Functie voor het bepalen van de positie direct na de regel die op offset begint.
+        data = het memory-mapped csv bestand
+        offset = de positie van het begin van de regel
+        end = de positie tot waar gezocht dient te worden
+    '''
+    line_end = data.find(b'\n', offset, end)
+    if line_end < 0:
+        return end
+    return line_end + 1
+
+
+def iter_csv_offsets(csv_file: str, offset:int=0, end:int=-1):
+    '''
+    Functie voor het regel voor regel uitlezen van een csv bestand vanaf een
+    bepaalde positie. Per regel wordt een tuple met de positie (in bytes) van
+    de regel in het bestand en de regel als dict teruggegeven.
+    Het bestand wordt als memory-map gelezen, zodat alleen de gevraagde regels
+    van schijf gelezen en zonder tussentijdse kopie gedecodeerd worden.
+        csv_file = het csv bestand welke uitgelezen dient te worden
+        offset = de positie vanaf waar gelezen dient te worden, indien de
+            positie binnen de header valt wordt vanaf de eerste regel gelezen.
+        end = de positie tot waar gelezen dient te worden, indien -1 wordt
+            tot het einde van het bestand gelezen.
+    '''
+    try:
+        if (os.path.exists(csv_file)) and os.path.getsize(csv_file) > 0:
+            encoding = locale.getpreferredencoding(False)
+            with open(csv_file, 'rb') as csvfile, \
+                 mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                 memoryview(data) as view:
+                if end < 0 or end > len(data):
+                    end = len(data)
+                header_end = find_csv_line_end(data, 0, len(data))
+                header = next(csv.reader([str(view[0:header_end], encoding)], delimiter=';'), [])
+                line_offset = max(offset, header_end)
+                while line_offset < end:
+                    line_end = find_csv_line_end(data, line_offset, end)
+                    row = parse_csv_line(view[line_offset:line_end], header, encoding)
+                    if len(row) > 0:
+                        yield line_offset, row
+                    line_offset = line_end
+    except Exception as e:
+        print("ERROR: Unable to read data from '{}'.".format(csv_file))
+        print(e)
+
+
+def iter_csv_at(csv_file: str, offsets:list):
+    '''
+    Functie voor het uitlezen van alleen de regels op de opgegeven posities
+    van een csv bestand, zonder de rest van het bestand te lezen.
+        csv_file = het csv bestand welke uitgelezen dient te worden
+        offsets = een list met posities (in bytes) van de regels,
+            zie index.find_offsets en iter_csv_offsets.
+    '''
+    try:
+        if (os.path.exists(csv_file)) and os.path.getsize(csv_file) > 0:
+            encoding = locale.getpreferredencoding(False)
+            with open(csv_file, 'rb') as csvfile, \
+                 mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                 memoryview(data) as view:
+                header_end = find_csv_line_end(data, 0, len(data))
+                header = next(csv.reader([str(view[0:header_end], encoding)], delimiter=';'), [])
+                for offset in offsets:
+                    line_end = find_csv_line_end(data, offset, len(data))
+                    yield parse_csv_line(view[offset:line_end], header, encoding)
+    except Exception as e:
+        print("ERROR: Unable to read data from '{}'.".format(csv_file))
+        print(e)
+
+
+def read_csv(csv_file: str):
+    '''
+    Functie voor het uitlezen van een csv bestand.
+        csv_file = het csv bestand welke uitgelezen dient te worden
+    '''
+    return list(iter_csv(csv_file))
+
+
+def read_last_csv_row(csv_file: str, block_size:int=4096):
+    '''
+    Functie voor het uitlezen van alleen de laatste regel van een csv bestand.
+    Het bestand wordt vanaf het einde in blokken teruggelezen, waardoor de
+    benodigde tijd niet afhangt van de grootte van het bestand.
+        csv_file = het csv bestand welke uitgelezen dient te worden
+        block_size = het aantal bytes dat per keer teruggelezen wordt
+    Geeft een lege dict terug indien het bestand geen regels bevat.
+    '''
+    last_row = {}
+    try:
+        if (os.path.exists(csv_file)):
+            encoding = locale.getpreferredencoding(False)
+            with open(csv_file, 'rb') as csvfile:
+                header = csvfile.readline()
+                header_end = csvfile.tell()
+                position = csvfile.seek(0, os.SEEK_END)
+                data = b''
+                while position > header_end:
+                    read_size = min(block_size, position - header_end)
+                    position -= read_size
+                    csvfile.seek(position)
+                    data = csvfile.read(read_size) + data
+                    if b'\n' in data.rstrip(b'\r\n'):
+                        break
+                last_line = data.rstrip(b'\r\n').rsplit(b'\n', 1)[-1]
+                if last_line.strip() != b'':
+                    reader = csv.DictReader([header.decode(encoding), last_line.decode(encoding)],
+                                            delimiter=';')
+                    last_row = next(reader, {})
     except Exception as e:
         print("ERROR: Unable to read data from '{}'.".format(csv_file))
         print(e)
-    return csv_data
+    return last_row
+
+
+def format_csv_rows(rows, write_header: bool=False):
+    '''
+    Functie voor het omzetten van regels naar de bytes zoals deze in een csv bestand komen te staan.
+        rows = een iterable met dict objecten, de keys van de eerste regel worden gebruikt als header
+        write_header = indien True wordt de header voor de regels geplaatst
+    Geeft lege bytes terug indien er geen regels zijn.
+    '''
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        return b''
+    text = StringIO(newline='')
+    writer = csv.DictWriter(text, delimiter=';', quoting=csv.QUOTE_MINIMAL, fieldnames=first_row.keys())
+    if write_header:
+        writer.writeheader()
+    writer.writerow(first_row)
+    writer.writerows(rows)
+    return text.getvalue().encode(locale.getpreferredencoding(False))
+
+
+def append_bytes(data: bytes, file: str):
+    '''
+    Functie voor het in een enkele schrijfactie toevoegen van bytes aan een bestand.
+        data = de bytes
+        file = het bestand, de map wordt aangemaakt indien deze niet bestaat
+    '''
+    try:
+        file = os.path.abspath(file)
+        file_dir = os.path.dirname(file)
+        if (not (os.path.exists(file_dir))):
+            os.makedirs(file_dir)
+        with open(file, 'ab') as appendfile:
+            appendfile.write(data)
+        return True
+    except Exception as e:
+        print("ERROR: Unable to write data to '{}'".format(file))
+        print(e)
+    return False
+
+
+def replace_bytes(data: bytes, file: str):
+    '''
+    Functie voor het atomair vervangen van de inhoud van een bestand. De data
+    wordt eerst naar een tijdelijk bestand geschreven, waardoor het bestaande
+    bestand nooit leeg of half beschreven achterblijft.
+        data = de bytes
+        file = het bestand, de map wordt aangemaakt indien deze niet bestaat
+    '''
+    try:
+        file = os.path.abspath(file)
+        file_dir = os.path.dirname(file)
+        if (not (os.path.exists(file_dir))):
+            os.makedirs(file_dir)
+        temp_file = f'{file}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as tempfile:
+            tempfile.write(data)
+        os.replace(temp_file, file)
+        return True
+    except Exception as e:
+        print("ERROR: Unable to write data to '{}'".format(file))
+        print(e)
+    return False
+
+
+def write_csv_rows(rows, csv_file: str, append:bool=True):
+    '''
+    Functie voor het in een keer schrijven van meerdere regels naar een csv bestand.
+    De regels worden in een enkele schrijfactie toegevoegd, bij het overschrijven
+    wordt het bestand atomair vervangen (zie replace_bytes).
+        rows = een iterable met dict objecten die weggeschreven dienen te worden,
+            de keys van de eerste regel worden gebruikt als header
+        csv_file = het csv bestand waar naartoe geschreven dient te worden
+        append = Indien True worden de regels aan het bestand toegevoegd,
+            Indien False wordt de csv leeggemaakt en de regels toegevoegd.
+    '''
+    try:
+        data = format_csv_rows(rows, write_header=not append or not os.path.exists(csv_file))
+    except Exception as e:
+        print("ERROR: Unable to write data to '{}'".format(csv_file))
+        print(e)
+        return False
+    if data == b'':
+        return True
+    if append:
+        return append_bytes(data, csv_file)
+    return replace_bytes(data, csv_file)
+
+
+def sync_files(files):
+    '''
+    Functie voor het naar schijf schrijven (fsync) van bestanden, zodat de
+    geschreven regels een stroomstoring of crash overleven.
+        files = de bestanden, niet bestaande bestanden worden overgeslagen
+    '''
+    try:
+        for file in files:
+            if os.path.exists(file):
+                with open(file, 'r+b') as syncfile:
+                    os.fsync(syncfile.fileno())
+        return True
+    except OSError as e:
+        print("ERROR: Unable to sync '{}' to disk.".format(file))
+        print(e)
+    return False
+
+
+def read_sync_state(sync_file: str):
+    '''
+    Functie voor het uitlezen van de gesynchroniseerde posities, zie sync_group.
+    Een onleesbaar bestand geeft een lege dict, waardoor opnieuw gesynchroniseerd wordt.
+    '''
+    try:
+        with open(sync_file, 'r') as syncfile:
+            sync_state = json.loads(syncfile.read() or '{}')
+        if isinstance(sync_state, dict):
+            return sync_state
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def sync_group(sync_file: str, written: dict):
+    '''
+    Functie voor het naar schijf schrijven van de regels van een transactie
+    samen met die van gelijktijdige transacties van andere processen (group
+    commit). Het sync bestand bevat per bestand de positie tot waar deze
+    gesynchroniseerd is en dient tevens als slot. Het eerste proces dat het slot
+    krijgt synchroniseert alles wat tot dat moment geschreven is, ook de regels
+    van de processen die op het slot wachten. Deze processen vinden daarna
+    hun regels als gesynchroniseerd terug en hoeven zelf niet te wachten op de schijf.
+        sync_file = het sync bestand
+        written = per bestand de positie (in bytes) tot waar de transactie heeft geschreven
+    '''
+    import superpy.locking as locking
+    if len(written) == 0:
+        return True
+    with locking.exclusive(sync_file):
+        sync_state = read_sync_state(sync_file)
+        file_stats = {}
+        for file, size in written.items():
+            try:
+                file_stat = os.stat(file)
+            except OSError:
+                continue
+            synced = sync_state.get(file)
+            # Het inode nummer wijzigt bij het overschrijven van het bestand,
+            # de eerder gesynchroniseerde positie is dan niet meer geldig.
+            if synced != None and synced[0] == file_stat.st_ino and synced[1] >= size:
+                continue
+            file_stats[file] = file_stat
+        if len(file_stats) == 0:
+            return True
+        # De grootte wordt voor het synchroniseren bepaald, alles tot dat
+        # punt is na fsync op schijf, ook wat andere processen schreven.
+        if not sync_files(file_stats.keys()):
+            return False
+        for file, file_stat in file_stats.items():
+            sync_state[file] = [file_stat.st_ino, file_stat.st_size]
+        try:
+            with open(sync_file, 'w') as syncfile:
+                syncfile.write(json.dumps(sync_state))
+        except OSError as e:
+            print("ERROR: Unable to write data to '{}'".format(sync_file))
+            print(e)
+    return True
 
 
 def write_csv(content: dict, csv_file: str, append:bool=True):
@@ -31,28 +341,208 @@ def write_csv(content: dict, csv_file: str, append:bool=True):
         append = Indien True worden de content als nieuwe regel toegevoegd,
             Indien False wordt de csv leeggemaakt en de content toegevoegd.
     '''
+    return write_csv_rows([content], csv_file, append=append)
+
+
+def get_csv_marker(csv_file: str, size:int=-1, check_size:int=64):
+    '''
+    Functie voor het bepalen van een kenmerk van een csv bestand tot een bepaalde grootte.
+    Met het kenmerk kan later bepaald worden of het bestand sindsdien alleen
+    is aangevuld of dat het bestand is overschreven.
+        csv_file = het csv bestand
+        size = de grootte in bytes tot waar het kenmerk bepaald dient te worden,
+            indien -1 wordt de huidige grootte van het bestand gebruikt.
+        check_size = het aantal bytes voor size dat in het kenmerk wordt opgenomen.
+    '''
+    marker = {"size": 0, "check": ""}
+    if (os.path.exists(csv_file)):
+        if size < 0:
+            size = os.path.getsize(csv_file)
+        with open(csv_file, 'rb') as csvfile:
+            csvfile.seek(max(0, size - check_size))
+            check = csvfile.read(size - max(0, size - check_size))
+        marker = {"size": size, "check": check.hex()}
+    return marker
+
+
+def is_csv_marker_valid(csv_file: str, marker:dict):
+    '''
+    Functie voor het controleren of een csv bestand sinds het bepalen
+    van het kenmerk (zie get_csv_marker) alleen is aangevuld.
+        csv_file = het csv bestand
+        marker = het eerder bepaalde kenmerk van het bestand
+    '''
     try:
-        fieldnames = content.keys()
-        csv_file = os.path.abspath(csv_file)
-        csv_file_dir = os.path.dirname(csv_file)
-        if (not (os.path.exists(csv_file))):
-            if (not (os.path.exists(csv_file_dir))):
-                os.makedirs(csv_file_dir)
-            with open(csv_file, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, delimiter=';', quoting=csv.QUOTE_MINIMAL, fieldnames=fieldnames)
-                writer.writeheader()
-        if (append):
-            with open(csv_file, 'a', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, delimiter=';', quoting=csv.QUOTE_MINIMAL, fieldnames=fieldnames)
-                writer.writerow(content)
-        else:
-            with open(csv_file, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, delimiter=';', quoting=csv.QUOTE_MINIMAL, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerow(content)
+        if marker["size"] == 0:
+            return True
+        if (not os.path.exists(csv_file)) or os.path.getsize(csv_file) < marker["size"]:
+            return False
+        check_size = len(marker["check"]) // 2
+        return get_csv_marker(csv_file, marker["size"], check_size) == marker
+    except (KeyError, TypeError, OSError):
+        return False
+
+
+def get_file_stats(files: list):
+    '''
+    Functie voor het ophalen van de wijzigingstijd, grootte en het inode nummer
+    van bestanden, waarmee zonder het bestand te lezen bepaald kan worden of
+    het bestand gewijzigd is.
+        files = de bestanden
+    Geeft een tuple terug met per bestand een tuple, of None indien het bestand niet bestaat.
+    '''
+    stats = []
+    for file in files:
+        try:
+            file_stat = os.stat(file)
+            stats.append((file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino))
+        except OSError:
+            stats.append(None)
+    return tuple(stats)
+
+
+def load_cached_json(json_file: str, csv_files: list):
+    '''
+    Functie voor het ophalen van een json bestand met gegevens die uit csv
+    bestanden zijn afgeleid (zoals een index). Zolang de csv bestanden niet
+    gewijzigd zijn worden de eerder geladen gegevens uit het geheugen
+    teruggegeven, zodat een langlopend proces (zie server.py) het json bestand
+    niet bij iedere opdracht opnieuw inleest. Zijn de csv bestanden aangevuld,
+    dan worden de gegevens uit het geheugen teruggegeven om met de nieuwe
+    regels te worden bijgewerkt, het json bestand loopt dan mogelijk achter.
+        json_file = het json bestand
+        csv_files = de csv bestanden waaruit de gegevens zijn afgeleid
+    Geeft een tuple terug met de gegevens (of None indien het json bestand
+    niet bestaat), de kenmerken van de csv bestanden (zie get_file_stats)
+    en True indien de gegevens uit het geheugen bijgewerkt zijn.
+    '''
+    stats = get_file_stats(csv_files)
+    cached = json_cache.get(json_file)
+    if cached is not None:
+        return cached["data"], stats, cached["stats"] == stats
+    data = None
+    if os.path.exists(json_file):
+        data = read_json(json_file)
+    return data, stats, False
+
+
+def save_cached_json(json_file: str, stats: tuple, data, changed: bool, json_data=None, tail_size: int=0, parts=None, write=None):
+    '''
+    Functie voor het in het geheugen bewaren van de gegevens van een json
+    bestand. Het json bestand dient als checkpoint: de gegevens worden niet
+    na iedere nieuwe regel weggeschreven, maar pas wanneer er sinds het
+    vorige checkpoint meer dan JSON_CHECKPOINT_SIZE bytes van de csv bestanden
+    verwerkt zijn. Het json bestand bevat het kenmerk van de csv bestanden,
+    waardoor de regels daarna bij het volgende gebruik uit de csv bestanden
+    worden aangevuld. Tijdens uitgesteld schrijven (zie defer_json_writes)
+    wordt het json bestand pas bij flush_json_writes weggeschreven.
+        json_file = het json bestand
+        stats = de kenmerken van de csv bestanden voordat de gegevens
+            werden bijgewerkt, zie load_cached_json
+        data = de gegevens
+        changed = True indien de gegevens opnieuw zijn opgebouwd en direct
+            weggeschreven dienen te worden
+        json_data = de weg te schrijven gegevens, indien None wordt data weggeschreven
+        tail_size = het aantal bytes van de csv bestanden dat is verwerkt
+        parts = een dict met per json bestand de gewijzigde gegevens die bij
+            het json bestand horen (zoals de voorraad per product, zie stock.py).
+            Deze worden voor het json bestand weggeschreven.
+        write = een functie die in plaats van het wegschrijven van json_data en
+            parts wordt aangeroepen, voor gegevens die niet (alleen) als json
+            worden opgeslagen (zoals de index, zie index.py)
+    '''
+    cached = json_cache.get(json_file)
+    pending = tail_size + (cached["pending"] if cached is not None else 0)
+    pending_parts = cached["parts"] if cached is not None else {}
+    pending_parts.update(parts or {})
+    json_cache[json_file] = {"stats": stats,
+                             "data": data,
+                             "json_data": data if json_data is None else json_data,
+                             "parts": pending_parts,
+                             "write": write,
+                             "pending": pending,
+                             "dirty": changed or pending > 0}
+    if deferred_json["active"]:
+        return True
+    if changed or pending > JSON_CHECKPOINT_SIZE or (pending > 0 and not os.path.exists(json_file)):
+        return write_cached_json(json_file)
+    return True
+
+
+def write_cached_json(json_file: str):
+    '''
+    Functie voor het wegschrijven van de gegevens van een json bestand uit het geheugen, zie save_cached_json.
+    Bijbehorende bestanden worden eerst weggeschreven, onder een slot zodat
+    een ander proces er niet tussendoor een ouder json bestand wegschrijft.
+        json_file = het json bestand
+    '''
+    cached = json_cache[json_file]
+    if cached["write"] is not None:
+        if not cached["write"]():
+            return False
+    else:
+        with locking.exclusive(f'{json_file}.lock') if len(cached["parts"]) > 0 else nullcontext():
+            for part_file, part_data in cached["parts"].items():
+                if not replace_json(part_data, part_file):
+                    return False
+            if not replace_json(cached["json_data"], json_file):
+                return False
+        cached["parts"] = {}
+    cached["pending"] = 0
+    cached["dirty"] = False
+    return True
+
+
+def defer_json_writes():
+    '''
+    Functie voor het uitstellen van het wegschrijven van de json bestanden
+    met afgeleide gegevens (zoals een index), bijvoorbeeld bij het uitvoeren
+    van een groot aantal commando's. De gegevens worden tot flush_json_writes
+    in het geheugen bijgewerkt. Omdat de json bestanden het kenmerk van de
+    csv bestanden bevatten, worden na een onderbreking de ontbrekende regels
+    bij het volgende gebruik alsnog verwerkt.
+    '''
+    deferred_json["active"] = True
+
+
+def flush_json_writes(stop: bool=False):
+    '''
+    Functie voor het wegschrijven van alle json bestanden waarvan de gegevens
+    in het geheugen nieuwer zijn, bijvoorbeeld bij een checkpoint.
+        stop = indien True worden de json bestanden hierna weer volgens
+            save_cached_json weggeschreven.
+    '''
+    result = True
+    for json_file, cached in list(json_cache.items()):
+        if cached["dirty"]:
+            result = write_cached_json(json_file) and result
+    if stop:
+        deferred_json["active"] = False
+    return result
+
+
+def replace_json(data, json_file:str):
+    '''
+    Functie voor het atomair vervangen van een json bestand. De data wordt
+    eerst naar een tijdelijk bestand geschreven, waardoor het bestaande
+    bestand nooit half beschreven achterblijft.
+        data = de data die weggeschreven dient te worden
+        json_file = het json bestand welke vervangen dient te worden
+    '''
+    try:
+        json_file = os.path.abspath(json_file)
+        json_file_dir = os.path.dirname(json_file)
+        if (not (os.path.exists(json_file_dir))):
+            os.makedirs(json_file_dir)
+        # Een tijdelijk bestand per proces, zodat processen die tegelijk
+        # hetzelfde bestand bijwerken elkaars bestand niet overschrijven.
+        temp_file = f'{json_file}.{os.getpid()}.tmp'
+        with open(temp_file, "w") as jsonfile:
+            jsonfile.write(json.dumps(data, separators=(',', ':')))
+        os.replace(temp_file, json_file)
         return True
     except Exception as e:
-        print("ERROR: Unable to write data to '{}'".format(csv_file))
+        print("ERROR: Unable to write data to '{}'".format(json_file))
         print(e)
     return False
 
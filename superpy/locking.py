@@ -0,0 +1,82 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows heeft geen fcntl, daar wordt msvcrt gebruikt.
+    fcntl = None
+    import msvcrt
+
+
+# Per lock bestand het geopende bestand, het aantal keer dat het slot binnen
+# dit proces is genomen en een RLock voor de threads binnen dit proces.
+held_locks = {}
+held_locks_guard = threading.Lock()
+
+
+def acquire(lock_file):
+    '''
+    Functie voor het nemen van een exclusief slot op een geopend bestand.
+    Wacht totdat een ander proces het slot heeft vrijgegeven.
+        lock_file = het geopende bestand
+    '''
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK geeft na 10 seconden wachten een foutmelding.
+            continue
+
+
+def release(lock_file):
+    '''
+    Functie voor het vrijgeven van het slot op een geopend bestand.
+        lock_file = het geopende bestand
+    '''
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        return
+    lock_file.seek(0)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def exclusive(file: str):
+    '''
+    Functie voor het uitvoeren van code terwijl andere processen en threads
+    worden tegengehouden, zoals bij het controleren van de voorraad en het
+    wegschrijven van een verkoop. Binnen hetzelfde proces kan het slot
+    opnieuw genomen worden, zodat bijvoorbeeld een verkoop binnen een batch
+    het slot van de batch gebruikt.
+        file = het lock bestand, dit wordt aangemaakt indien het niet bestaat.
+    '''
+    with held_locks_guard:
+        lock = held_locks.setdefault(file, {"thread_lock": threading.RLock(), "file": None, "depth": 0})
+    with lock["thread_lock"]:
+        if lock["depth"] == 0:
+            lock_dir = os.path.dirname(os.path.abspath(file))
+            if (not (os.path.exists(lock_dir))):
+                os.makedirs(lock_dir)
+            lock["file"] = open(file, 'a+b')
+            try:
+                acquire(lock["file"])
+            except BaseException:
+                lock["file"].close()
+                raise
+        lock["depth"] += 1
+        try:
+            yield
+        finally:
+            lock["depth"] -= 1
+            if lock["depth"] == 0:
+                release(lock["file"])
+                lock["file"].close()
+                lock["file"] = None
+
@@ -0,0 +1,38 @@
+import sys
+from typing import NamedTuple
+
+
+class BoughtLot(NamedTuple):
+    '''
+    Een gekocht product, waarbij id, prijs en aantal eenmalig bij het
+    inlezen naar een getal worden omgezet.
+    '''
+    id: int
+    name: str
+    buy_price: float
+    quantity: int
+    buy_date: str
+    expiration_date: str
+
+    @classmethod
+    def from_product(cls, product: dict):
+        '''
+        Functie voor het omzetten van een gekocht product (dict) naar een record.
+        '''
+        return cls(int(product['id']),
+                   sys.intern(product['name']),
+                   float(product['buy_price']),
+                   int(product['quantity']),
+                   product['buy_date'],
+                   product['expiration_date'])
+
+    def to_product(self):
+        '''
+        Functie voor het omzetten naar een gekocht product zoals deze uit het csv bestand gelezen wordt.
+        '''
+        return {"id": str(self.id),
+                "name": self.name,
+                "buy_price": str(self.buy_price),
+                "quantity": str(self.quantity),
+                "buy_date": self.buy_date,
+                "expiration_date": self.expiration_date}
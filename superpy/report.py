@@ -1,14 +1,12 @@
 from datetime import datetime, timedelta
-from rich.console import Console
-from rich.table import Table
-from rich import box
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-import matplotlib.dates as mdates
-import matplotlib.ticker as ticker
+
+# Rich, numpy en matplotlib worden pas geladen in de functies die deze
+# gebruiken. Het laden van matplotlib kost honderden milliseconden, wat
+# anders bij ieder commando (zoals buy of sell) zou gebeuren.
 
 import superpy.config as config
 from superpy.convert import date_str_to_datetime
+import superpy.dates as dates
 
 
 def filter_product_properties(products:list, property_filter:list):
@@ -55,6 +53,9 @@ def product_table(products:list, filter:list=[]):
         filter = een list met producteigenschappen 
             die niet getoond hoeven te worden.
     '''
+    from rich.console import Console
+    from rich.table import Table
+    from rich import box
     if len(products) > 0:
         total_quantity = sum([int(product['quantity']) for product in products])
         table = Table(box=box.ASCII_DOUBLE_HEAD, caption=f'Total quantity: {total_quantity}')
@@ -82,10 +83,14 @@ def get_daily_chart_values(chart_type:str,
         chart_type = type grafiek waarvoor de dagelijkse hoeveelheid
             bepaald dient te worden: 'cost' of 'revenue'.
         products = een list van producten.
+        start_date = de eerste dag van de grafiek.
+        end_date = de laatste dag van de grafiek.
+    Alle producten worden in een enkele doorloop per dag opgeteld,
+    dagen zonder producten krijgen de waarde 0.
     '''
+    import numpy as np
     daily_values = {}
     if len(products) > 0:
-        chart_products = products.copy()
         date_type = ''
         price_type = ''
         if chart_type == 'cost':
@@ -97,18 +102,24 @@ def get_daily_chart_values(chart_type:str,
         start_date = date_str_to_datetime(start_date)
         end_date = date_str_to_datetime(end_date)
         date_format = config.data["date_format"]
-        total_value = 0.0
-        while start_date <= end_date:
-            value_date = datetime.strftime(start_date, date_format)
-            for product in chart_products:
-                if product[date_type] == value_date:
-                    total_value += (int(product['quantity']) * float(product[price_type]))
-                    chart_products.remove(product)
-            if value_date in daily_values.keys():
-                daily_values[value_date] += round(total_value, 2)
-            else:
+        day_count = (end_date - start_date).days + 1
+        if day_count > 0:
+            # Iedere unieke datum eenmalig omzetten naar een dagnummer
+            # ten opzichte van de startdatum.
+            start_ordinal = start_date.toordinal()
+            product_dates = [product[date_type] for product in products]
+            day_numbers = {product_date: dates.get_ordinal(product_date) - start_ordinal
+                           for product_date in set(product_dates)}
+            days = np.array([day_numbers[product_date] for product_date in product_dates], dtype=np.int64)
+            quantities = np.array([product['quantity'] for product in products]).astype(np.float64)
+            prices = np.array([product[price_type] for product in products]).astype(np.float64)
+            in_range = (days >= 0) & (days < day_count)
+            totals = np.bincount(days[in_range],
+                                 weights=(quantities * prices)[in_range],
+                                 minlength=day_count)
+            for day, total_value in enumerate(totals.tolist()):
+                value_date = datetime.strftime(start_date + timedelta(days=day), date_format)
                 daily_values[value_date] = round(total_value, 2)
-            start_date += timedelta(days=1)
     return daily_values
 
 
@@ -212,6 +223,7 @@ def product_chart(chart_types:list,
         if len(profits) > 0:
             charts['Daily Profits'] = profits
     if len(charts) > 0:
+        import matplotlib.pyplot as plt
         for chart in charts.keys():
             x_values = list(charts[chart].keys())
             y_values = list(charts[chart].values())
@@ -0,0 +1,198 @@
+import os
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+import superpy.config as config
+import superpy.io as io
+
+
+ROLLUP_VERSION = 1
+ROLLUP_COLUMNS = ['bought_quantity', 'cost', 'sold_quantity', 'revenue']
+
+# Opgebouwde cumulatieve dagtotalen per productnaam voor de laatst
+# opgehaalde versie van de dagtotalen, zie get_prefix_sums.
+prefix_sums_cache = {}
+
+
+def get_rollup_file():
+    '''
+    Functie voor het bepalen van het bestand met de dagtotalen.
+    '''
+    return f'{config.data["files"]["bought"]}.rollup'
+
+
+def create_rollup():
+    '''
+    Functie voor het aanmaken van lege dagtotalen.
+        days = per datum en per productnaam een list met het gekochte aantal,
+            de kosten, het verkochte aantal en de omzet (zie ROLLUP_COLUMNS).
+    '''
+    return {"version": ROLLUP_VERSION,
+            "bought": {"size": 0, "check": ""},
+            "sold": {"size": 0, "check": ""},
+            "days": {}}
+
+
+def add_bought_product(rollup: dict, product: dict):
+    '''
+    Functie voor het verwerken van een gekocht product in de dagtotalen.
+        rollup = de dagtotalen
+        product = het gekochte product
+    '''
+    quantity = int(product['quantity'])
+    totals = rollup["days"].setdefault(product['buy_date'], {}).setdefault(product['name'], [0, 0.0, 0, 0.0])
+    totals[0] += quantity
+    totals[1] += quantity * float(product['buy_price'])
+
+
+def add_sold_product(rollup: dict, product: dict):
+    '''
+    Functie voor het verwerken van een verkocht product in de dagtotalen.
+        rollup = de dagtotalen
+        product = het verkochte product
+    '''
+    quantity = int(product['quantity'])
+    totals = rollup["days"].setdefault(product['sell_date'], {}).setdefault(product['name'], [0, 0.0, 0, 0.0])
+    totals[2] += quantity
+    totals[3] += quantity * float(product['sell_price'])
+
+
+def update_rollup(rollup: dict):
+    '''
+    Functie voor het verwerken van de gekochte en verkochte producten die
+    sinds de laatste update aan de csv bestanden zijn toegevoegd.
+        rollup = de dagtotalen
+    Geeft het aantal verwerkte bytes terug, 0 indien er geen nieuwe regels zijn.
+    '''
+    tail_size = 0
+    for ledger, add_product in (("bought", add_bought_product),
+                                ("sold", add_sold_product)):
+        csv_file = config.data["files"][ledger]
+        if not os.path.exists(csv_file):
+            continue
+        file_size = os.path.getsize(csv_file)
+        if file_size == rollup[ledger]["size"]:
+            continue
+        for offset, product in io.iter_csv_offsets(csv_file, rollup[ledger]["size"], file_size):
+            add_product(rollup, product)
+        tail_size += file_size - rollup[ledger]["size"]
+        rollup[ledger] = io.get_csv_marker(csv_file, file_size)
+    return tail_size
+
+
+def load():
+    '''
+    Functie voor het ophalen van de dagtotalen. Alleen producten die sinds
+    de laatste keer aan de csv bestanden zijn toegevoegd worden verwerkt,
+    indien een van de csv bestanden is overschreven worden de dagtotalen
+    opnieuw opgebouwd.
+    '''
+    rollup_file = get_rollup_file()
+    rollup, stats, cached = io.load_cached_json(rollup_file, [config.data["files"]["bought"],
+                                                              config.data["files"]["sold"]])
+    if cached:
+        return rollup
+    changed = False
+    if (not isinstance(rollup, dict)
+        or rollup.get("version") != ROLLUP_VERSION
+        or not io.is_csv_marker_valid(config.data["files"]["bought"], rollup.get("bought"))
+        or not io.is_csv_marker_valid(config.data["files"]["sold"], rollup.get("sold"))):
+        rollup = create_rollup()
+        changed = os.path.exists(rollup_file)
+    tail_size = update_rollup(rollup)
+    io.save_cached_json(rollup_file, stats, rollup, changed, tail_size=tail_size)
+    return rollup
+
+
+def update():
+    '''
+    Functie voor het bijwerken van de dagtotalen na een aan- of verkoop.
+    '''
+    load()
+
+
+def rebuild():
+    '''
+    Functie voor het volledig opnieuw opbouwen van de dagtotalen
+    vanuit de csv bestanden met gekochte en verkochte producten.
+    '''
+    rollup = create_rollup()
+    update_rollup(rollup)
+    return io.replace_json(rollup, get_rollup_file())
+
+
+def get_totals(rollup: dict,
+               product_name: str='',
+               product_date: str=''):
+    '''
+    Functie voor het optellen van de dagtotalen.
+        rollup = de dagtotalen
+        product_name = de productnaam, indien leeg worden alle producten opgeteld
+        product_date = de (gedeeltelijke) datum, zo worden met '2024-03' alle
+            dagen van maart 2024 opgeteld. Indien leeg worden alle dagen opgeteld.
+    Geeft een dict terug met het totaal per kolom uit ROLLUP_COLUMNS.
+    '''
+    totals = [0, 0.0, 0, 0.0]
+    for day, day_totals in rollup["days"].items():
+        if not day.startswith(product_date):
+            continue
+        if product_name == '':
+            product_totals = day_totals.values()
+        elif product_name in day_totals:
+            product_totals = [day_totals[product_name]]
+        else:
+            continue
+        for product_total in product_totals:
+            for column in range(len(totals)):
+                totals[column] += product_total[column]
+    return dict(zip(ROLLUP_COLUMNS, totals))
+
+
+def get_prefix_sums(rollup: dict, product_name: str=''):
+    '''
+    Functie voor het opbouwen van de cumulatieve dagtotalen, waarmee het totaal
+    over ieder willekeurig datumbereik met twee opzoekingen bepaald kan worden.
+    De cumulatieve totalen worden per versie van de dagtotalen eenmalig opgebouwd.
+        rollup = de dagtotalen
+        product_name = de productnaam, indien leeg worden alle producten opgeteld
+    Geeft een tuple terug met een gesorteerde list met data en per kolom uit
+    ROLLUP_COLUMNS een list met cumulatieve totalen, beginnend met 0.
+    '''
+    rollup_version = (rollup["bought"]["size"], rollup["bought"]["check"],
+                      rollup["sold"]["size"], rollup["sold"]["check"])
+    if prefix_sums_cache.get("version") != rollup_version:
+        prefix_sums_cache.clear()
+        prefix_sums_cache["version"] = rollup_version
+        prefix_sums_cache["products"] = {}
+    product_prefix_sums = prefix_sums_cache["products"]
+    if product_name not in product_prefix_sums:
+        days = sorted(rollup["days"].keys())
+        day_totals = [get_totals({"days": {day: rollup["days"][day]}}, product_name=product_name)
+                      for day in days]
+        prefix_sums = [list(accumulate((totals[column] for totals in day_totals), initial=0))
+                       for column in ROLLUP_COLUMNS]
+        product_prefix_sums[product_name] = (days, prefix_sums)
+    return product_prefix_sums[product_name]
+
+
+def get_range_totals(rollup: dict,
+                     product_name: str='',
+                     start_date: str='',
+                     end_date: str=''):
+    '''
+    Functie voor het optellen van de dagtotalen binnen een datumbereik.
+        rollup = de dagtotalen
+        product_name = de productnaam, indien leeg worden alle producten opgeteld
+        start_date = de (gedeeltelijke) begindatum (inclusief), indien leeg
+            wordt vanaf de eerste dag opgeteld.
+        end_date = de (gedeeltelijke) einddatum (inclusief), zo telt '2024-03'
+            tot en met 31 maart 2024. Indien leeg wordt tot en met de laatste
+            dag opgeteld.
+    Geeft een dict terug met het totaal per kolom uit ROLLUP_COLUMNS.
+    '''
+    days, prefix_sums = get_prefix_sums(rollup, product_name)
+    first = bisect_left(days, start_date) if start_date != '' else 0
+    last = bisect_right(days, end_date + '\uffff') if end_date != '' else len(days)
+    last = max(first, last)
+    return {column: prefix_sums[position][last] - prefix_sums[position][first]
+            for position, column in enumerate(ROLLUP_COLUMNS)}
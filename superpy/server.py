@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import socket
+import socketserver
+from io import StringIO
+from contextlib import redirect_stdout, redirect_stderr
+
+import superpy.config as config
+
+
+# Commando's die altijd in het eigen proces worden uitgevoerd: 'server' om de
+# server te beheren, 'chart' omdat de grafiek op het scherm van de gebruiker
+# getoond dient te worden en 'batch' omdat deze van stdin kan lezen.
+LOCAL_COMMANDS = ['server', 'chart', 'batch']
+
+# Het aantal commando's en het aantal seconden waarna de indexen, de
+# voorraadstand en de dagtotalen uit het geheugen worden weggeschreven.
+SERVER_FLUSH_EVERY = 100
+SERVER_FLUSH_INTERVAL = 5
+
+
+def is_supported():
+    '''
+    Functie voor het controleren of het besturingssysteem Unix sockets ondersteunt.
+    '''
+    return hasattr(socket, 'AF_UNIX')
+
+
+def get_socket_file(files: dict = None):
+    '''
+    Functie voor het bepalen van de Unix socket van de server. Deze kan in de
+    config onder "files" als "socket" worden opgegeven, anders wordt een socket
+    naast het csv bestand met gekochte producten gebruikt.
+        files = de bestanden uit de config, standaard die uit config.data
+    '''
+    if files is None:
+        files = config.data["files"]
+    return files.get("socket", f'{files["bought"]}.sock')
+
+
+def read_socket_file(configfile: str):
+    '''
+    Functie voor het bepalen van de Unix socket van de server direct uit het
+    config bestand, zodat een commando doorgestuurd kan worden voordat de
+    config is geïnitialiseerd en de rest van superpy is geladen.
+        configfile = json configuratie bestand
+    Geeft de socket terug, of None indien deze niet te bepalen is.
+    '''
+    try:
+        with open(configfile, "r") as config_file:
+            return get_socket_file(json.load(config_file)["files"])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def run_command(argv: list):
+    '''
+    Functie voor het uitvoeren van een commando, waarbij alle uitvoer
+    (inclusief foutmeldingen van argparse) wordt opgevangen.
+        argv = de argumenten van het commando, bijvoorbeeld ['report', 'inventory', '--now']
+    Geeft de uitvoer van het commando als str terug.
+    '''
+    import superpy.args as args
+    output = StringIO()
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            args.parse(argv)
+        except SystemExit:
+            pass
+        except Exception as e:
+            print('ERROR: Command failed.')
+            print(e)
+    return output.getvalue()
+
+
+def write_response(wfile, response: dict):
+    '''
+    Functie voor het versturen van een antwoord als json regel.
+    '''
+    wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+    wfile.flush()
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    '''
+    Verwerkt de opdrachten van een client. Iedere opdracht is een json regel
+    met de argumenten ({"argv": [...], "cwd": "..."}) of een verzoek om te
+    stoppen ({"stop": true}), het antwoord is een json regel met de uitvoer.
+    '''
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                write_response(self.wfile, {"output": "ERROR: Invalid request.\n"})
+                continue
+            if request.get("stop"):
+                self.server.stopped = True
+                write_response(self.wfile, {"output": "SuperPy server stopped.\n"})
+                return
+            if request.get("cwd") != os.getcwd():
+                # Relatieve bestandsnamen (zoals bij een export) zouden
+                # anders in de map van de server terechtkomen.
+                write_response(self.wfile, {"forward": False})
+                continue
+            write_response(self.wfile, {"output": run_command(request.get("argv", []))})
+            self.server.unflushed += 1
+
+
+def connect(socket_file: str = None):
+    '''
+    Functie voor het maken van een verbinding met een draaiende server.
+        socket_file = de Unix socket van de server, standaard get_socket_file()
+    Geeft de socket terug, of None indien er geen server draait.
+    '''
+    if socket_file is None:
+        socket_file = get_socket_file()
+    if not is_supported() or not os.path.exists(socket_file):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_file)
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def send_request(client: socket.socket, request: dict):
+    '''
+    Functie voor het versturen van een opdracht en het ontvangen van het antwoord.
+        client = de socket, zie connect
+        request = de opdracht
+    '''
+    client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+    client.shutdown(socket.SHUT_WR)
+    with client.makefile('rb') as response:
+        return json.loads(response.readline())
+
+
+def is_running():
+    '''
+    Functie voor het controleren of er een server draait.
+    '''
+    client = connect()
+    if client is None:
+        return False
+    client.close()
+    return True
+
+
+def forward(argv: list, socket_file: str = None):
+    '''
+    Functie voor het doorsturen van een commando naar een draaiende server.
+        argv = de argumenten van het commando
+        socket_file = de Unix socket van de server, standaard get_socket_file(),
+                      zie read_socket_file
+    Geeft de uitvoer van het commando terug, of None indien het commando
+    in het eigen proces uitgevoerd dient te worden.
+    '''
+    if len(argv) == 0 or argv[0] in LOCAL_COMMANDS:
+        return None
+    client = connect(socket_file)
+    if client is None:
+        return None
+    with client:
+        try:
+            response = send_request(client, {"argv": argv, "cwd": os.getcwd()})
+        except (OSError, ValueError) as e:
+            # Het commando kan al door de server zijn uitgevoerd, daarom
+            # wordt het niet alsnog in het eigen proces uitgevoerd.
+            return f'ERROR: No response from the SuperPy server.\n{e}\n'
+    if not response.get("forward", True):
+        return None
+    return response.get("output", '')
+
+
+def serve():
+    '''
+    Functie voor het starten van de server. De server houdt de indexes,
+    de voorraadstand, de dagtotalen en de huidige datum in het geheugen en
+    voert de commando's van super.py uit totdat de server gestopt wordt.
+    De commando's worden een voor een uitgevoerd. De gegevens in het geheugen
+    worden na SERVER_FLUSH_EVERY commando's, na SERVER_FLUSH_INTERVAL seconden
+    en bij het stoppen weggeschreven (zie io.defer_json_writes), gekochte en
+    verkochte producten worden altijd direct aan de csv bestanden toegevoegd.
+    '''
+    import superpy.io as io
+    if not is_supported():
+        print('ERROR: Server mode requires Unix socket support.')
+        return False
+    if is_running():
+        print('ERROR: The SuperPy server is already running.')
+        return False
+    socket_file = get_socket_file()
+    if os.path.exists(socket_file):
+        os.remove(socket_file)
+    with socketserver.UnixStreamServer(socket_file, CommandHandler) as server:
+        server.stopped = False
+        server.unflushed = 0
+        server.timeout = SERVER_FLUSH_INTERVAL
+        last_flush = time.monotonic()
+        io.defer_json_writes()
+        print(f'SuperPy server listening on "{socket_file}".')
+        try:
+            while not server.stopped:
+                server.handle_request()
+                if (server.unflushed >= SERVER_FLUSH_EVERY
+                    or (server.unflushed > 0 and time.monotonic() - last_flush >= SERVER_FLUSH_INTERVAL)):
+                    io.flush_json_writes()
+                    server.unflushed = 0
+                    last_flush = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            io.flush_json_writes(stop=True)
+            os.remove(socket_file)
+    return True
+
+
+def stop():
+    '''
+    Functie voor het stoppen van een draaiende server.
+    '''
+    client = connect()
+    if client is None:
+        print('ERROR: The SuperPy server is not running.')
+        return False
+    with client:
+        print(send_request(client, {"stop": True}).get("output", ''), end='')
+    return True
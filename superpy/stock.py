@@ -0,0 +1,351 @@
+import os
+
+import superpy.config as config
+import superpy.io as io
+import superpy.dates as dates
+
+
+STOCK_VERSION = 3
+
+# De gegevens uit stock.json, de overige gegevens van de voorraadstand
+# worden alleen in het geheugen bijgehouden.
+STOCK_KEYS = ["version", "bought", "sold", "names"]
+
+
+def get_stock_dir():
+    '''
+    Functie voor het bepalen van de map met de voorraadstand.
+    '''
+    return f'{config.data["files"]["bought"]}.stock'
+
+
+def get_stock_file():
+    '''
+    Functie voor het bepalen van het bestand met de productnamen en het
+    kenmerk van de csv bestanden van de voorraadstand.
+    '''
+    return os.path.join(get_stock_dir(), 'stock.json')
+
+
+def get_product_file(key: int):
+    '''
+    Functie voor het bepalen van het bestand met de voorraad van een product.
+        key = het nummer van het product, zie get_product
+    '''
+    return os.path.join(get_stock_dir(), f'{key}.json')
+
+
+def create_stock():
+    '''
+    Functie voor het aanmaken van een lege voorraadstand. Een voorraadstand
+    van een eerdere versie, toen deze nog in een enkel bestand stond, wordt verwijderd.
+        names = per productnaam het nummer van het productbestand ("key")
+            en het totaal verkochte aantal ("sold_quantity").
+        products = per productnaam de voorraad, zie create_product. Een
+            product wordt pas bij gebruik uit het productbestand gelezen.
+        dirty = de productnamen waarvan de voorraad nog weggeschreven dient te worden.
+    '''
+    if os.path.isfile(get_stock_dir()):
+        os.remove(get_stock_dir())
+    return {"version": STOCK_VERSION,
+            "bought": {"size": 0, "check": ""},
+            "sold": {"size": 0, "check": ""},
+            "names": {},
+            "products": {},
+            "dirty": set()}
+
+
+def create_product():
+    '''
+    Functie voor het aanmaken van een lege voorraad van een product.
+        lots = per nog niet uitverkocht gekocht product een list met [id,
+            inkoopprijs, gekocht aantal, aankoopdatum, vervaldatum, verkocht aantal],
+            in volgorde van vervaldatum en bij gelijke vervaldata in volgorde
+            van aankoop. Een verkoop neemt de producten vooraan in de list.
+        bought, sold = de positie van de laatst verwerkte regel in de csv
+            bestanden, zodat een regel die al in het productbestand staat
+            niet nog een keer wordt verwerkt.
+    '''
+    return {"lots": [], "bought": -1, "sold": -1}
+
+
+def rebuild_product(stock: dict, product_name: str):
+    '''
+    Functie voor het opnieuw opbouwen van de voorraad van een product
+    waarvan het productbestand ontbreekt, tot aan het kenmerk van de voorraadstand.
+        stock = de voorraadstand
+        product_name = de productnaam
+    '''
+    product = create_product()
+    for ledger, add_product in (("bought", add_bought_lot),
+                                ("sold", add_sold_lot)):
+        csv_file = config.data["files"][ledger]
+        if not os.path.exists(csv_file) or stock[ledger]["size"] == 0:
+            continue
+        for offset, csv_product in io.iter_csv_offsets(csv_file, 0, stock[ledger]["size"]):
+            if csv_product['name'] == product_name:
+                add_product(product, csv_product, offset)
+    return product
+
+
+def get_product(stock: dict, product_name: str):
+    '''
+    Functie voor het ophalen van de voorraad van een product. Alleen het
+    productbestand van dit product wordt gelezen.
+        stock = de voorraadstand
+        product_name = de productnaam
+    '''
+    product = stock["products"].get(product_name)
+    if product is not None:
+        return product
+    name = stock["names"].get(product_name)
+    if name is None:
+        stock["names"][product_name] = {"key": len(stock["names"]), "sold_quantity": 0}
+        product = create_product()
+    else:
+        product = io.read_json(get_product_file(name["key"]))
+        if not isinstance(product, dict) or not isinstance(product.get("lots"), list):
+            print(f"WARNING: The stock of '{product_name}' is missing, rebuilding it from the csv files.")
+            product = rebuild_product(stock, product_name)
+            stock["dirty"].add(product_name)
+    stock["products"][product_name] = product
+    return product
+
+
+def find_lot_position(lots: list, expiration_date: int, after: bool=False):
+    '''
+    Functie voor het zoeken (binary search) van de positie van de eerste
+    partij die op of na een dagnummer vervalt.
+        lots = de partijen van een product, zie create_product
+        expiration_date = het dagnummer van de vervaldatum
+        after = indien True wordt de eerste partij gezocht die na het dagnummer vervalt
+    '''
+    low = 0
+    high = len(lots)
+    while low < high:
+        middle = (low + high) // 2
+        lot_expiration_date = dates.get_ordinal(lots[middle][4])
+        if lot_expiration_date < expiration_date or (after and lot_expiration_date == expiration_date):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def add_bought_lot(product: dict, bought_product: dict, offset: int):
+    '''
+    Functie voor het toevoegen van een gekocht product aan de voorraad van een product.
+        product = de voorraad van het product, zie create_product
+        bought_product = het gekochte product
+        offset = de positie van de regel in het csv bestand
+    '''
+    if offset <= product["bought"]:
+        return
+    position = find_lot_position(product["lots"], dates.get_ordinal(bought_product['expiration_date']), after=True)
+    product["lots"].insert(position, [bought_product['id'],
+                                      bought_product['buy_price'],
+                                      bought_product['quantity'],
+                                      bought_product['buy_date'],
+                                      bought_product['expiration_date'],
+                                      0])
+    product["bought"] = offset
+
+
+def add_sold_lot(product: dict, sold_product: dict, offset: int):
+    '''
+    Functie voor het verwerken van een verkocht product in de voorraad van
+    een product. Een uitverkocht product wordt uit de voorraad verwijderd,
+    zodat een volgende verkoop alleen de producten op voorraad leest.
+        product = de voorraad van het product, zie create_product
+        sold_product = het verkochte product
+        offset = de positie van de regel in het csv bestand
+    '''
+    if offset <= product["sold"]:
+        return
+    for position, lot in enumerate(product["lots"]):
+        if lot[0] == sold_product['id']:
+            lot[5] += int(sold_product['quantity'])
+            if lot[5] >= int(lot[2]):
+                del product["lots"][position]
+            break
+    product["sold"] = offset
+
+
+def add_bought_product(stock: dict, product: dict, offset: int):
+    '''
+    Functie voor het verwerken van een gekocht product in de voorraadstand.
+        stock = de voorraadstand
+        product = het gekochte product
+        offset = de positie van de regel in het csv bestand
+    '''
+    add_bought_lot(get_product(stock, product['name']), product, offset)
+    stock["dirty"].add(product['name'])
+
+
+def add_sold_product(stock: dict, product: dict, offset: int):
+    '''
+    Functie voor het verwerken van een verkocht product in de voorraadstand.
+        stock = de voorraadstand
+        product = het verkochte product
+        offset = de positie van de regel in het csv bestand
+    '''
+    add_sold_lot(get_product(stock, product['name']), product, offset)
+    stock["names"][product['name']]["sold_quantity"] += int(product['quantity'])
+    stock["dirty"].add(product['name'])
+
+
+def update_stock(stock: dict):
+    '''
+    Functie voor het verwerken van de gekochte en verkochte producten die
+    sinds de laatste update aan de csv bestanden zijn toegevoegd.
+        stock = de voorraadstand
+    Geeft het aantal verwerkte bytes terug, 0 indien er geen nieuwe regels zijn.
+    '''
+    tail_size = 0
+    for ledger, add_product in (("bought", add_bought_product),
+                                ("sold", add_sold_product)):
+        csv_file = config.data["files"][ledger]
+        if not os.path.exists(csv_file):
+            continue
+        file_size = os.path.getsize(csv_file)
+        if file_size == stock[ledger]["size"]:
+            continue
+        for offset, product in io.iter_csv_offsets(csv_file, stock[ledger]["size"], file_size):
+            add_product(stock, product, offset)
+        tail_size += file_size - stock[ledger]["size"]
+        # Het kenmerk wordt in dezelfde dict bijgewerkt, zodat de gegevens
+        # voor stock.json (zie get_stock_data) altijd de huidige zijn.
+        stock[ledger].update(io.get_csv_marker(csv_file, file_size))
+    return tail_size
+
+
+def get_stock_data(stock: dict):
+    '''
+    Functie voor het ophalen van de gegevens die in stock.json worden opgeslagen.
+        stock = de voorraadstand
+    '''
+    return {key: stock[key] for key in STOCK_KEYS}
+
+
+def get_product_data(stock: dict):
+    '''
+    Functie voor het ophalen van de productbestanden die sinds de vorige
+    keer zijn gewijzigd, zie io.save_cached_json.
+        stock = de voorraadstand
+    '''
+    product_data = {get_product_file(stock["names"][product_name]["key"]): stock["products"][product_name]
+                    for product_name in stock["dirty"]}
+    stock["dirty"].clear()
+    return product_data
+
+
+def save(stock: dict, stats: tuple, changed: bool, tail_size: int=0):
+    '''
+    Functie voor het bewaren van de voorraadstand, zie io.save_cached_json.
+    Alleen de gewijzigde productbestanden worden weggeschreven.
+    '''
+    return io.save_cached_json(get_stock_file(),
+                               stats,
+                               stock,
+                               changed,
+                               json_data=get_stock_data(stock),
+                               tail_size=tail_size,
+                               parts=get_product_data(stock))
+
+
+def load():
+    '''
+    Functie voor het ophalen van de voorraadstand. Alleen producten die sinds
+    de laatste keer aan de csv bestanden zijn toegevoegd worden verwerkt,
+    indien een van de csv bestanden is overschreven wordt de voorraadstand
+    opnieuw opgebouwd.
+    '''
+    stock_file = get_stock_file()
+    stock, stats, cached = io.load_cached_json(stock_file, [config.data["files"]["bought"],
+                                                            config.data["files"]["sold"]])
+    if cached:
+        return stock
+    changed = False
+    if (not isinstance(stock, dict)
+        or stock.get("version") != STOCK_VERSION
+        or not io.is_csv_marker_valid(config.data["files"]["bought"], stock.get("bought"))
+        or not io.is_csv_marker_valid(config.data["files"]["sold"], stock.get("sold"))):
+        stock = create_stock()
+        changed = os.path.exists(stock_file)
+    elif "products" not in stock:
+        stock["products"] = {}
+        stock["dirty"] = set()
+    tail_size = update_stock(stock)
+    save(stock, stats, changed, tail_size=tail_size)
+    return stock
+
+
+def update():
+    '''
+    Functie voor het bijwerken van de voorraadstand na een aan- of verkoop.
+    '''
+    load()
+
+
+def rebuild():
+    '''
+    Functie voor het volledig opnieuw opbouwen van de voorraadstand
+    vanuit de csv bestanden met gekochte en verkochte producten.
+    '''
+    stats = io.get_file_stats([config.data["files"]["bought"], config.data["files"]["sold"]])
+    stock = create_stock()
+    update_stock(stock)
+    return save(stock, stats, True)
+
+
+def iter_product_lots(stock: dict, product_name: str, expiration_date: int=0):
+    '''
+    Functie voor het ophalen van de partijen van een product die op of na een
+    dagnummer vervallen, de eerder vervallen partijen worden overgeslagen.
+    '''
+    lots = get_product(stock, product_name)["lots"]
+    position = find_lot_position(lots, expiration_date) if expiration_date > 0 else 0
+    for lot in lots[position:]:
+        yield product_name, lot
+
+
+def iter_lots(stock: dict, product_name: str='', expiration_date: int=0):
+    '''
+    Functie voor het ophalen van de gekochte producten die nog niet
+    uitverkocht zijn uit de voorraadstand. Per product wordt een tuple met
+    het gekochte product (als dict) en het verkochte aantal van dat product
+    teruggegeven.
+        stock = de voorraadstand
+        product_name = de productnaam, de producten worden in volgorde van
+            vervaldatum opgehaald. Indien leeg worden alle producten in
+            volgorde van aankoop opgehaald.
+        expiration_date = het dagnummer (zie dates.get_ordinal) waarvoor de
+            producten vervallen die niet worden opgehaald, 0 voor alle producten
+    '''
+    if product_name == '':
+        lots = sorted((name_lot for name in stock["names"] for name_lot in iter_product_lots(stock, name, expiration_date)),
+                      key=lambda name_lot: int(name_lot[1][0]))
+    elif product_name in stock["names"]:
+        lots = iter_product_lots(stock, product_name, expiration_date)
+    else:
+        lots = []
+    for name, (product_id, buy_price, quantity, buy_date, expiration_date, sold) in lots:
+        product = {"id": product_id,
+                   "name": name,
+                   "buy_price": buy_price,
+                   "quantity": quantity,
+                   "buy_date": buy_date,
+                   "expiration_date": expiration_date}
+        yield product, sold
+
+
+def get_sold_quantity(stock: dict, product_name: str=''):
+    '''
+    Functie voor het ophalen van het totaal verkochte aantal uit de voorraadstand.
+        stock = de voorraadstand
+        product_name = de productnaam, indien leeg wordt het totaal van alle producten bepaald
+    '''
+    if product_name == '':
+        return sum(name["sold_quantity"] for name in stock["names"].values())
+    name = stock["names"].get(product_name)
+    return name["sold_quantity"] if name is not None else 0
@@ -0,0 +1,493 @@
+import os
+from contextlib import nullcontext, contextmanager
+
+import superpy.config as config
+import superpy.io as io
+import superpy.dates as dates
+import superpy.index as index
+import superpy.stock as stock
+import superpy.rollup as rollup
+import superpy.database as database
+import superpy.locking as locking
+import superpy.wal as wal
+
+
+def is_in_date_range(product_date: str,
+                     start_date: str='',
+                     end_date: str=''):
+    '''
+    Functie voor het bepalen of een datum binnen een (gedeeltelijk) datumbereik valt.
+    Een einddatum '2024-03' omvat alle dagen van maart 2024, met een gelijke
+    begin- en einddatum worden dus alle data gevonden die met die datum beginnen.
+        product_date = de te controleren datum
+        start_date = de begindatum, indien leeg is er geen ondergrens
+        end_date = de einddatum, indien leeg is er geen bovengrens
+    '''
+    return ((start_date == '' or product_date >= start_date)
+            and (end_date == '' or product_date[0:len(end_date)] <= end_date))
+
+
+def sort_lots(lots, product_name: str='', expiration_date: int=0):
+    '''
+    Functie voor het ophalen van gekochte producten in dezelfde volgorde als
+    CsvStorage.iter_lots, voor opslag waarin de producten op id staan.
+        lots = de gekochte producten met het verkochte aantal, op volgorde van id
+        product_name = zie CsvStorage.iter_lots
+        expiration_date = zie CsvStorage.iter_lots
+    '''
+    lots = [(product, sold) for product, sold in lots
+            if dates.get_ordinal(product['expiration_date']) >= expiration_date]
+    if product_name != '':
+        lots.sort(key=lambda lot: dates.get_ordinal(lot[0]['expiration_date']))
+    return lots
+
+
+class CsvStorage:
+    '''
+    Opslag van de gekochte en verkochte producten en de huidige datum in
+    de csv bestanden uit de config, met de bijbehorende indexen,
+    voorraadstand en dagtotalen. Dit is de standaard opslag. Iedere wijziging
+    wordt eerst in een logbestand vastgelegd, waarmee de csv bestanden na een
+    crash hersteld worden, zie wal.py.
+    '''
+
+    def __init__(self):
+        # De laatst gelezen huidige datum met de wijzigingstijd en grootte
+        # van het bestand op dat moment, zie get_current_date.
+        self.current_date_cache = {"stat": None, "current_date": ''}
+        # Het aantal geneste transacties en of er binnen de transactie
+        # bewerkingen zijn gelogd, zie transaction.
+        self.transaction_state = {"depth": 0, "logged": False}
+        self.recover()
+
+    def get_current_date_stat(self):
+        '''
+        Functie voor het ophalen van de wijzigingstijd en grootte van het
+        'current_date' bestand, of None indien het bestand niet bestaat.
+        '''
+        try:
+            file_stat = os.stat(config.data["files"]["current_date"])
+            return (file_stat.st_mtime_ns, file_stat.st_size)
+        except OSError:
+            return None
+
+    def update_derived_data(self, ledger: str):
+        '''
+        Functie voor het bijwerken van de index, de voorraadstand en de
+        dagtotalen met de regels die aan een van de csv
+        bestanden zijn toegevoegd, zie checkpoint. Na het toevoegen van regels
+        worden deze gegevens pas bij het volgende gebruik bijgewerkt.
+            ledger = het bijgewerkte bestand: 'bought' of 'sold'.
+        '''
+        index.update(config.data["files"][ledger])
+        stock.update()
+        rollup.update()
+
+    def append(self, ledger: str, products: list):
+        '''
+        Functie voor het in een keer toevoegen van producten.
+            ledger = 'bought' of 'sold'.
+            products = een list met producten om toe te voegen.
+        '''
+        csv_file = config.data["files"][ledger]
+        with self.transaction():
+            try:
+                data = io.format_csv_rows(products, write_header=not os.path.exists(csv_file))
+            except Exception as e:
+                print("ERROR: Unable to write data to '{}'".format(csv_file))
+                print(e)
+                return False
+            if data == b'':
+                return True
+            if not wal.log_append(ledger, data):
+                return False
+            self.transaction_state["logged"] = True
+            return io.append_bytes(data, csv_file)
+
+    def scan(self,
+             ledger: str,
+             product_name: str='',
+             date_column: str='',
+             start_date: str='',
+             end_date: str='',
+             predicate=None):
+        '''
+        Functie voor het ophalen van producten, waarbij met behulp van de index
+        alleen de regels van het opgegeven product en/of datumbereik gelezen worden.
+            ledger = 'bought' of 'sold'.
+            product_name = de productnaam, indien leeg worden alle producten opgehaald.
+            date_column = de datum kolom voor het datumbereik.
+            start_date = de (gedeeltelijke) begindatum, zie is_in_date_range.
+            end_date = de (gedeeltelijke) einddatum, zie is_in_date_range.
+            predicate = een functie waaraan de producten daarnaast dienen te voldoen.
+        '''
+        csv_file = config.data["files"][ledger]
+        if date_column != '' and start_date != '' and start_date == end_date:
+            offsets = index.find_offsets(csv_file, {'name': product_name,
+                                                    date_column: start_date})
+        elif date_column != '' and (start_date != '' or end_date != ''):
+            offsets = index.find_offsets_in_range(csv_file, date_column, start=start_date, end=end_date)
+        else:
+            offsets = index.find_offsets(csv_file, {'name': product_name})
+        if offsets is None:
+            products = io.iter_csv(csv_file)
+        else:
+            products = io.iter_csv_at(csv_file, offsets)
+        for product in products:
+            if ((product_name == '' or product['name'] == product_name)
+                and (date_column == '' or is_in_date_range(product[date_column], start_date, end_date))
+                and (predicate is None or predicate(product))):
+                yield product
+
+    def iter_lots(self, product_name: str='', expiration_date: int=0):
+        '''
+        Functie voor het ophalen van de gekochte producten die nog niet
+        uitverkocht zijn met het verkochte aantal per product. Met een
+        productnaam in volgorde van vervaldatum, zie stock.iter_lots.
+        '''
+        return stock.iter_lots(stock.load(), product_name, expiration_date)
+
+    def get_sold_quantity(self, product_name: str=''):
+        '''
+        Functie voor het ophalen van het totaal verkochte aantal, zie stock.get_sold_quantity.
+        '''
+        return stock.get_sold_quantity(stock.load(), product_name)
+
+    def get_totals(self,
+                   product_name: str='',
+                   start_date: str='',
+                   end_date: str=''):
+        '''
+        Functie voor het bepalen van de aantallen, kosten en omzet binnen
+        een datumbereik, zie rollup.ROLLUP_COLUMNS.
+        '''
+        if start_date == end_date:
+            return rollup.get_totals(rollup.load(),
+                                     product_name=product_name,
+                                     product_date=start_date)
+        return rollup.get_range_totals(rollup.load(),
+                                       product_name=product_name,
+                                       start_date=start_date,
+                                       end_date=end_date)
+
+    def get_last_product_id(self):
+        '''
+        Functie voor het ophalen van de id van het laatst gekochte product.
+        '''
+        last_product = io.read_last_csv_row(config.data["files"]["bought"])
+        if last_product:
+            return int(last_product['id'])
+        return 0
+
+    def get_current_date(self):
+        '''
+        Functie voor het ophalen van de huidige datum, leeg indien deze niet is ingesteld.
+        Het bestand wordt alleen opnieuw gelezen indien het sinds de vorige keer is gewijzigd.
+        '''
+        file_stat = self.get_current_date_stat()
+        if file_stat is None:
+            return ''
+        if file_stat != self.current_date_cache["stat"]:
+            current_date = io.read_csv(config.data["files"]["current_date"])
+            self.current_date_cache["current_date"] = current_date[0]["current_date"] if current_date else ''
+            self.current_date_cache["stat"] = file_stat
+        return self.current_date_cache["current_date"]
+
+    def set_current_date(self, new_date: str):
+        '''
+        Functie voor het instellen van de huidige datum.
+        '''
+        with self.transaction():
+            if not wal.log_date(new_date):
+                return False
+            self.transaction_state["logged"] = True
+            if not io.write_csv({"current_date": new_date},
+                                config.data["files"]["current_date"],
+                                append=False):
+                return False
+        self.current_date_cache["current_date"] = new_date
+        self.current_date_cache["stat"] = self.get_current_date_stat()
+        return True
+
+    def get_lock_file(self):
+        '''
+        Functie voor het bepalen van het lock bestand van de csv bestanden.
+        '''
+        return f'{config.data["files"]["bought"]}.lock'
+
+    def get_sync_file(self):
+        '''
+        Functie voor het bepalen van het bestand voor de group commit, zie io.sync_group.
+        '''
+        return f'{config.data["files"]["bought"]}.sync'
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Functie voor het groeperen van een lees- en schrijfactie, zoals bij een
+        verkoop. Andere processen en threads wachten zolang met hun transactie
+        (zie locking.py), zodat twee kassa's niet dezelfde voorraad kunnen
+        verkopen. Wijzigingen worden direct geschreven en na de buitenste
+        transactie wordt het logbestand naar schijf gesynchroniseerd (zie
+        wal.py). Het slot wordt daarvoor al vrijgegeven, zodat de volgende
+        transactie niet op de schijf wacht, en gelijktijdige transacties van
+        verschillende processen worden met een enkele fsync gesynchroniseerd
+        (group commit, zie io.sync_group). Boven wal.WAL_CHECKPOINT_SIZE wordt
+        een checkpoint gemaakt.
+        '''
+        state = self.transaction_state
+        written = {}
+        try:
+            with locking.exclusive(self.get_lock_file()):
+                state["depth"] += 1
+                try:
+                    yield
+                finally:
+                    state["depth"] -= 1
+                    if state["depth"] == 0 and state["logged"]:
+                        state["logged"] = False
+                        wal_size = wal.get_size()
+                        if wal_size > wal.WAL_CHECKPOINT_SIZE:
+                            self.checkpoint()
+                        else:
+                            written = {wal.get_wal_file(): wal_size}
+        finally:
+            io.sync_group(self.get_sync_file(), written)
+
+    def checkpoint(self):
+        '''
+        Functie voor het maken van een checkpoint: de indexen, de voorraadstand
+        en de dagtotalen worden bijgewerkt en weggeschreven,
+        waarna de csv bestanden naar schijf worden geschreven en het logbestand
+        wordt leeggemaakt (zie wal.checkpoint). Bij het starten worden deze
+        gegevens daardoor vanaf het checkpoint aangevuld met alleen de regels
+        die daarna zijn toegevoegd.
+        '''
+        with self.transaction():
+            self.update_derived_data("bought")
+            self.update_derived_data("sold")
+            io.flush_json_writes()
+            return wal.checkpoint()
+
+    def recover(self):
+        '''
+        Functie voor het herstellen van de csv bestanden en de huidige datum
+        vanuit het logbestand na een crash, waarna een checkpoint wordt
+        gemaakt, zie wal.recover. Wordt bij het starten uitgevoerd, het slot
+        wordt alleen genomen indien er iets hersteld dient te worden.
+        '''
+        if wal.get_size() == 0 or not wal.needs_recovery():
+            return False
+        with self.transaction():
+            if wal.recover():
+                self.current_date_cache["stat"] = None
+                return self.checkpoint()
+        return False
+
+    def rebuild(self):
+        '''
+        Functie voor het opnieuw opbouwen van de indexen, de voorraadstand en
+        de dagtotalen vanuit de csv bestanden.
+        '''
+        return (index.rebuild(config.data["files"]["bought"])
+                and index.rebuild(config.data["files"]["sold"])
+                and stock.rebuild()
+                and rollup.rebuild())
+
+
+class ColumnarStorage(CsvStorage):
+    '''
+    Opslag in de csv bestanden, waarbij de totalen vanuit een kolomsgewijze
+    kopie van de csv bestanden bepaald worden, zie columnar.py. Numpy wordt
+    pas bij het eerste gebruik geladen, zodat de overige opslag en de
+    commando's zonder totalen sneller starten.
+    '''
+
+    def get_sold_quantity(self, product_name: str=''):
+        import superpy.columnar as columnar
+        return columnar.get_sold_quantity(product_name)
+
+    def get_totals(self,
+                   product_name: str='',
+                   start_date: str='',
+                   end_date: str=''):
+        import superpy.columnar as columnar
+        return columnar.get_totals(product_name=product_name,
+                                   start_date=start_date,
+                                   end_date=end_date)
+
+    def rebuild(self):
+        import superpy.columnar as columnar
+        return (super().rebuild()
+                and columnar.rebuild("bought")
+                and columnar.rebuild("sold"))
+
+
+class SqliteStorage:
+    '''
+    Opslag in een SQLite database, zie database.py.
+    '''
+
+    def append(self, ledger: str, products: list):
+        return database.append_products(ledger, products)
+
+    def scan(self,
+             ledger: str,
+             product_name: str='',
+             date_column: str='',
+             start_date: str='',
+             end_date: str='',
+             predicate=None):
+        products = database.iter_products(ledger,
+                                          product_name=product_name,
+                                          date_column=date_column,
+                                          start_date=start_date,
+                                          end_date=end_date)
+        if predicate is None:
+            return products
+        return (product for product in products if predicate(product))
+
+    def iter_lots(self, product_name: str='', expiration_date: int=0):
+        return sort_lots(database.iter_lots(product_name), product_name, expiration_date)
+
+    def get_sold_quantity(self, product_name: str=''):
+        return database.get_sold_quantity(product_name)
+
+    def get_totals(self,
+                   product_name: str='',
+                   start_date: str='',
+                   end_date: str=''):
+        return database.get_totals(product_name=product_name,
+                                   start_date=start_date,
+                                   end_date=end_date)
+
+    def get_last_product_id(self):
+        return database.get_last_product_id()
+
+    def get_current_date(self):
+        return database.get_current_date()
+
+    def set_current_date(self, new_date: str):
+        return database.set_current_date(new_date)
+
+    def transaction(self):
+        return database.transaction()
+
+    def rebuild(self):
+        return True
+
+
+class MemoryStorage:
+    '''
+    Opslag in het geheugen, bijvoorbeeld voor simulaties en tests.
+    Er wordt niets naar schijf geschreven.
+    '''
+
+    def __init__(self):
+        self.products = {"bought": [], "sold": []}
+        self.sold_quantities = {}
+        self.sold_quantities_per_name = {}
+        self.current_date = ''
+
+    def append(self, ledger: str, products: list):
+        for product in products:
+            product = {key: str(value) for key, value in product.items()}
+            self.products[ledger].append(product)
+            if ledger == "sold":
+                quantity = int(product['quantity'])
+                self.sold_quantities[product['id']] = self.sold_quantities.get(product['id'], 0) + quantity
+                self.sold_quantities_per_name[product['name']] = self.sold_quantities_per_name.get(product['name'], 0) + quantity
+        return True
+
+    def scan(self,
+             ledger: str,
+             product_name: str='',
+             date_column: str='',
+             start_date: str='',
+             end_date: str='',
+             predicate=None):
+        for product in self.products[ledger]:
+            if ((product_name == '' or product['name'] == product_name)
+                and (date_column == '' or is_in_date_range(product[date_column], start_date, end_date))
+                and (predicate is None or predicate(product))):
+                yield dict(product)
+
+    def iter_lots(self, product_name: str='', expiration_date: int=0):
+        return sort_lots(((product, self.sold_quantities.get(product['id'], 0))
+                          for product in self.scan("bought", product_name=product_name)),
+                         product_name,
+                         expiration_date)
+
+    def get_sold_quantity(self, product_name: str=''):
+        if product_name == '':
+            return sum(self.sold_quantities_per_name.values())
+        return self.sold_quantities_per_name.get(product_name, 0)
+
+    def get_totals(self,
+                   product_name: str='',
+                   start_date: str='',
+                   end_date: str=''):
+        totals = dict.fromkeys(rollup.ROLLUP_COLUMNS, 0)
+        for ledger, date_column, price_column, quantity_column, value_column in (
+                ("bought", "buy_date", "buy_price", "bought_quantity", "cost"),
+                ("sold", "sell_date", "sell_price", "sold_quantity", "revenue")):
+            for product in self.scan(ledger,
+                                     product_name=product_name,
+                                     date_column=date_column,
+                                     start_date=start_date,
+                                     end_date=end_date):
+                totals[quantity_column] += int(product['quantity'])
+                totals[value_column] += int(product['quantity']) * float(product[price_column])
+        return totals
+
+    def get_last_product_id(self):
+        if len(self.products["bought"]) > 0:
+            return int(self.products["bought"][-1]['id'])
+        return 0
+
+    def get_current_date(self):
+        return self.current_date
+
+    def set_current_date(self, new_date: str):
+        self.current_date = new_date
+        return True
+
+    def transaction(self):
+        return nullcontext()
+
+    def rebuild(self):
+        return True
+
+
+STORAGE_TYPES = {
+    "csv": CsvStorage,
+    "columnar": ColumnarStorage,
+    "sqlite": SqliteStorage,
+    "memory": MemoryStorage
+}
+
+# De opslag die bij de huidige config in gebruik is, zie get.
+active_storage = {"config": None, "storage": None}
+
+
+def get():
+    '''
+    Functie voor het ophalen van de opslag die in gebruik is. Zonder eerder
+    ingestelde opslag (zie set) wordt de opslag gebruikt die in de config
+    onder "storage" is opgegeven: "csv" (standaard), "columnar", "sqlite" of "memory".
+    '''
+    if active_storage["config"] is not config.data:
+        storage_type = config.data.get("storage", "csv")
+        active_storage["config"] = config.data
+        active_storage["storage"] = STORAGE_TYPES[storage_type]()
+    return active_storage["storage"]
+
+
+def set(storage):
+    '''
+    Functie voor het instellen van de opslag voor de huidige config, waarmee
+    ook een eigen implementatie met dezelfde functies als CsvStorage gebruikt kan worden.
+        storage = de opslag die gebruikt dient te worden
+    '''
+    active_storage["config"] = config.data
+    active_storage["storage"] = storage
@@ -1,6 +1,5 @@
-import datetime
-
 import superpy.config as config
+import superpy.dates as dates
 
 
 def price(price: float):
@@ -21,10 +20,7 @@ def date_format(date: str):
         date = de datum om te valideren volgens DATE_FORMAT
     '''
     try:
-        date_parts = len(date.split("-"))
-        date_format_parts = config.data["date_format"].split("-")
-        date_format = "-".join(date_format_parts[0:date_parts])
-        datetime.datetime.strptime(date, date_format)
+        dates.parse(date)
     except ValueError:
         print(f"ERROR: Invalid date format, use the '{config.data['date_format']}' format." )
         return False
@@ -39,8 +35,8 @@ def expiration_date(current_date: str,
         expiration_date = vervaldatum
     '''
     if date_format(current_date) and date_format(expiration_date):
-       parsed_current_date = datetime.datetime.strptime(current_date, config.data["date_format"])
-       parsed_expiration_date = datetime.datetime.strptime(expiration_date, config.data["date_format"])
+       parsed_current_date = dates.parse_date(current_date, config.data["date_format"])
+       parsed_expiration_date = dates.parse_date(expiration_date, config.data["date_format"])
        if parsed_expiration_date >= parsed_current_date:
            return True
        print("ERROR: Expiration date cannot be earlier then the superpy current date.")
@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import locale
+
+import superpy.config as config
+import superpy.io as io
+
+
+# Grootte (in bytes) van het logbestand waarboven een checkpoint wordt gemaakt.
+WAL_CHECKPOINT_SIZE = 1024 * 1024
+
+# Het begin van een bewerking van log_append, waarmee uit een onvolledige
+# regel het csv bestand en de grootte voor het toevoegen gelezen worden.
+APPEND_PREFIX = re.compile(rb'\{"op":"append","ledger":"(\w+)","marker":\{"size":(\d+),"check":"([0-9a-f]*)"\}')
+
+
+def get_wal_file():
+    '''
+    Functie voor het bepalen van het logbestand (write-ahead log) naast het
+    csv bestand met gekochte producten.
+    '''
+    return f'{config.data["files"]["bought"]}.wal'
+
+
+def get_size():
+    '''
+    Functie voor het ophalen van de grootte van het logbestand, 0 indien het niet bestaat.
+    '''
+    try:
+        return os.path.getsize(get_wal_file())
+    except OSError:
+        return 0
+
+
+def log(record: dict):
+    '''
+    Functie voor het toevoegen van een bewerking aan het logbestand. Iedere
+    bewerking is een json regel. Het logbestand wordt aan het einde van de
+    transactie naar schijf geschreven, zie CsvStorage.transaction.
+        record = de bewerking, zie log_append en log_date
+    '''
+    return io.append_bytes((json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8'),
+                           get_wal_file())
+
+
+def log_append(ledger: str, data: bytes):
+    '''
+    Functie voor het loggen van het toevoegen van regels aan een csv bestand,
+    voordat de regels aan het csv bestand worden toegevoegd.
+        ledger = 'bought' of 'sold'.
+        data = de regels zoals deze aan het csv bestand worden toegevoegd, zie io.format_csv_rows
+    '''
+    csv_file = config.data["files"][ledger]
+    return log({"op": "append",
+                "ledger": ledger,
+                "marker": io.get_csv_marker(csv_file),
+                "data": data.decode(locale.getpreferredencoding(False))})
+
+
+def log_date(current_date: str):
+    '''
+    Functie voor het loggen van het instellen van de huidige datum.
+        current_date = de nieuwe datum
+    '''
+    return log({"op": "date", "current_date": current_date})
+
+
+def read_lines():
+    '''
+    Functie voor het uitlezen van de regels van het logbestand.
+    Geeft een list met de volledige regels terug en de onvolledige laatste
+    regel, zoals een regel die tijdens een crash maar half is geschreven
+    (lege bytes indien de laatste regel volledig is).
+    '''
+    try:
+        with open(get_wal_file(), 'rb') as walfile:
+            lines = walfile.read().split(b'\n')
+    except FileNotFoundError:
+        return [], b''
+    return lines[:-1], lines[-1]
+
+
+def read_records():
+    '''
+    Functie voor het uitlezen van de bewerkingen uit het logbestand. Het lezen
+    stopt bij de eerste onvolledige regel.
+    Geeft een list met bewerkingen terug en de onvolledige regel, zie read_lines.
+    '''
+    lines, torn_line = read_lines()
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            return records, line
+    return records, torn_line
+
+
+def is_applied(record: dict):
+    '''
+    Functie voor het controleren of een bewerking in de csv bestanden of de huidige datum is verwerkt.
+        record = de bewerking, zie log_append en log_date
+    '''
+    if record.get("op") == "date":
+        return io.read_csv(config.data["files"]["current_date"]) == [{"current_date": record["current_date"]}]
+    csv_file = config.data["files"][record["ledger"]]
+    data = record["data"].encode(locale.getpreferredencoding(False))
+    if not io.is_csv_marker_valid(csv_file, record["marker"]) or not os.path.exists(csv_file):
+        return False
+    with open(csv_file, 'rb') as csvfile:
+        csvfile.seek(record["marker"]["size"])
+        return csvfile.read(len(data)) == data
+
+
+def needs_recovery():
+    '''
+    Functie voor het controleren of de csv bestanden of de huidige datum
+    hersteld dienen te worden. Omdat de bewerkingen in volgorde worden
+    uitgevoerd, wordt alleen de laatste bewerking per csv bestand en de
+    laatste datum gecontroleerd, het logbestand wordt daarvoor van achteren gelezen.
+    '''
+    lines, torn_line = read_lines()
+    if torn_line != b'':
+        return True
+    unchecked = ["bought", "sold", "date"]
+    for line in reversed(lines):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return True
+        key = record.get("ledger", "date")
+        if key not in unchecked:
+            continue
+        if not is_applied(record):
+            return True
+        unchecked.remove(key)
+        if len(unchecked) == 0:
+            break
+    return False
+
+
+def replay_append(record: dict):
+    '''
+    Functie voor het opnieuw toevoegen van regels die wel in het logbestand
+    staan maar (deels) ontbreken in het csv bestand. Regels die al in het csv
+    bestand staan worden overgeslagen, zodat een bewerking meerdere keren
+    afgespeeld kan worden.
+        record = de bewerking, zie log_append
+    '''
+    csv_file = config.data["files"][record["ledger"]]
+    if is_applied(record):
+        return True
+    if not io.is_csv_marker_valid(csv_file, record["marker"]):
+        print(f"WARNING: '{csv_file}' was changed after it was logged, skipping the logged rows.")
+        return False
+    data = record["data"].encode(locale.getpreferredencoding(False))
+    with open(csv_file, 'r+b' if os.path.exists(csv_file) else 'w+b') as csvfile:
+        csvfile.seek(record["marker"]["size"])
+        csvfile.truncate()
+        csvfile.write(data)
+    print(f"Recovered {len(data)} bytes of '{csv_file}' from the log.")
+    return True
+
+
+def remove_torn_append(torn_line: bytes):
+    '''
+    Functie voor het verwijderen van de regels van een bewerking waarvan de
+    regel in het logbestand onvolledig is. Alleen de bytes na de in het
+    logbestand vastgelegde grootte van het csv bestand worden verwijderd,
+    en alleen indien het csv bestand tot die grootte ongewijzigd is.
+        torn_line = de onvolledige regel, zie read_lines
+    '''
+    match = APPEND_PREFIX.match(torn_line)
+    if match is None or match.group(1).decode() not in ["bought", "sold"]:
+        return False
+    csv_file = config.data["files"][match.group(1).decode()]
+    marker = {"size": int(match.group(2)), "check": match.group(3).decode()}
+    if (len(marker["check"]) != 2 * min(64, marker["size"])
+        or not io.is_csv_marker_valid(csv_file, marker)
+        or os.path.getsize(csv_file) <= marker["size"]):
+        return False
+    with open(csv_file, 'r+b') as csvfile:
+        csvfile.truncate(marker["size"])
+    print(f"Removed the rows of an unfinished change from '{csv_file}'.")
+    return True
+
+
+def recover():
+    '''
+    Functie voor het herstellen van de csv bestanden en de huidige datum na
+    een crash of stroomstoring, aan de hand van de bewerkingen in het
+    logbestand sinds het laatste checkpoint. Dient binnen een transactie
+    te worden aangeroepen, zie CsvStorage.recover.
+    Geeft True terug indien er bewerkingen zijn afgespeeld en er daarna een checkpoint gemaakt dient te worden.
+    '''
+    if not needs_recovery():
+        return False
+    records, torn_line = read_records()
+    if torn_line != b'':
+        # Het logbestand is tijdens het schrijven afgebroken, de regels van
+        # die bewerking kunnen dan deels in het csv bestand staan.
+        remove_torn_append(torn_line)
+    current_date = None
+    for record in records:
+        if record.get("op") == "append":
+            replay_append(record)
+        elif record.get("op") == "date":
+            current_date = record["current_date"]
+    if current_date is not None and not is_applied({"op": "date", "current_date": current_date}):
+        io.write_csv({"current_date": current_date}, config.data["files"]["current_date"], append=False)
+    return True
+
+
+def checkpoint():
+    '''
+    Functie voor het maken van een checkpoint: de csv bestanden en de huidige
+    datum worden naar schijf geschreven, waarna het logbestand wordt
+    leeggemaakt. Dient binnen een transactie te worden aangeroepen, nadat de
+    afgeleide gegevens zijn bijgewerkt, zie CsvStorage.checkpoint.
+    '''
+    wal_file = get_wal_file()
+    if not io.sync_files([config.data["files"]["bought"],
+                          config.data["files"]["sold"],
+                          config.data["files"]["current_date"]]):
+        return False
+    if os.path.exists(wal_file):
+        with open(wal_file, 'r+b') as walfile:
+            walfile.truncate(0)
+            os.fsync(walfile.fileno())
+    return True
@@ -1,9 +1,16 @@
 import pytest
 import json
+import sys
+import subprocess
 import random
 import csv
+import os
+import time
+import threading
+import numpy as np
 
 from math import fsum
+from pathlib import Path
 from datetime import datetime
 from datetime import timedelta
 
@@ -14,6 +21,53 @@ import superpy.inventory as inventory
 import superpy.validate as validate
 import superpy.report as report
 import superpy.convert as convert
+import superpy.index as index
+import superpy.stock as stock
+import superpy.rollup as rollup
+import superpy.database as database
+import superpy.storage as storage
+import superpy.columnar as columnar
+import superpy.dates as dates
+import superpy.records as records
+import superpy.server as server
+import superpy.batch as batch
+import superpy.wal as wal
+import superpy.locking as locking
+
+
+SUPER_FILE = Path(__file__).parent.parent / "super.py"
+
+# Per commando het maximale aantal milliseconden voor het laden van de modules
+# (gemeten met 'python -X importtime') en de modules die niet geladen mogen worden.
+STARTUP_BUDGETS = [
+    (['date', '-gd'], 250, ['rich', 'matplotlib', 'numpy']),
+    (['buy', '-pn', 'apple', '-p', '0.5', '-ed', '2030-01-01'], 250, ['rich', 'matplotlib', 'numpy']),
+    (['sell', '-pn', 'apple', '-p', '1.0'], 250, ['rich', 'matplotlib', 'numpy']),
+    (['report', 'revenue', '--now'], 250, ['rich', 'matplotlib', 'numpy']),
+    (['report', 'inventory', '--now'], 400, ['matplotlib', 'numpy']),
+]
+
+
+def get_import_times(folder, argv):
+    '''
+    Functie voor het uitvoeren van super.py met 'python -X importtime' in een map met een config.json.
+    Geeft een dict terug met per geladen module de cumulatieve laadtijd in microseconden,
+    en het totaal van de modules die direct geladen worden onder 'total'.
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', str(SUPER_FILE)] + argv,
+                            cwd=folder,
+                            capture_output=True,
+                            text=True)
+    import_times = {'total': 0}
+    for line in result.stderr.splitlines():
+        columns = line.split('|')
+        if not line.startswith('import time:') or not columns[1].strip().isdigit():
+            continue
+        cumulative = int(columns[1])
+        import_times[columns[2].strip()] = cumulative
+        if not columns[2].startswith('  '):
+            import_times['total'] += cumulative
+    return import_times
 
 
 @pytest.fixture
@@ -52,6 +106,18 @@ def example_config(superpy_test_folder, example_config_data):
     return None
 
 
+@pytest.fixture
+def example_sqlite_config(superpy_test_folder, example_config_data):
+    example_config_data["storage"] = "sqlite"
+    example_config_data["files"]["database"] = f"{superpy_test_folder}\\test_superpy.db"
+    config_file = superpy_test_folder / "test_sqlite_config.json"
+    with open(config_file, "w") as outfile: 
+        json.dump(example_config_data, outfile)
+    if (config.init_config(config_file)):
+        return config.data
+    return None
+
+
 @pytest.fixture
 def example_dates(example_config):
     product_range = example_config["test"]["product_range"]
@@ -159,11 +225,72 @@ def test_io_write_csv(example_config, example_bought_products):
     assert csv_data[1:] == example_csv_data
 
 
+def test_io_write_csv_rows(example_config, example_bought_products):
+    csv_file = example_config["files"]["bought"]
+    assert io.write_csv_rows(rows=iter(example_bought_products[:10]), csv_file=csv_file)
+    assert io.write_csv_rows(rows=example_bought_products[10:], csv_file=csv_file)
+    assert io.read_csv(csv_file) == example_bought_products
+    
+    ''' Test overwriting the csv file. '''
+    assert io.write_csv_rows(rows=example_bought_products[:1], csv_file=csv_file, append=False)
+    assert io.read_csv(csv_file) == example_bought_products[:1]
+    
+    ''' Test with no rows. '''
+    assert io.write_csv_rows(rows=[], csv_file=csv_file)
+    assert io.read_csv(csv_file) == example_bought_products[:1]
+
+
 def test_io_read_csv(example_bought_products, example_bought_csv_file):
     csv_data = io.read_csv(example_bought_csv_file)
     assert csv_data == example_bought_products
 
 
+def test_io_iter_csv(example_bought_products, example_bought_csv_file):
+    csv_rows = io.iter_csv(example_bought_csv_file)
+    assert not isinstance(csv_rows, list)
+    assert next(csv_rows) == example_bought_products[0]
+    assert list(csv_rows) == example_bought_products[1:]
+    
+    ''' Test with a csv file that doesn't exist. '''
+    assert list(io.iter_csv(f'{example_bought_csv_file}.missing')) == []
+
+
+def test_io_read_last_csv_row(example_config, example_bought_products, example_bought_csv_file):
+    assert io.read_last_csv_row(example_bought_csv_file) == example_bought_products[-1]
+    
+    ''' Test with a block size smaller then a single row. '''
+    assert io.read_last_csv_row(example_bought_csv_file, block_size=3) == example_bought_products[-1]
+    
+    ''' Test with only a header and with a file that doesn't exist. '''
+    io.write_csv_rows(rows=example_bought_products[:1], csv_file=example_bought_csv_file, append=False)
+    assert io.read_last_csv_row(example_bought_csv_file) == example_bought_products[0]
+    header_file = f'{example_config["test"]["folder"]}\\test_header.csv'
+    with open(header_file, 'w') as f:
+        f.write(';'.join(example_bought_products[0].keys()) + '\n')
+    assert io.read_last_csv_row(header_file) == {}
+    assert io.read_last_csv_row(f'{header_file}.missing') == {}
+
+
+def test_io_sync_group(example_config, example_bought_products, monkeypatch):
+    csv_file = example_config["files"]["bought"]
+    sync_file = f'{csv_file}.sync'
+    synced_files = []
+    monkeypatch.setattr(os, 'fsync', lambda fd: synced_files.append(fd))
+    io.write_csv_rows(example_bought_products[:10], csv_file)
+    
+    ''' Test that written rows are synced once. '''
+    assert io.sync_group(sync_file, {csv_file: os.path.getsize(csv_file)})
+    assert len(synced_files) == 1
+    
+    ''' Test that rows synced by another transaction are not synced again. '''
+    first_size = os.path.getsize(csv_file)
+    io.write_csv_rows(example_bought_products[10:20], csv_file)
+    assert io.sync_group(sync_file, {csv_file: os.path.getsize(csv_file)})
+    assert io.sync_group(sync_file, {csv_file: first_size})
+    assert io.sync_group(sync_file, {csv_file: os.path.getsize(csv_file)})
+    assert len(synced_files) == 2
+
+
 def test_io_write_json(example_config, example_bought_products):
     json_file = f'{example_config["test"]["folder"]}\\test_export.json'
     write_result = io.write_json(product_list=example_bought_products, json_file=json_file)
@@ -209,6 +336,439 @@ def test_io_read_xml(example_config, example_bought_products):
     assert read_result == example_bought_products
     
 
+def test_index_find_offsets(example_config, example_bought_products, example_bought_csv_file, monkeypatch):
+    example_product = example_bought_products[0]
+    product_name = example_product["name"]
+    buy_month = example_product["buy_date"][0:7]
+    
+    ''' Test with a product name and a partial date. '''
+    offsets = index.find_offsets(example_bought_csv_file, {'name': product_name,
+                                                           'buy_date': buy_month})
+    example_products = [
+        product for product in example_bought_products if product['name'] == product_name
+        and product['buy_date'].startswith(buy_month)
+    ]
+    assert list(io.iter_csv_at(example_bought_csv_file, offsets)) == example_products
+    assert index.find_offsets(example_bought_csv_file, {'name': ''}) == None
+    
+    ''' Test with rows appended after the index was created. '''
+    new_product = example_product.copy()
+    new_product['id'] = str(len(example_bought_products) + 1)
+    io.write_csv(new_product, example_bought_csv_file)
+    offsets = index.find_offsets(example_bought_csv_file, {'name': product_name})
+    found_products = list(io.iter_csv_at(example_bought_csv_file, offsets))
+    assert found_products[-1] == new_product
+    
+    ''' Test that offsets of an interrupted update are removed when the index is written. '''
+    posting_file = index.get_posting_file(example_bought_csv_file, 'name', product_name)
+    with open(posting_file, 'ab') as postingfile:
+        postingfile.write((10 ** 9).to_bytes(8, 'little') + b'\x01\x02')
+    assert index.find_offsets(example_bought_csv_file, {'name': product_name}) == offsets
+    index.update(example_bought_csv_file)
+    assert io.flush_json_writes()
+    assert index.read_offsets(posting_file, 10 ** 10) == offsets
+    
+    ''' Test that a lookup only reads the offsets of the value. '''
+    io.json_cache.clear()
+    read_offsets = index.read_offsets
+    read_files = []
+    monkeypatch.setattr(index, 'read_offsets', lambda posting_file, size: read_files.append(posting_file) or read_offsets(posting_file, size))
+    assert index.find_offsets(example_bought_csv_file, {'name': product_name}) == offsets
+    assert read_files == [posting_file]
+    monkeypatch.undo()
+    
+    ''' Test with a rewritten csv file. '''
+    io.write_csv(new_product, example_bought_csv_file, append=False)
+    offsets = index.find_offsets(example_bought_csv_file, {'name': product_name})
+    assert list(io.iter_csv_at(example_bought_csv_file, offsets)) == [new_product]
+    
+    ''' Test with a range of expiration dates. '''
+    io.write_csv_rows(example_bought_products, example_bought_csv_file, append=False)
+    expiration_date = example_product["expiration_date"]
+    offsets = index.find_offsets_in_range(example_bought_csv_file, 'expiration_date', end=expiration_date)
+    example_products = [
+        product for product in example_bought_products if product['expiration_date'] <= expiration_date
+    ]
+    assert list(io.iter_csv_at(example_bought_csv_file, offsets)) == example_products
+
+
+def test_io_iter_csv_offsets(example_config, example_bought_products, example_bought_csv_file):
+    ''' Test reading rows at the offsets of a slice of rows. '''
+    offsets = [offset for offset, product in io.iter_csv_offsets(example_bought_csv_file)]
+    assert list(io.iter_csv_at(example_bought_csv_file, offsets[2:5])) == example_bought_products[2:5]
+    assert len(offsets) == len(example_bought_products)
+
+    ''' Test that only the appended tail is read. '''
+    new_product = example_bought_products[0].copy()
+    new_product['id'] = str(len(example_bought_products) + 1)
+    tail_offset = index.load(example_bought_csv_file)["marker"]["size"]
+    index_stat = os.stat(index.get_index_file(example_bought_csv_file))
+    io.write_csv(new_product, example_bought_csv_file)
+    assert list(io.iter_csv_offsets(example_bought_csv_file, tail_offset)) == [(tail_offset, new_product)]
+    assert index.find_offsets(example_bought_csv_file, {'name': new_product['name']})[-1] == tail_offset
+    assert os.stat(index.get_index_file(example_bought_csv_file)).st_mtime_ns == index_stat.st_mtime_ns
+
+
+def test_stock_load(example_config,
+                    example_bought_products,
+                    example_bought_csv_file,
+                    example_sold_products,
+                    example_sold_csv_file):
+    sold_quantities = {}
+    for sold_product in example_sold_products:
+        sold_quantities[sold_product['id']] = sold_quantities.get(sold_product['id'], 0) + int(sold_product['quantity'])
+    stock_data = stock.load()
+    lots = list(stock.iter_lots(stock_data))
+    assert [product for product, sold_quantity in lots] == [
+        product for product in example_bought_products if int(product['quantity']) > sold_quantities.get(product['id'], 0)
+    ]
+    for product, sold_quantity in lots:
+        assert sold_quantity == sold_quantities.get(product['id'], 0)
+    product_name = example_sold_products[0]['name']
+    assert stock.get_sold_quantity(stock_data, product_name) == sum([
+        int(product['quantity']) for product in example_sold_products if product['name'] == product_name
+    ])
+    
+    ''' Test with a product sold after the snapshot was created, without rewriting the snapshot. '''
+    product, sold_quantity = lots[0]
+    sold_product = {"id": product['id'],
+                    "name": product['name'],
+                    "sell_price": '1.0',
+                    "quantity": '1',
+                    "sell_date": product['buy_date']}
+    product_file = stock.get_product_file(stock_data["names"][product['name']]["key"])
+    with open(stock.get_stock_file(), 'rb') as stock_file, open(product_file, 'rb') as productfile:
+        snapshot = (stock_file.read(), productfile.read())
+    io.write_csv(sold_product, example_sold_csv_file)
+    new_stock_data = stock.load()
+    assert (product, sold_quantity + 1) in stock.iter_lots(new_stock_data, product['name'])
+    with open(stock.get_stock_file(), 'rb') as stock_file, open(product_file, 'rb') as productfile:
+        assert (stock_file.read(), productfile.read()) == snapshot
+    
+    ''' Test that a sold out product is removed from the snapshot. '''
+    sold_product['quantity'] = str(int(product['quantity']) - sold_quantity - 1)
+    io.write_csv(sold_product, example_sold_csv_file)
+    lots = list(stock.iter_lots(stock.load()))
+    assert product['id'] not in [lot_product['id'] for lot_product, sold_quantity in lots]
+    assert product['id'] not in [lot[0] for lot in stock.get_product(stock.load(), product['name'])["lots"]]
+    
+    ''' Test that the snapshot is written at a checkpoint and that only the file of the sold product is read. '''
+    assert io.flush_json_writes()
+    io.json_cache.clear()
+    stock_data = stock.load()
+    assert stock_data["products"] == {}
+    assert sorted(stock.iter_lots(stock_data, product['name']), key=lambda lot: int(lot[0]['id'])) == [
+        lot for lot in lots if lot[0]['name'] == product['name']
+    ]
+    assert list(stock_data["products"].keys()) == [product['name']]
+    assert list(stock.iter_lots(stock_data)) == lots
+    
+    ''' Test with a missing product file. '''
+    os.remove(product_file)
+    io.json_cache.clear()
+    assert list(stock.iter_lots(stock.load())) == lots
+    
+    ''' Test with a rewritten csv file. '''
+    io.write_csv(example_bought_products[0], example_bought_csv_file, append=False)
+    io.write_csv(sold_product, example_sold_csv_file, append=False)
+    assert [product for product, sold_quantity in stock.iter_lots(stock.load())] == example_bought_products[0:1]
+
+
+def test_rollup_get_totals(example_config,
+                           example_bought_products,
+                           example_bought_csv_file,
+                           example_sold_products,
+                           example_sold_csv_file):
+    example_product = example_sold_products[0]
+    product_name = example_product['name']
+    sell_month = example_product['sell_date'][0:7]
+    totals = rollup.get_totals(rollup.load(), product_name=product_name, product_date=sell_month)
+    example_sold = [
+        product for product in example_sold_products if product['name'] == product_name
+        and product['sell_date'].startswith(sell_month)
+    ]
+    example_bought = [
+        product for product in example_bought_products if product['name'] == product_name
+        and product['buy_date'].startswith(sell_month)
+    ]
+    assert totals['sold_quantity'] == sum([int(product['quantity']) for product in example_sold])
+    assert totals['bought_quantity'] == sum([int(product['quantity']) for product in example_bought])
+    assert round(totals['revenue'], 2) == round(sum([
+        int(product['quantity']) * float(product['sell_price']) for product in example_sold
+    ]), 2)
+    assert round(totals['cost'], 2) == round(sum([
+        int(product['quantity']) * float(product['buy_price']) for product in example_bought
+    ]), 2)
+    
+    ''' Test with a product sold after the totals were created. '''
+    io.write_csv(example_product, example_sold_csv_file)
+    rollup.update()
+    new_totals = rollup.get_totals(rollup.load(), product_name=product_name, product_date=sell_month)
+    assert new_totals['sold_quantity'] == totals['sold_quantity'] + int(example_product['quantity'])
+
+
+def test_database_storage(example_sqlite_config,
+                          example_bought_products,
+                          example_sold_products):
+    assert database.append_products("bought", example_bought_products)
+    assert database.append_products("sold", example_sold_products)
+    
+    ''' Test queries on the database. '''
+    example_product = example_sold_products[0]
+    product_name = example_product['name']
+    sell_date = example_product['sell_date']
+    bought_products, bought_quantity = inventory.get_bought_products()
+    assert bought_products == example_bought_products
+    sold_products, sold_quantity = inventory.get_sold_products(product_name=product_name, sell_date=sell_date[0:7])
+    assert sold_products == [
+        product for product in example_sold_products if product['name'] == product_name
+        and product['sell_date'].startswith(sell_date[0:7])
+    ]
+    assert inventory.get_product_revenue(sell_date=sell_date) == round(sum([
+        float(product['sell_price']) * int(product['quantity'])
+        for product in example_sold_products if product['sell_date'] == sell_date
+    ]), 2)
+    assert inventory.get_product_id() == int(example_bought_products[-1]['id']) + 1
+    
+    ''' Test current date and a sell on the database. '''
+    current_date.set(example_product['sell_date'])
+    assert current_date.get() == example_product['sell_date']
+    available_products, remaining_quantity = inventory.get_available_products(product_name=product_name,
+                                                                              product_date=sell_date)
+    if remaining_quantity > 0:
+        assert inventory.sell(product_name=product_name, price=1.0, quantity=remaining_quantity)
+    assert inventory.sell(product_name=product_name, price=1.0, quantity=1) == False
+    assert inventory.get_available_products(product_name=product_name,
+                                            product_date=sell_date)[1] <= 0
+
+
+def test_columnar_get_totals(example_config,
+                             example_bought_products,
+                             example_sold_products):
+    half = len(example_bought_products) // 2
+    assert inventory.append_products("bought", example_bought_products[:half])
+    assert inventory.append_products("sold", example_sold_products)
+    
+    ''' Test the conversion of the csv files to memory-mapped columns. '''
+    table, columns = columnar.load("bought")
+    assert table["rows"] == half
+    assert isinstance(columns['quantity'], np.memmap)
+    assert [table["names"][name_id] for name_id in columns['name']] == [
+        product['name'] for product in example_bought_products[:half]
+    ]
+    
+    ''' Test that appended products are appended to the columns, after an interrupted append. '''
+    with open(columnar.get_column_file(columnar.get_table_dir("bought"), 'id'), 'ab') as columnfile:
+        columnfile.write(b'interrupted')
+    assert inventory.append_products("bought", example_bought_products[half:])
+    table, columns = columnar.load("bought")
+    assert table["rows"] == len(example_bought_products)
+    assert list(columns['id']) == [int(product['id']) for product in example_bought_products]
+    
+    ''' Test the vectorized totals against the daily totals. '''
+    example_product = example_sold_products[0]
+    for product_name, start_date, end_date in (('', '', ''),
+                                               (example_product['name'], '', ''),
+                                               ('', example_product['sell_date'], example_product['sell_date']),
+                                               (example_product['name'], example_product['sell_date'][0:7], '')):
+        totals = columnar.get_totals(product_name=product_name, start_date=start_date, end_date=end_date)
+        expected_totals = rollup.get_range_totals(rollup.load(), product_name=product_name,
+                                                  start_date=start_date, end_date=end_date)
+        for column in rollup.ROLLUP_COLUMNS:
+            assert round(totals[column], 2) == round(expected_totals[column], 2)
+    assert columnar.get_sold_quantity(example_product['name']) == sum(
+        int(product['quantity']) for product in example_sold_products if product['name'] == example_product['name']
+    )
+
+
+def test_storage_concurrent_sell(superpy_test_folder, example_config_data, example_config):
+    with open(superpy_test_folder / "config.json", "w") as outfile:
+        json.dump(example_config_data, outfile)
+    current_date.set('2024-03-01')
+    assert inventory.buy(product_name='apple', price=0.5, expiration_date='2024-04-01', quantity=10)
+    
+    ''' Test that tills selling at the same time don't sell more than the stock. '''
+    sellers = [subprocess.Popen([sys.executable, str(SUPER_FILE), 'sell', '-pn', 'apple', '-p', '1.0', '-qt', '3'],
+                                cwd=superpy_test_folder,
+                                stdout=subprocess.PIPE,
+                                text=True)
+               for seller in range(6)]
+    outputs = [seller.communicate()[0] for seller in sellers]
+    assert sum('OK' in output.splitlines() for output in outputs) == 3
+    assert storage.get().get_sold_quantity('apple') == 9
+    assert len(io.read_csv(example_config["files"]["sold"])) == 3
+
+
+def test_storage_wal_recover(example_config, example_bought_products):
+    bought_file = example_config["files"]["bought"]
+    csv_storage = storage.get()
+    assert csv_storage.append("bought", example_bought_products[:10])
+    assert csv_storage.checkpoint()
+    assert wal.get_size() == 0
+    checkpoint_size = os.path.getsize(bought_file)
+    
+    ''' Test that rows and the date missing after a crash are replayed from the log tail. '''
+    assert csv_storage.append("bought", example_bought_products[10:20])
+    assert csv_storage.append("bought", example_bought_products[20:30])
+    assert csv_storage.set_current_date('2024-03-01')
+    with open(bought_file, 'r+b') as csvfile:
+        csvfile.truncate(checkpoint_size + 10)
+    io.write_csv({"current_date": '2024-02-01'}, example_config["files"]["current_date"], append=False)
+    recovered_storage = storage.CsvStorage()
+    assert io.read_csv(bought_file) == example_bought_products[:30]
+    assert recovered_storage.get_current_date() == '2024-03-01'
+    assert [product for product, sold in stock.iter_lots(stock.load())] == example_bought_products[:30]
+    assert wal.get_size() == 0
+    
+    ''' Test that the rows of an append with a torn log record are removed. '''
+    data = io.format_csv_rows(example_bought_products[30:32])
+    wal.log_append("bought", data)
+    with open(wal.get_wal_file(), 'r+b') as walfile:
+        walfile.truncate(wal.get_size() - 5)
+    with open(bought_file, 'ab') as csvfile:
+        csvfile.write(data[:-7])
+    storage.CsvStorage()
+    assert io.read_csv(bought_file) == example_bought_products[:30]
+    assert wal.get_size() == 0
+    
+    ''' Test that a last row without a newline is kept when another log record is torn. '''
+    with open(bought_file, 'ab') as csvfile:
+        csvfile.write(data.rstrip(b'\r\n'))
+    wal.log_date('2024-03-02')
+    with open(wal.get_wal_file(), 'r+b') as walfile:
+        walfile.truncate(wal.get_size() - 5)
+    storage.CsvStorage()
+    assert io.read_csv(bought_file) == example_bought_products[:32]
+    assert wal.get_size() == 0
+
+
+def test_storage_memory(superpy_test_folder,
+                        example_config,
+                        example_bought_products,
+                        example_sold_products):
+    storage.set(storage.MemoryStorage())
+    assert inventory.append_products("bought", example_bought_products)
+    assert inventory.append_products("sold", example_sold_products)
+    
+    ''' Test that the memory storage answers like the csv storage. '''
+    example_product = example_sold_products[0]
+    product_name = example_product['name']
+    sell_date = example_product['sell_date']
+    bought_products, bought_quantity = inventory.get_bought_products()
+    assert bought_products == example_bought_products
+    assert isinstance(storage.get(), storage.MemoryStorage)
+    assert list(storage.get().scan("sold", predicate=lambda product: product['name'] == product_name)) == [
+        product for product in example_sold_products if product['name'] == product_name
+    ]
+    assert inventory.get_product_revenue(sell_date=sell_date) == round(sum([
+        float(product['sell_price']) * int(product['quantity'])
+        for product in example_sold_products if product['sell_date'] == sell_date
+    ]), 2)
+    assert inventory.get_product_id() == int(example_bought_products[-1]['id']) + 1
+    current_date.set(sell_date)
+    assert current_date.get() == sell_date
+    
+    ''' Test that a new config selects the configured storage again. '''
+    config.init_config(superpy_test_folder / "test_config.json")
+    assert isinstance(storage.get(), storage.CsvStorage)
+
+
+def test_server_forward(example_config, example_bought_csv_file, superpy_test_folder, example_config_data, monkeypatch):
+    
+    ''' Test without a running server. '''
+    assert server.forward(['date', '-gd']) == None
+    assert server.read_socket_file(superpy_test_folder / "config.json") == None
+    
+    ''' Test with a running server. '''
+    monkeypatch.chdir(superpy_test_folder)
+    with open(superpy_test_folder / "config.json", "w") as outfile:
+        json.dump(example_config_data, outfile)
+    assert server.read_socket_file(superpy_test_folder / "config.json") == server.get_socket_file()
+    server_thread = threading.Thread(target=server.serve)
+    server_thread.start()
+    for attempt in range(50):
+        if server.is_running():
+            break
+        time.sleep(0.1)
+    assert server.forward(['date', '-sd', '2024-03-01']) == 'The new super.py date is "2024-03-01"\n'
+    assert current_date.get() == '2024-03-01'
+    assert server.forward(['chart', '-r']) == None
+    assert 'error' in server.forward(['buy'])
+    
+    ''' Test that super.py forwards a command before loading the rest of superpy. '''
+    import_times = get_import_times(superpy_test_folder, ['date', '-gd'])
+    assert 'superpy.server' in import_times
+    for module in ['superpy.args', 'superpy.inventory', 'superpy.storage', 'sqlite3']:
+        assert module not in import_times, f'{module} is loaded by a forwarded command'
+    
+    ''' Test that the inventory snapshot is kept in memory until the server stops. '''
+    server.forward(['report', 'inventory', '--now'])
+    assert not os.path.exists(stock.get_stock_file())
+    assert server.stop()
+    server_thread.join(timeout=5)
+    assert not server_thread.is_alive()
+    assert not server.is_running()
+    assert os.path.exists(stock.get_stock_file())
+    assert not io.deferred_json["active"]
+
+
+def test_batch_run_lines(example_config, capsys, monkeypatch):
+    current_date.set('2024-03-01')
+    monkeypatch.setattr(batch, 'BATCH_TRANSACTION_SIZE', 2)
+    lock_file = storage.get().get_lock_file()
+    batch_lines = [
+        'buy -pn apple -p 0.5 -qt 10 -ed 2024-04-01',
+        '# Een regel met commentaar.',
+        '',
+        '["sell", "-pn", "apple", "-p", "1.25", "-qt", "4"]',
+        'date -ad 1',
+        'server --start',
+        'buy -pn "red apple"',
+    ]
+
+    ''' Test that the json files are only written at the end of the batch and that the lock is released between transactions. '''
+    stock_file = stock.get_stock_file()
+    def iter_lines():
+        for line in batch_lines:
+            assert not os.path.exists(stock_file)
+            assert locking.held_locks.get(lock_file, {"depth": 0})["depth"] == 0
+            yield line
+    assert not batch.run_lines(iter_lines())
+    assert not io.deferred_json["active"]
+    assert os.path.exists(stock_file)
+    output = capsys.readouterr().out
+    assert 'ERROR: Line 6: The "server" command is not supported in a batch.' in output
+    assert 'ERROR: Line 7: Invalid command.' in output
+    assert 'Batch finished: 3 commands executed, 2 failed.' in output
+    assert current_date.get() == '2024-03-02'
+    assert list(storage.get().iter_lots('apple'))[0][1] == 4
+    assert inventory.get_product_revenue(sell_date='2024-03-01') == 5.0
+
+    ''' Test flushing after a number of commands. '''
+    assert batch.run_lines(['date -ad 1', 'date -ad 1', 'date -ad 1'], flush_every=2)
+    assert io.read_csv(example_config["files"]["current_date"])[0]["current_date"] == '2024-03-05'
+
+
+def test_startup_imports(superpy_test_folder, example_config_data):
+    with open(superpy_test_folder / "config.json", "w") as outfile:
+        json.dump(example_config_data, outfile)
+    for argv, budget, excluded_modules in STARTUP_BUDGETS:
+        import_times = get_import_times(superpy_test_folder, argv)
+        assert 'superpy.args' in import_times
+        for module in excluded_modules:
+            assert module not in import_times, f'{module} is loaded by {" ".join(argv)}'
+
+
+@pytest.mark.skipif(os.environ.get('SUPERPY_STARTUP_BUDGETS') != '1',
+                    reason='set SUPERPY_STARTUP_BUDGETS=1 to check the startup time budgets')
+def test_startup_import_time(superpy_test_folder, example_config_data):
+    with open(superpy_test_folder / "config.json", "w") as outfile:
+        json.dump(example_config_data, outfile)
+    for argv, budget, excluded_modules in STARTUP_BUDGETS:
+        import_times = get_import_times(superpy_test_folder, argv)
+        assert import_times['total'] / 1000 < budget, f'{" ".join(argv)} exceeds its startup budget'
+
+
 def test_validate_date_format(example_config):
     date_format = example_config["date_format"]
     example_date = datetime.now().strftime(example_config["date_format"])
@@ -271,6 +831,24 @@ def test_current_date_advance(example_config):
     assert reduced_date == example_date
 
 
+def test_current_date_memory_clock(example_config):
+    current_date_file = example_config["files"]["current_date"]
+    example_date = current_date.get()
+
+    ''' Test that the memory clock doesn't write until committed. '''
+    current_date.start_memory_clock()
+    advanced_date = current_date.advance(3)
+    assert current_date.get() == advanced_date
+    assert io.read_csv(current_date_file)[0]["current_date"] == example_date
+    current_date.commit()
+    assert io.read_csv(current_date_file)[0]["current_date"] == advanced_date
+
+    ''' Test that a change to the file is picked up by the cached date. '''
+    io.write_csv({"current_date": "2024-08-25"}, current_date_file, append=False)
+    os.utime(current_date_file, ns=(0, 0))
+    assert current_date.get() == "2024-08-25"
+
+
 def test_current_date_reset(example_config, superpy_test_folder):
     current_date_file = superpy_test_folder / "test_current_date.csv"
     past_date = "2023-08-25"
@@ -282,6 +860,24 @@ def test_current_date_reset(example_config, superpy_test_folder):
     assert current_date_now == new_date_to_test 
 
 
+def test_dates_parse(example_config):
+    date_format = example_config["date_format"]
+    ''' Test the ISO fast path against strptime. '''
+    assert dates.parse("2024-02-29") == datetime.strptime("2024-02-29", date_format)
+    assert dates.parse_date("24/02/29", "%y/%m/%d") == datetime(2024, 2, 29)
+    ''' Test partial dates. '''
+    assert dates.parse("2024-03") == datetime(2024, 3, 1)
+    assert dates.parse("2024") == datetime(2024, 1, 1)
+    assert dates.get_ordinal("2024-03-02") - dates.get_ordinal("2024-03") == 1
+    ''' Test invalid dates. '''
+    with pytest.raises(ValueError):
+        dates.parse("2024-02-30")
+    ''' Test that repeated dates are memoized. '''
+    hits = dates.parse_partial_date.cache_info().hits
+    dates.parse("2024-02-29")
+    assert dates.parse_partial_date.cache_info().hits == hits + 1
+
+
 def test_convert_string_to_number():
     ''' Test convert to string '''
     assert convert.string_to_number('test') == 'test'
@@ -392,6 +988,27 @@ def test_inventory_filter_product_list(example_config,
     assert available_products == example_products
 
 
+def test_inventory_compile_filters(example_config,
+                                   example_bought_products):
+    ''' Test with no filters or empty filters. '''
+    assert inventory.compile_filters([]) == None
+    assert inventory.compile_filters(['name==', 'buy_date<=']) == None
+    
+    ''' Test with multiple filters in a single predicate. '''
+    example_product = example_bought_products[0]
+    product_name = example_product["name"]
+    product_month = example_product["buy_date"][0:7]
+    predicate = inventory.compile_filters([f'name=={product_name}',
+                                           f'buy_date<={product_month}',
+                                           'quantity>>5'])
+    example_products = [
+        product for product in example_bought_products if product['name'] == product_name
+        and product['buy_date'][0:7] <= product_month
+        and int(product['quantity']) > 5
+    ]
+    assert [product for product in example_bought_products if predicate(product)] == example_products
+
+
 def test_inventory_get_bought_products(example_config, 
                                        example_bought_csv_file,
                                        example_bought_products):
@@ -554,32 +1171,67 @@ def test_inventory_buy(example_config,
     assert buy_result == False
 
 
+def test_inventory_get_sold_quantity_per_product(example_config,
+                                                 example_sold_csv_file,
+                                                 example_sold_products):
+    sell_date = example_sold_products[0]['sell_date']
+    example_quantities = {}
+    for product in example_sold_products:
+        if product['sell_date'] <= sell_date:
+            example_quantities[product['id']] = example_quantities.get(product['id'], 0) + int(product['quantity'])
+    sold_quantities = inventory.get_sold_quantity_per_product(filters=[f'sell_date<={sell_date}'])
+    assert sold_quantities == example_quantities
+
+
+def test_inventory_get_expired_products(example_config,
+                                        example_bought_csv_file,
+                                        example_bought_products,
+                                        example_sold_csv_file,
+                                        example_sold_products):
+    expiration_date = example_bought_products[0]['expiration_date']
+    example_products = []
+    for product in example_bought_products:
+        if product['expiration_date'] == expiration_date:
+            sold_quantity = sum([
+                int(sold_product['quantity']) for sold_product in example_sold_products
+                if sold_product['id'] == product['id'] and sold_product['sell_date'] <= expiration_date
+            ])
+            if int(product['quantity']) > sold_quantity:
+                example_product = product.copy()
+                example_product['quantity'] = str(int(product['quantity']) - sold_quantity)
+                example_products.append(example_product)
+    if len(example_products) == 0:
+        example_products = [dict.fromkeys(inventory.CSV_BOUGHT_HEADER, '0')]
+    expired_products = inventory.get_expired_products(product_date=expiration_date)
+    assert expired_products == example_products
+
+
 def test_inventory_create_product_to_sell(example_config,
                                           example_bought_products):
     ''' Test with enough available products. '''
-    available_product = example_bought_products[0]
-    sell_price = float(available_product['buy_price']) * 2
-    sell_quantity = int(available_product['quantity']) - 1
+    available_product = records.BoughtLot.from_product(example_bought_products[0])
+    sell_price = available_product.buy_price * 2
+    sell_quantity = available_product.quantity - 1
     sell_date = datetime.now().strftime(example_config["date_format"])
     product_to_sell = inventory.create_product_to_sell(available_product=available_product,
                                                        sell_price=sell_price,
                                                        sell_quantity=sell_quantity,
                                                        sell_date=sell_date)
     sold_product = {}
-    sold_product["id"] = available_product["id"]
-    sold_product["name"] = available_product["name"]
+    sold_product["id"] = available_product.id
+    sold_product["name"] = available_product.name
     sold_product["sell_price"] = sell_price
     sold_product["quantity"] = sell_quantity
     sold_product['sell_date'] = sell_date
     assert product_to_sell == sold_product
     
     ''' Test with not enough available products. '''
-    sell_quantity = int(available_product['quantity']) + 1
+    sell_quantity = available_product.quantity + 1
     product_to_sell = inventory.create_product_to_sell(available_product=available_product,
                                                        sell_price=sell_price,
                                                        sell_quantity=sell_quantity,
                                                        sell_date=sell_date)
-    sold_product["quantity"] = int(available_product['quantity'])
+    sold_product["quantity"] = available_product.quantity
     assert product_to_sell == sold_product
 
 
@@ -589,7 +1241,8 @@ def test_inventory_create_products_to_sell(example_config,
     available_product_1 = example_bought_products[0].copy()
     available_product_2 = example_bought_products[0].copy()
     available_product_2['id'] = str(int(available_product_1['id']) + 1)
-    available_products = [available_product_1, available_product_2]
+    available_products = [records.BoughtLot.from_product(available_product_1),
+                          records.BoughtLot.from_product(available_product_2)]
     sell_price = float(available_product_1['buy_price']) * 2
     sell_quantity = (int(available_product_1['quantity']) * 2) - 1
     sell_date = datetime.now().strftime(example_config["date_format"])
@@ -598,13 +1251,13 @@ def test_inventory_create_products_to_sell(example_config,
                                                          sell_quantity=sell_quantity,
                                                          sell_date=sell_date)
     sold_product_1 = {}
-    sold_product_1["id"] = available_product_1["id"]
+    sold_product_1["id"] = int(available_product_1["id"])
     sold_product_1["name"] = available_product_1["name"]
     sold_product_1["sell_price"] = sell_price
     sold_product_1["quantity"] = int(available_product_1["quantity"])
     sold_product_1['sell_date'] = sell_date
     sold_product_2 = sold_product_1.copy()
-    sold_product_2["id"] = available_product_2["id"]
+    sold_product_2["id"] = int(available_product_2["id"])
     sold_product_2["quantity"] = int(available_product_1["quantity"]) - 1
     sold_products = [sold_product_1, sold_product_2]
     assert products_to_sell == sold_products
@@ -620,6 +1273,62 @@ def test_inventory_create_products_to_sell(example_config,
     assert products_to_sell == sold_products
 
 
+def test_records_bought_lot(example_bought_products):
+    example_product = example_bought_products[0]
+    lot = records.BoughtLot.from_product(example_product)
+    assert lot.quantity == int(example_product['quantity'])
+    assert lot.buy_price == float(example_product['buy_price'])
+    assert lot.to_product() == example_product
+    ''' Test selling from typed records. '''
+    products_to_sell = inventory.create_products_to_sell(available_products=[lot],
+                                                         sell_price=1.0,
+                                                         sell_quantity=lot.quantity,
+                                                         sell_date=lot.buy_date)
+    assert products_to_sell == [dict(zip(inventory.CSV_SOLD_HEADER,
+                                         [lot.id, lot.name, 1.0, lot.quantity, lot.buy_date]))]
+
+
+def test_inventory_get_available_lots(example_config,
+                                      example_bought_csv_file,
+                                      example_sold_csv_file):
+    product_date = datetime.now().strftime(example_config["date_format"])
+    available_lots, remaining_quantity = inventory.get_available_lots(product_date=product_date)
+    available_products, available_quantity = inventory.get_available_products(product_date=product_date)
+    assert remaining_quantity == available_quantity
+    if remaining_quantity > 0:
+        assert [lot.to_product() for lot in available_lots] == available_products
+
+
+def test_storage_iter_lots(example_config):
+    bought_products = [
+        {"id": "1", "name": "apple", "buy_price": "0.5", "quantity": "5", "buy_date": "2024-03-01", "expiration_date": "2024-03-20"},
+        {"id": "2", "name": "apple", "buy_price": "0.5", "quantity": "5", "buy_date": "2024-03-01", "expiration_date": "2024-03-10"},
+        {"id": "3", "name": "apple", "buy_price": "0.5", "quantity": "5", "buy_date": "2024-03-01", "expiration_date": "2024-03-20"},
+        {"id": "4", "name": "pear", "buy_price": "0.5", "quantity": "5", "buy_date": "2024-03-01", "expiration_date": "2024-03-01"},
+        {"id": "5", "name": "apple", "buy_price": "0.5", "quantity": "5", "buy_date": "2024-03-01", "expiration_date": "2024-03-05"},
+    ]
+    sold_product = {"id": "5", "name": "apple", "sell_price": "1.0", "quantity": "5", "sell_date": "2024-03-02"}
+    for test_storage in [storage.CsvStorage(), storage.MemoryStorage()]:
+        storage.set(test_storage)
+        assert test_storage.append("bought", bought_products)
+        
+        ''' Test that the lots of a product are ordered by expiration date, in buy order for the same date. '''
+        assert [product['id'] for product, sold in test_storage.iter_lots('apple')] == ['5', '2', '1', '3']
+        
+        ''' Test that lots that expire before the date are skipped. '''
+        expiration_date = dates.get_ordinal('2024-03-10')
+        assert [product['id'] for product, sold in test_storage.iter_lots('apple', expiration_date)] == ['2', '1', '3']
+        assert [product['id'] for product, sold in test_storage.iter_lots('', expiration_date)] == ['1', '2', '3']
+        
+        ''' Test that a sale takes the lot that expires first. '''
+        assert inventory.create_products_to_sell(inventory.get_available_lots('apple', '2024-03-02')[0], 1.0, 7, '2024-03-02') == [
+            {"id": 5, "name": "apple", "sell_price": 1.0, "quantity": 5, "sell_date": '2024-03-02'},
+            {"id": 2, "name": "apple", "sell_price": 1.0, "quantity": 2, "sell_date": '2024-03-02'},
+        ]
+        assert test_storage.append("sold", [sold_product])
+        assert [lot.id for lot in inventory.get_available_lots('apple', '2024-03-02')[0]] == [2, 1, 3]
+
+
 def test_inventory_sell(example_config,
                         example_bought_csv_file,
                         example_bought_products,
@@ -686,6 +1395,46 @@ def test_inventory_sell(example_config,
     assert sell_result == False
 
 
+def test_inventory_get_product_totals(example_config,
+                                      example_bought_csv_file,
+                                      example_bought_products,
+                                      example_sold_csv_file,
+                                      example_sold_products):
+    sell_dates = sorted([product['sell_date'] for product in example_sold_products])
+    start_date = sell_dates[len(sell_dates) // 4]
+    end_date = sell_dates[-(len(sell_dates) // 4)]
+    example_revenue = round(sum([
+        float(product['sell_price']) * int(product['quantity'])
+        for product in example_sold_products if start_date <= product['sell_date'] <= end_date
+    ]), 2)
+    example_cost = round(sum([
+        float(product['buy_price']) * int(product['quantity'])
+        for product in example_bought_products if start_date <= product['buy_date'] <= end_date
+    ]), 2)
+    totals = inventory.get_product_totals(start_date=start_date, end_date=end_date)
+    assert totals['revenue'] == example_revenue
+    assert totals['cost'] == example_cost
+    assert totals['profit'] == round(example_revenue - example_cost, 2)
+    
+    ''' Test with an open range. '''
+    totals = inventory.get_product_totals(end_date=end_date)
+    assert totals['sold_quantity'] == sum([
+        int(product['quantity']) for product in example_sold_products if product['sell_date'] <= end_date
+    ])
+    
+    ''' Test sold products within the range. '''
+    product_name = example_sold_products[0]['name']
+    sold_products, sold_quantity = inventory.get_sold_products_in_range(product_name=product_name,
+                                                                        start_date=start_date,
+                                                                        end_date=end_date)
+    example_products = [
+        product for product in example_sold_products if product['name'] == product_name
+        and start_date <= product['sell_date'] <= end_date
+    ]
+    assert sold_products == example_products
+    assert sold_quantity == sum([int(product['quantity']) for product in example_products])
+
+
 def test_inventory_import(example_config,
                           example_bought_products):
     ''' Test voor import producten uit csv. '''
@@ -727,6 +1476,29 @@ def test_inventory_import(example_config,
     assert new_last_product_id == last_product_id
 
 
+def test_inventory_validate_import_products(example_config,
+                                            example_bought_products):
+    ''' Test with valid products. '''
+    new_products, errors = inventory.validate_import_products(products=example_bought_products,
+                                                              product_id=10)
+    assert errors == []
+    assert [product['id'] for product in new_products] == list(range(10, 10 + len(example_bought_products)))
+    assert [product['name'] for product in new_products] == [product['name'] for product in example_bought_products]
+    
+    ''' Test with invalid products. '''
+    invalid_products = [product.copy() for product in example_bought_products[:4]]
+    invalid_products[0]['buy_price'] = '-1.0'
+    invalid_products[1]['quantity'] = '0'
+    invalid_products[2]['expiration_date'] = '2018-01-01'
+    invalid_products[3].pop('name')
+    products = invalid_products + example_bought_products[4:6]
+    new_products, errors = inventory.validate_import_products(products=products,
+                                                              product_id=1)
+    assert len(errors) == 4
+    assert errors[0].startswith('Product 1:')
+    assert [product['id'] for product in new_products] == [1, 2]
+
+
 def test_inventory_export(example_config,
                           example_bought_csv_file,
                           example_bought_products):
@@ -946,6 +1718,30 @@ def test_report_format_header():
     assert example_header == test_header
 
 
+def test_report_get_daily_chart_values(example_config,
+                                       example_bought_products):
+    start_date = min([product['buy_date'] for product in example_bought_products])
+    end_date = max([product['buy_date'] for product in example_bought_products])
+    end_date = (datetime.strptime(end_date, example_config["date_format"]) + timedelta(days=2)).strftime(example_config["date_format"])
+    daily_values = report.get_daily_chart_values(chart_type='cost',
+                                                 products=example_bought_products,
+                                                 start_date=start_date,
+                                                 end_date=end_date)
+    example_values = {}
+    example_date = datetime.strptime(start_date, example_config["date_format"])
+    while example_date.strftime(example_config["date_format"]) <= end_date:
+        value_date = example_date.strftime(example_config["date_format"])
+        example_values[value_date] = round(sum([
+            int(product['quantity']) * float(product['buy_price'])
+            for product in example_bought_products if product['buy_date'] == value_date
+        ]), 2)
+        example_date += timedelta(days=1)
+    assert list(daily_values.keys()) == list(example_values.keys())
+    for value_date, value in example_values.items():
+        assert daily_values[value_date] == pytest.approx(value, abs=0.011)
+    assert daily_values[end_date] == 0.0
+
+
 def test_report_product_table(example_bought_products, capsys):
     
     ''' Test met alle kolommen actief. '''    